@@ -0,0 +1,299 @@
+"""
+Archives of many games in one file.
+
+An archive is an 8 byte header followed by binary saves (see engine.BINARY_FORMAT) of 69 bytes each, so game k starts
+at a known offset and is read through mmap without copying. New games are appended to the end of the file.
+
+Examples:
+    python archive.py pack games.kla saves/ Game1-start.txt
+    python archive.py unpack games.kla saves/
+    python archive.py show games.kla 12
+"""
+import argparse
+import mmap
+import os
+import struct
+
+from board import Board
+from engine import BINARY_FORMAT, BINARY_EXTENSION, parseBinary, readSave, saveBinary, saveText
+
+ARCHIVE_EXTENSION = '.kla'
+ARCHIVE_MAGIC = b'KLA'
+ARCHIVE_VERSION = 1
+
+# Magic, version and the size of each record
+HEADER_FORMAT = struct.Struct('<3sBI')
+RECORD_SIZE = BINARY_FORMAT.size
+
+
+class Archive:
+    def __init__(self, fileName, create=True):
+        """
+
+        Opens an archive, creating it if it does not exist.
+
+        :param:
+            fileName (str): Name of archive
+            create (bool): Create the archive if it does not exist, otherwise the file must exist
+
+        """
+        if create and not os.path.exists(fileName):
+            with open(fileName, 'wb') as newArchive:
+                newArchive.write(HEADER_FORMAT.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, RECORD_SIZE))
+
+        self.__file = open(fileName, 'r+b')
+        header = self.__file.read(HEADER_FORMAT.size)
+        if len(header) != HEADER_FORMAT.size or HEADER_FORMAT.unpack(header) != (ARCHIVE_MAGIC, ARCHIVE_VERSION,
+                                                                                  RECORD_SIZE):
+            self.__file.close()
+            raise ValueError('Not a game archive!')
+
+        # Records cut short by an interrupted append are ignored, and written over by the next one
+        size = os.fstat(self.__file.fileno()).st_size
+        self.__count = (size - HEADER_FORMAT.size) // RECORD_SIZE
+        self.__map = None
+        self.__view = None
+        self.__mapped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.__count
+
+    def close(self):
+        """
+
+        Closes the archive. Records returned by record stay readable until they are released.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__view = None
+        self.__map = None
+        self.__file.close()
+
+    def __remap(self):
+        """
+
+        Maps the whole file, after games were appended past the end of the current map.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__file.flush()
+        # The old map is closed when the last record still pointing into it is released
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__map)
+        self.__mapped = self.__count
+
+    def record(self, index):
+        """
+
+        Returns the binary save of a game, as a view into the mapped file.
+
+        :param:
+            index (int): Number of game, from 0
+
+        :return:
+            record (memoryview): RECORD_SIZE bytes, as saveBinary returns them
+
+        """
+        if index < 0:
+            index += self.__count
+        if not 0 <= index < self.__count:
+            raise IndexError('There is no game %d in the archive!' % index)
+        if index >= self.__mapped:
+            self.__remap()
+
+        start = HEADER_FORMAT.size + index * RECORD_SIZE
+        return self.__view[start:start + RECORD_SIZE]
+
+    def board(self, index):
+        """
+
+        Returns the board of a game.
+
+        :param:
+            index (int): Number of game, from 0
+
+        :return:
+            board (Board): Board of game
+
+        """
+        board = Board()
+        for pile, slots in parseBinary(self.record(index)):
+            board.pushMany(pile, slots)
+        return board
+
+    def records(self):
+        """
+
+        Yields the binary save of every game in order. Pages of the file are read as they are reached.
+
+        :param:
+            None
+
+        :return:
+            records (generator): Records as memoryviews
+        """
+        for index in range(self.__count):
+            yield self.record(index)
+
+    def boards(self):
+        """
+
+        Yields the board of every game in order.
+
+        :param:
+            None
+
+        :return:
+            boards (generator): Boards of games
+        """
+        for index in range(self.__count):
+            yield self.board(index)
+
+    def append(self, board):
+        """
+
+        Adds a game to the end of the archive.
+
+        :param:
+            board (Board): Board of game, with at most 52 cards
+
+        :return:
+            index (int): Number of the new game
+
+        """
+        return self.appendRecord(saveBinary(board))
+
+    def appendRecord(self, record):
+        """
+
+        Adds a binary save to the end of the archive.
+
+        :param:
+            record (bytes): Binary save, as saveBinary returns it
+
+        :return:
+            index (int): Number of the new game
+
+        """
+        parseBinary(record)
+        self.__file.seek(HEADER_FORMAT.size + self.__count * RECORD_SIZE)
+        self.__file.write(record)
+        self.__count += 1
+        return self.__count - 1
+
+
+def saveFiles(path):
+    """
+
+    Returns the save files named by a path: the file itself, or every save file under a directory, in name order.
+
+    :param:
+        path (str): Name of save file or directory
+
+    :return:
+        fileNames (list): Names of save files
+    """
+    if not os.path.isdir(path):
+        return [path]
+
+    fileNames = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fileName in sorted(files):
+            if fileName.endswith(('.txt', BINARY_EXTENSION)):
+                fileNames.append(os.path.join(root, fileName))
+    return fileNames
+
+
+def packSaves(archiveName, paths):
+    """
+
+    Appends save files, text or binary, to an archive.
+
+    :param:
+        archiveName (str): Name of archive
+        paths (list): Names of save files and directories of save files
+
+    :return:
+        count (int): Number of games added
+    """
+    count = 0
+    with Archive(archiveName) as archive:
+        for path in paths:
+            for fileName in saveFiles(path):
+                board = Board()
+                for pile, slots in readSave(fileName):
+                    board.pushMany(pile, slots)
+                archive.append(board)
+                count += 1
+    return count
+
+
+def unpackSaves(archiveName, directory, binary=False):
+    """
+
+    Writes every game of an archive to its own save file, named game-000000.txt and so on.
+
+    :param:
+        archiveName (str): Name of archive
+        directory (str): Directory to write save files to, created if it does not exist
+        binary (bool): Write binary saves instead of text
+
+    :return:
+        count (int): Number of games written
+    """
+    os.makedirs(directory, exist_ok=True)
+    with Archive(archiveName, create=False) as archive:
+        for index in range(len(archive)):
+            fileName = os.path.join(directory, 'game-%06d' % index)
+            if binary:
+                with open(fileName + BINARY_EXTENSION, 'wb') as newGame:
+                    newGame.write(archive.record(index))
+            else:
+                with open(fileName + '.txt', 'w') as newGame:
+                    newGame.write(saveText(archive.board(index)))
+        return len(archive)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack save files into a game archive, or unpack them again.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help='append save files to an archive')
+    pack.add_argument('archive', help='archive to append to, created if needed')
+    pack.add_argument('paths', nargs='+', help='save files, or directories of save files')
+    unpack = commands.add_parser('unpack', help='write every game of an archive to a save file')
+    unpack.add_argument('archive', help='archive to read')
+    unpack.add_argument('directory', help='directory to write save files to')
+    unpack.add_argument('--binary', action='store_true', help='write .klb files instead of .txt')
+    show = commands.add_parser('show', help='print one game of an archive as a text save')
+    show.add_argument('archive', help='archive to read')
+    show.add_argument('index', type=int, help='number of game, from 0')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        print('%d games added to %s' % (packSaves(args.archive, args.paths), args.archive))
+    elif args.command == 'unpack':
+        print('%d games written to %s' % (unpackSaves(args.archive, args.directory, args.binary), args.directory))
+    else:
+        with Archive(args.archive, create=False) as archive:
+            print(saveText(archive.board(args.index)), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Batch solver for deal corpora.
+
+Solves every save file in a directory or archive (.zip, .tar, .tar.gz), or a range of numbered deals, across all cores
+with a process pool. Each result is written to a JSON lines file as soon as its worker finishes, and the results file is
+also the checkpoint: running the same command again skips every position it already holds.
+
+Examples:
+    python batchsolve.py saves/ results.jsonl --time 5
+    python batchsolve.py --deals 0:10000 deals.jsonl --workers 8
+    python batchsolve.py --deals 0:200 scaling.jsonl --scaling
+    python batchsolve.py --deals 0:10000 deals.jsonl --cache results.db
+"""
+import argparse
+import json
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from board import Board
+from deals import dealNumber
+from engine import parseSave, parseBinary, readSave, ERROR_MESSAGES, BINARY_EXTENSION, BAD_SAVE_FORMAT, \
+    FILE_NOT_FOUND
+from solver import solve
+from solvecache import SolveCache
+
+# Solve caches opened by this process, by file name. Each worker opens its own, since connections can not be shared
+# between processes.
+_caches = {}
+
+
+def directoryTasks(path):
+    """
+
+    Returns a task for every save file in a directory and its subdirectories.
+
+    :param:
+        path (str): Name of directory
+
+    :return:
+        tasks (list): Tasks as (id, kind, payload)
+    """
+    tasks = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fileName in sorted(files):
+            if fileName.endswith(('.txt', BINARY_EXTENSION)):
+                fullName = os.path.join(root, fileName)
+                tasks.append((os.path.relpath(fullName, path), 'file', fullName))
+    return tasks
+
+
+def archiveTasks(path):
+    """
+
+    Returns a task for every save file in a zip or tar archive. The files are read here, so workers get their contents.
+
+    :param:
+        path (str): Name of archive
+
+    :return:
+        tasks (list): Tasks as (id, kind, payload)
+    """
+    tasks = []
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.endswith('.txt'):
+                    tasks.append((name, 'text', archive.read(name).decode()))
+                elif name.endswith(BINARY_EXTENSION):
+                    tasks.append((name, 'binary', archive.read(name)))
+    else:
+        with tarfile.open(path) as archive:
+            for member in sorted(archive.getmembers(), key=lambda member: member.name):
+                if member.isfile() and member.name.endswith('.txt'):
+                    tasks.append((member.name, 'text', archive.extractfile(member).read().decode()))
+                elif member.isfile() and member.name.endswith(BINARY_EXTENSION):
+                    tasks.append((member.name, 'binary', archive.extractfile(member).read()))
+    return tasks
+
+
+def dealTasks(first, last):
+    """
+
+    Returns a task for every numbered deal in a range.
+
+    :param:
+        first (int): First deal number
+        last (int): Deal number after the last one
+
+    :return:
+        tasks (list): Tasks as (id, kind, payload)
+    """
+    return [('deal:%d' % number, 'deal', number) for number in range(first, last)]
+
+
+def solveTask(task, nodeLimit, timeLimit, withScript, cacheName=None):
+    """
+
+    Solves one task. Runs in a worker process.
+
+    :param:
+        task (tuple): Task as (id, kind, payload)
+        nodeLimit (int): Most moves to try
+        timeLimit (float): Most seconds to search, None for no limit
+        withScript (bool): Include the winning commands in the result
+        cacheName (str): Name of solve cache looked in first and stored to, None for no cache
+
+    :return:
+        result (dict): Result of the task, as written to the results file
+    """
+    taskId, kind, payload = task
+    try:
+        if kind == 'deal':
+            board = dealNumber(payload)
+        else:
+            if kind == 'file':
+                piles = readSave(payload)
+            elif kind == 'binary':
+                piles = parseBinary(payload)
+            else:
+                piles = parseSave(payload.splitlines())
+            board = Board()
+            for pile, slots in piles:
+                board.pushMany(pile, slots)
+    except OSError:
+        return {'id': taskId, 'error': ERROR_MESSAGES[FILE_NOT_FOUND] % payload}
+    except (ValueError, AssertionError):
+        return {'id': taskId, 'error': ERROR_MESSAGES[BAD_SAVE_FORMAT]}
+
+    cache = None
+    if cacheName is not None:
+        cache = _caches.get(cacheName)
+        if cache is None:
+            cache = _caches[cacheName] = SolveCache(cacheName)
+    result = solve(board, nodeLimit, timeLimit, cache)
+    record = {'id': taskId, 'solved': result.solved, 'complete': result.complete, 'length': len(result.moves),
+              'nodes': result.nodes, 'seconds': round(result.seconds, 6)}
+    if withScript and result.solved:
+        record['script'] = result.moves
+    return record
+
+
+def readCheckpoint(fileName):
+    """
+
+    Returns the ids already in a results file. A last line cut short by an interrupted run is removed from the file.
+
+    :param:
+        fileName (str): Name of results file
+
+    :return:
+        done (set): Ids of the tasks already solved
+    """
+    done = set()
+    if not os.path.exists(fileName):
+        return done
+
+    with open(fileName, 'rb+') as results:
+        data = results.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            results.truncate(end)
+
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)['id'])
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def runBatch(tasks, fileName, workers=None, nodeLimit=2000000, timeLimit=None, withScript=False, quiet=False,
+             cacheName=None):
+    """
+
+    Solves tasks in a process pool, appending each result to a results file as soon as it is ready. Tasks already in
+    the results file are skipped.
+
+    :param:
+        tasks (list): Tasks as (id, kind, payload)
+        fileName (str): Name of results file
+        workers (int): Number of worker processes, None for one per core
+        nodeLimit (int): Most moves to try per task
+        timeLimit (float): Most seconds to search per task, None for no limit
+        withScript (bool): Include the winning commands in the results
+        quiet (bool): Do not print progress
+        cacheName (str): Name of solve cache shared by the workers, None for no cache
+
+    :return:
+        stats (dict): Tasks run, tasks skipped, tasks won, seconds and tasks per second
+    """
+    done = readCheckpoint(fileName)
+    todo = [task for task in tasks if task[0] not in done]
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    start = time.perf_counter()
+    won = 0
+    finished = 0
+    with open(fileName, 'a') as results, ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        queue = iter(todo)
+        while True:
+            # Keep a few tasks per worker in flight, so a huge corpus is not submitted all at once
+            while len(pending) < workers * 4:
+                task = next(queue, None)
+                if task is None:
+                    break
+                pending.add(executor.submit(solveTask, task, nodeLimit, timeLimit, withScript, cacheName))
+            if not pending:
+                break
+
+            completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                record = future.result()
+                results.write(json.dumps(record) + '\n')
+                finished += 1
+                if record.get('solved'):
+                    won += 1
+            results.flush()
+
+            if not quiet:
+                print('\r%d/%d solved, %d won' % (finished, len(todo), won), end='', flush=True)
+    if not quiet and todo:
+        print()
+
+    seconds = time.perf_counter() - start
+    return {'run': finished, 'skipped': len(tasks) - len(todo), 'won': won, 'seconds': seconds,
+            'tasksPerSecond': finished / max(seconds, 1e-9)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve a corpus of Klondike deals in parallel.')
+    parser.add_argument('source', nargs='?', help='directory or archive of save files')
+    parser.add_argument('results', help='JSON lines file results are appended to, and resumed from')
+    parser.add_argument('--deals', help='range of numbered deals to solve, as FIRST:LAST')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, one per core if unset')
+    parser.add_argument('--nodes', type=int, default=2000000, help='most moves to try per position')
+    parser.add_argument('--time', type=float, default=None, help='most seconds to search per position')
+    parser.add_argument('--script', action='store_true', help='store the winning commands of each position')
+    parser.add_argument('--scaling', action='store_true', help='time the tasks with 1, 2, 4, ... workers')
+    parser.add_argument('--cache', metavar='FILE', help='SQLite cache of results shared by the workers')
+    args = parser.parse_args()
+
+    if args.deals:
+        first, last = args.deals.split(':')
+        tasks = dealTasks(int(first), int(last))
+    elif args.source and os.path.isdir(args.source):
+        tasks = directoryTasks(args.source)
+    elif args.source:
+        tasks = archiveTasks(args.source)
+    else:
+        parser.error('a source or --deals is needed')
+
+    if args.scaling:
+        # Every run starts from an empty results file, so the same tasks are solved each time
+        most = args.workers or os.cpu_count() or 1
+        workers = 1
+        while True:
+            scalingFile = '%s.%d' % (args.results, workers)
+            if os.path.exists(scalingFile):
+                os.remove(scalingFile)
+            stats = runBatch(tasks, scalingFile, workers, args.nodes, args.time, quiet=True)
+            print('%3d workers: %.2f s, %.1f tasks/sec' % (workers, stats['seconds'], stats['tasksPerSecond']))
+            if workers >= most:
+                break
+            workers = min(workers * 2, most)
+        return
+
+    stats = runBatch(tasks, args.results, args.workers, args.nodes, args.time, args.script, cacheName=args.cache)
+    print('%d solved (%d won), %d skipped, %.2f s, %.1f tasks/sec' % (stats['run'], stats['won'], stats['skipped'],
+                                                                      stats['seconds'], stats['tasksPerSecond']))
+    if args.cache:
+        with SolveCache(args.cache) as cache:
+            total = cache.stats()['total']
+        print('cache: %d hits, %d misses, hit rate %.1f%% over every run' % (total['hits'], total['misses'],
+                                                                             100 * total['hitRate']))
+
+
+if __name__ == '__main__':
+    main()
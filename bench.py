@@ -0,0 +1,726 @@
+"""
+Benchmarks for the Klondike engine.
+
+Every hot path has a benchmark in SUITE, run on fixed positions (Game1-start.txt, samplegame.txt, numbered deals and
+boards built here) so runs are comparable. Results can be written as JSON and compared with a stored baseline, failing
+if any benchmark dropped by more than a threshold.
+
+The speed of a shared machine drifts by tens of percent from one second to the next, so every run of a benchmark is
+timed next to a fixed reference loop. Its score is its rate times the seconds the reference loop took: the number of
+operations done in the time of one reference loop, which stays steady as the machine speeds up and slows down. The
+median score of several runs is compared with the baseline.
+
+Examples:
+    python bench.py
+    python bench.py --json results.json --baseline
+    python bench.py --save-baseline
+    python bench.py --only toPileRun toSuit --repeat 5
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from board import Board, dealBoard, SPADES, PILE1, FACE_UP, CODE_MASK, NUM_PILES, PILE_NAMES
+from card import Card, RANKS, SUITS, CODE_RANK, CODE_SUIT
+from deals import dealNumber
+from deck import Deck, deckText
+from engine import Engine, parseBinary, parseSave, saveBinary, saveText
+from klondike import Solitaire, replayGame
+from moves import legalMoves
+from rules import STACKS_ON, FOUNDATION, FOUNDATION_NEXT, SLOT_RANK
+from script import compileScript, runCompiled
+from sinks import BufferedSink, NullSink
+
+# Directory of this file, which holds the sample files and the baseline. samplegame.txt loads Game1-start.txt by a
+# relative name, so main runs the suite from here.
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_SAVE = os.path.join(DIRECTORY, 'Game1-start.txt')
+SAMPLE_SCRIPT = os.path.join(DIRECTORY, 'samplegame.txt')
+
+# Baseline the suite is compared with by --baseline, written by --save-baseline
+BASELINE_FILE = os.path.join(DIRECTORY, 'bench-baseline.json')
+
+# Most a score may drop below its baseline, as a fraction, before it counts as a regression. Scores of the same code
+# vary by about 15% from run to run on a shared machine.
+THRESHOLD = 0.3
+
+
+def timeIt(function, count):
+    """
+
+    Calls function count times and returns the calls per second.
+
+    :param:
+        function (function): Function to time, called with no arguments
+        count (int): Number of calls
+
+    :return:
+        rate (float): Calls per second
+
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+def loadSample(fileName=SAMPLE_SAVE):
+    """
+
+    Returns a game loaded from a save file.
+
+    :param:
+        fileName (str): Name of save file
+
+    :return:
+        game (Solitaire): Loaded game
+
+    """
+    game = Solitaire(sink=NullSink())
+    game.loadGame(fileName)
+    return game
+
+
+def sampleMoves(fileName=SAMPLE_SCRIPT):
+    """
+
+    Returns the move, discard and reset commands of a command script.
+
+    :param:
+        fileName (str): Name of command script
+
+    :return:
+        moves (list): Commands of the script that change the board
+
+    """
+    moves = []
+    with open(fileName, 'r') as script:
+        for line in script:
+            command = line.strip('\n')
+            if command.startswith('move ') or command in ('discard', 'reset'):
+                moves.append(command)
+    return moves
+
+
+def benchMoves(count=2000):
+    """
+
+    Replays the moves of samplegame.txt from Game1-start.txt and returns the moves per second.
+
+    :param:
+        count (int): Number of replays
+
+    :return:
+        rate (float): Moves per second
+
+    """
+    game = loadSample()
+    start = game.board.copy()
+    moves = sampleMoves()
+
+    def replay():
+        game.board.assign(start)
+        for move in moves:
+            game.runGame(move)
+
+    return timeIt(replay, count) * len(moves)
+
+
+def benchCopies(count=100000):
+    """
+
+    Returns the board copies per second, and the object model copies per second for comparison.
+
+    :param:
+        count (int): Number of copies
+
+    :return:
+        rates (tuple): Board copies per second, deep copies of the game per second
+
+    """
+    game = loadSample()
+    boardRate = timeIt(game.board.copy, count)
+    deepRate = timeIt(lambda: copy.deepcopy(game), count // 100)
+    return boardRate, deepRate
+
+
+def benchLegalMoves(count=200000):
+    """
+
+    Returns the calls per second of legalMoves, on the position samplegame.txt reaches after its first ten moves.
+
+    :param:
+        count (int): Number of calls
+
+    :return:
+        rate (float): Calls per second
+
+    """
+    game = loadSample()
+    for move in sampleMoves()[:10]:
+        game.engine.apply(move)
+    board = game.board
+    return timeIt(lambda: legalMoves(board), count)
+
+
+def randomBoard(rnd):
+    """
+
+    Returns a board dealt from a shuffled deck, laid out like Game1-start.txt.
+
+    :param:
+        rnd (random.Random): Random number generator
+
+    :return:
+        board (Board): Dealt board
+
+    """
+    return dealBoard(rnd.sample(range(52), 52))
+
+
+def hashCollisionStats(deals=2000, movesPerDeal=100, seed=1):
+    """
+
+    Plays random moves from random deals and counts positions whose hashes collide. Collisions of the low 32 bits are
+    counted too, to compare with the birthday bound of a well mixed hash.
+
+    :param:
+        deals (int): Number of deals
+        movesPerDeal (int): Number of random moves played from each deal
+        seed (int): Seed of the random number generator
+
+    :return:
+        stats (dict): Positions seen, 64-bit collisions, 32-bit collisions and 32-bit collisions expected
+
+    """
+    rnd = random.Random(seed)
+    seen = {}
+    low = {}
+    collisions = 0
+    lowCollisions = 0
+    for deal in range(deals):
+        engine = Engine(randomBoard(rnd))
+        for i in range(movesPerDeal):
+            board = engine.board
+            position = bytes(board.cells())
+            zobrist = board.zobrist()
+            if seen.setdefault(zobrist, position) != position:
+                collisions += 1
+            if low.setdefault(zobrist & 0xFFFFFFFF, position) != position:
+                lowCollisions += 1
+
+            moves = legalMoves(board)
+            if not moves:
+                break
+            engine.applyMove(rnd.choice(moves))
+
+    # Positions repeat during random play, so the expected count uses the distinct positions only
+    positions = len(set(seen.values()))
+    return {'positions': positions, 'collisions': collisions, 'lowCollisions': lowCollisions,
+            'lowCollisionsExpected': positions * (positions - 1) / 2 ** 33}
+
+
+def benchSaveFormats(games=100000):
+    """
+
+    Saves and loads numbered deals in the text and the binary save format, and returns the time taken and the bytes
+    written by each. Loading includes building the board.
+
+    :param:
+        games (int): Number of deals
+
+    :return:
+        stats (dict): For 'text' and 'binary', a dict of save seconds, load seconds and total bytes
+
+    """
+    boards = [dealNumber(number) for number in range(games)]
+
+    def load(piles):
+        board = Board()
+        for pile, slots in piles:
+            board.pushMany(pile, slots)
+        return board
+
+    stats = {}
+    for name, save, parse in (('text', saveText, lambda text: parseSave(text.splitlines())),
+                              ('binary', saveBinary, parseBinary)):
+        start = time.perf_counter()
+        saved = [save(board) for board in boards]
+        saveSeconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = [load(parse(data)) for data in saved]
+        loadSeconds = time.perf_counter() - start
+
+        assert loaded == boards, 'Save format did not give back the same boards!'
+        stats[name] = {'save': saveSeconds, 'load': loadSeconds, 'bytes': sum(len(data) for data in saved)}
+    return stats
+
+
+def benchCards(count=20000):
+    """
+
+    Returns the Card constructions per second, building all 52 cards from their names in turn.
+
+    :param:
+        count (int): Number of times the 52 cards are built
+
+    :return:
+        rate (float): Cards per second
+
+    """
+    names = [(rank, suit) for suit in SUITS for rank in RANKS]
+    return timeIt(lambda: [Card(rank, suit) for rank, suit in names], count) * len(names)
+
+
+def benchDeckOps(count=200000):
+    """
+
+    Returns the pushDeck, peekDeck and popDeck calls per second, on a deck of its own.
+
+    :param:
+        count (int): Number of push, peek and pop cycles
+
+    :return:
+        rate (float): Deck calls per second
+
+    """
+    deck = Deck('Bench')
+    card = Card('Q', 'h')
+
+    def cycle():
+        deck.pushDeck(card, True)
+        deck.peekDeck()
+        deck.popDeck()
+
+    return timeIt(cycle, count) * 3
+
+
+def benchRuleChecks(count=100, tables=True):
+    """
+
+    Returns the rule checks per second: can one face up card go on another in a pile, for every pair of cards, and can
+    it go on the foundation of its suit, for every card on every foundation top. With tables False the checks are
+    worked out from ranks and suits instead of the tables of rules.py, for comparison.
+
+    :param:
+        count (int): Number of times every pair is checked
+        tables (bool): Use the rule tables
+
+    :return:
+        rates (tuple): Pile checks per second, foundation checks per second
+
+    """
+    slots = range(FACE_UP, FACE_UP + 52)
+    pairs = [(upper, lower) for upper in slots for lower in slots]
+    keys = [upper << 7 | lower for upper, lower in pairs]
+    # Foundation tops by pile, with the same card on top of every foundation, so the foundation of the card has to be
+    # looked up as toSuit does
+    founds = [(slot, bytes([0, 0, top, top, top, top])) for slot, top in pairs]
+
+    if tables:
+        def stackChecks():
+            return [STACKS_ON[key] for key in keys]
+
+        def foundationChecks():
+            return [SLOT_RANK[slot] == FOUNDATION_NEXT[tops[FOUNDATION[slot]]] for slot, tops in founds]
+    else:
+        def stackChecks():
+            return [CODE_RANK[upper & CODE_MASK] + 1 == CODE_RANK[lower & CODE_MASK] for upper, lower in pairs]
+
+        def foundationChecks():
+            return [CODE_RANK[tops[SPADES + CODE_SUIT[slot & CODE_MASK]] & CODE_MASK] + 1 == CODE_RANK[slot & CODE_MASK]
+                    for slot, tops in founds]
+
+    return timeIt(stackChecks, count) * len(pairs), timeIt(foundationChecks, count) * len(pairs)
+
+
+def runBoard():
+    """
+
+    Returns a board whose first pile is a face up run of all 13 spades and hearts, king to ace, with the other piles
+    empty, so the whole run can move between the first two piles.
+
+    :param:
+        None
+
+    :return:
+        board (Board): Board with the run
+    """
+    board = Board()
+    for rank in range(13, 0, -1):
+        # Spades are suit 0 and hearts suit 1, so the colours alternate
+        board.push(PILE1, (rank % 2) * 13 + rank - 1 | FACE_UP)
+    return board
+
+
+def benchToPileRun(count=50000):
+    """
+
+    Returns the toPile calls per second moving a run of 13 face up cards back and forth between two empty piles.
+
+    :param:
+        count (int): Number of moves there and back
+
+    :return:
+        rate (float): Moves per second
+
+    """
+    engine = Engine(runBoard(), historyLimit=0)
+
+    def moveRun():
+        engine.toPile(PILE1, PILE1 + 1)
+        engine.toPile(PILE1 + 1, PILE1)
+
+    return timeIt(moveRun, count) * 2
+
+
+def benchToSuit(count=20000):
+    """
+
+    Returns the toSuit calls per second, moving a pile of the 13 spades, ace on top, to its foundation a card at a time.
+
+    :param:
+        count (int): Number of times the 13 spades are moved
+
+    :return:
+        rate (float): Moves per second
+
+    """
+    start = Board()
+    for code in range(12, -1, -1):
+        start.push(PILE1, code | FACE_UP)
+    engine = Engine(start.copy(), historyLimit=0)
+
+    def moveSpades():
+        engine.board.assign(start)
+        for i in range(13):
+            engine.toSuit(PILE1)
+
+    return timeIt(moveSpades, count) * 13
+
+
+def benchDiscardReset(count=20000):
+    """
+
+    Returns the discardFunction and reset calls per second, discarding the stock of Game1-start.txt and resetting it.
+
+    :param:
+        count (int): Number of discard and reset cycles
+
+    :return:
+        rate (float): Calls per second
+
+    """
+    game = loadSample()
+    calls = game.board.pileSize(0) // 3 + 1
+
+    def cycle():
+        for i in range(calls - 1):
+            game.discardFunction()
+        game.reset()
+
+    return timeIt(cycle, count) * calls
+
+
+def benchSaveLoad(count=2000):
+    """
+
+    Returns the saveGame and loadGame calls per second, with text saves in a temporary directory.
+
+    :param:
+        count (int): Number of save and load cycles
+
+    :return:
+        rate (float): Calls per second
+
+    """
+    game = loadSample()
+    empty = Board()
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory, 'bench.txt')
+
+        def cycle():
+            game.saveGame(fileName)
+            # Loading adds to the board, so it is emptied first
+            game.board.assign(empty)
+            game.loadGame(fileName)
+
+        return timeIt(cycle, count) * 2
+
+
+def benchRenderDecks(count=20000):
+    """
+
+    Returns the decks rendered per second from scratch, for the 13 piles of Game1-start.txt.
+
+    :param:
+        count (int): Number of times every pile is rendered
+
+    :return:
+        rate (float): Decks per second
+
+    """
+    board = loadSample().board
+    piles = [(PILE_NAMES[pile], board.pileSlots(pile)) for pile in range(NUM_PILES)]
+    return timeIt(lambda: [deckText(name, slots, False) for name, slots in piles], count) * NUM_PILES
+
+
+def benchDisplayBoard(count=20000):
+    """
+
+    Returns the boards displayed per second by the board command, into a buffered sink in memory.
+
+    :param:
+        count (int): Number of boards
+
+    :return:
+        rate (float): Boards per second
+
+    """
+    game = Solitaire(sink=BufferedSink(io.StringIO()))
+    game.loadGame(SAMPLE_SAVE)
+    return timeIt(game.displayBoard, count)
+
+
+def benchReplay(count=500, showText=False):
+    """
+
+    Returns the commands per second of full replays of samplegame.txt through Solitaire.
+
+    :param:
+        count (int): Number of replays
+        showText (bool): Render the output into a buffered sink in memory, instead of a sink that shows nothing
+
+    :return:
+        rate (float): Commands per second
+
+    """
+    with open(SAMPLE_SCRIPT, 'r') as script:
+        commands = len(script.readlines())
+    if showText:
+        sink = BufferedSink(io.StringIO())
+    else:
+        sink = NullSink()
+    return timeIt(lambda: replayGame(SAMPLE_SCRIPT, sink), count) * commands
+
+
+def benchReplayCompiled(count=2000):
+    """
+
+    Returns the commands per second of samplegame.txt compiled (see script.py) and run on an engine.
+
+    :param:
+        count (int): Number of replays
+
+    :return:
+        rate (float): Commands per second
+
+    """
+    with open(SAMPLE_SCRIPT, 'r') as script:
+        compiled = compileScript(script)
+    loadCache = {}
+    return timeIt(lambda: runCompiled(compiled, loadCache), count) * (len(compiled.code) // 3)
+
+
+def referenceLoop():
+    """
+
+    Runs a fixed loop of plain Python and returns the seconds it took. Scores are given in units of this loop.
+
+    :param:
+        None
+
+    :return:
+        seconds (float): Seconds taken
+
+    """
+    start = time.perf_counter()
+    total = 0
+    for i in range(100000):
+        total += i
+    return time.perf_counter() - start
+
+
+def benchSaveRates(games=20000):
+    """
+
+    Returns the rates of benchSaveFormats as games per second.
+
+    :param:
+        games (int): Number of deals
+
+    :return:
+        rates (dict): Games per second saved and loaded as text and as binary
+    """
+    stats = benchSaveFormats(games)
+    return {'%s%s' % (action, name.capitalize()): games / stats[name][action]
+            for name in ('text', 'binary') for action in ('save', 'load')}
+
+
+# Benchmarks of the suite: name, unit of the rate, a function returning the rate, and the largest drop allowed for it,
+# None for the threshold given to compareBaseline. Benchmarks that write files get more room, since the disk is noisier.
+# Counts are chosen so each run takes about a tenth of a second.
+SUITE = [('cards', 'cards/s', lambda: benchCards(2500), None),
+         ('deckOps', 'calls/s', lambda: benchDeckOps(60000), None),
+         ('toPileRun', 'moves/s', lambda: benchToPileRun(3000), None),
+         ('toSuit', 'moves/s', lambda: benchToSuit(2500), None),
+         ('discardReset', 'calls/s', lambda: benchDiscardReset(1500), None),
+         ('saveLoadGame', 'calls/s', lambda: benchSaveLoad(400), 0.4),
+         ('renderDecks', 'decks/s', lambda: benchRenderDecks(6000), None),
+         ('displayBoard', 'boards/s', lambda: benchDisplayBoard(10000), None),
+         ('replaySample', 'commands/s', lambda: benchReplay(100), None),
+         ('replaySampleText', 'commands/s', lambda: benchReplay(50, showText=True), None),
+         ('replayCompiled', 'commands/s', lambda: benchReplayCompiled(200), None),
+         ('sampleMoves', 'moves/s', lambda: benchMoves(150), None),
+         ('boardCopy', 'copies/s', lambda: benchCopies(150000)[0], None),
+         ('deepCopy', 'copies/s', lambda: benchCopies(30000)[1], None),
+         ('boardHash', 'hashes/s', lambda: timeIt(loadSample().board.__hash__, 1000000), None),
+         ('legalMoves', 'calls/s', lambda: benchLegalMoves(6000), None),
+         ('stackCheck', 'checks/s', lambda: benchRuleChecks(150)[0], None),
+         ('stackCheckRanks', 'checks/s', lambda: benchRuleChecks(60, tables=False)[0], None),
+         ('foundationCheck', 'checks/s', lambda: benchRuleChecks(100)[1], None),
+         ('foundationCheckRanks', 'checks/s', lambda: benchRuleChecks(60, tables=False)[1], None),
+         ('saveText', 'games/s', lambda: benchSaveRates(1000)['saveText'], None),
+         ('loadText', 'games/s', lambda: benchSaveRates(1000)['loadText'], None),
+         ('saveBinary', 'games/s', lambda: benchSaveRates(1000)['saveBinary'], None),
+         ('loadBinary', 'games/s', lambda: benchSaveRates(1000)['loadBinary'], None)]
+
+
+def runSuite(names=None, repeat=7):
+    """
+
+    Runs benchmarks of the suite, keeping the median rate and score of each.
+
+    :param:
+        names (list): Names of benchmarks to run, None for all
+        repeat (int): Number of runs of each benchmark
+
+    :return:
+        results (dict): Name, Python version and machine of the run, and the rate and unit of each benchmark
+    """
+    known = [name for name, unit, function, threshold in SUITE]
+    for name in names or []:
+        if name not in known:
+            raise ValueError('There is no benchmark %s!' % name)
+
+    # Every benchmark is seeded or fixed, this only makes anything left over repeatable
+    random.seed(1)
+    benchmarks = {}
+    for name, unit, function, threshold in SUITE:
+        if names is not None and name not in names:
+            continue
+        rates = []
+        scores = []
+        for i in range(repeat):
+            before = referenceLoop()
+            rate = function()
+            after = referenceLoop()
+            rates.append(rate)
+            scores.append(rate * (before + after) / 2)
+        benchmarks[name] = {'rate': statistics.median(rates), 'unit': unit, 'score': statistics.median(scores)}
+        if threshold is not None:
+            benchmarks[name]['threshold'] = threshold
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'repeat': repeat,
+            'benchmarks': benchmarks}
+
+
+def compareBaseline(results, baseline, threshold=THRESHOLD):
+    """
+
+    Compares the scores of a run with a baseline. A benchmark regressed if its score is lower than the baseline score
+    by more than the threshold, or by more than its own 'threshold' in the baseline if it has one.
+
+    :param:
+        results (dict): Results of runSuite
+        baseline (dict): Results of an earlier runSuite
+        threshold (float): Largest drop allowed, as a fraction of the baseline score
+
+    :return:
+        comparison (list): For each benchmark in both, a tuple of name, score, baseline score, change and regressed
+    """
+    comparison = []
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        base = baseline['benchmarks'][name]
+        change = result['score'] / base['score'] - 1
+        comparison.append((name, result['score'], base['score'], change, change < -base.get('threshold', threshold)))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite of the Klondike engine.')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='benchmarks to run, all if not given')
+    parser.add_argument('--repeat', type=int, default=7, help='runs of each benchmark, the median is kept')
+    parser.add_argument('--json', metavar='FILE', help='write the results as JSON, - for standard output')
+    parser.add_argument('--baseline', nargs='?', const=BASELINE_FILE, metavar='FILE',
+                        help='compare with a baseline and fail on regressions (default file %s)' % BASELINE_FILE)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='largest drop allowed, as a fraction')
+    parser.add_argument('--save-baseline', nargs='?', const=BASELINE_FILE, metavar='FILE',
+                        help='write the results as the new baseline (default file %s)' % BASELINE_FILE)
+    parser.add_argument('--hashes', action='store_true', help='also count hash collisions in random play')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and stop')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, unit, function, threshold in SUITE:
+            print('%-18s %s' % (name, unit))
+        return
+
+    known = [name for name, unit, function, threshold in SUITE]
+    for name in args.only or []:
+        if name not in known:
+            parser.error('there is no benchmark %s, see --list' % name)
+
+    # Files named on the command line are relative to where bench.py was run, the ones the suite loads to DIRECTORY
+    for option in ('json', 'baseline', 'save_baseline'):
+        fileName = getattr(args, option)
+        if fileName and fileName != '-':
+            setattr(args, option, os.path.abspath(fileName))
+    os.chdir(DIRECTORY)
+
+    results = runSuite(args.only, args.repeat)
+    for name, result in results['benchmarks'].items():
+        print('%-18s %14.0f %-11s score %10.1f' % (name, result['rate'], result['unit'], result['score']))
+
+    if args.hashes:
+        stats = hashCollisionStats()
+        print('hash collisions:   %d in %d positions (low 32 bits: %d, expected %.1f)' %
+              (stats['collisions'], stats['positions'], stats['lowCollisions'], stats['lowCollisionsExpected']))
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as output:
+            json.dump(results, output, indent=2)
+            output.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = 0
+        print()
+        for name, score, baseScore, change, regressed in compareBaseline(results, baseline, args.threshold):
+            regressions += regressed
+            print('%-18s %+7.1f%%%s' % (name, 100 * change, '  REGRESSION' if regressed else ''))
+        if regressions:
+            print('%d benchmarks regressed by more than the threshold' % regressions)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+"""
+Packed board state for a game of Klondike.
+
+All 13 piles live in one bytearray. The first 13 bytes hold the length of each pile, and every pile owns a region of
+PILE_CAPACITY slots after them. A slot holds a card code (0 - 51, see card.py) with FACE_UP set if the card is visible.
+Slots above the top of a pile are always zero, so two boards hold the same position exactly when their buffers are
+equal, and copying a board is a single buffer copy.
+
+Every board also keeps a 64-bit Zobrist hash of its position: the XOR of one random key per occupied slot, chosen by
+pile, height in the pile and slot value. Pushing, popping or flipping a card updates it with one or two XORs.
+
+Boards also keep, for each pile, the height where its run starts: the lowest card of the visible cards on top of the
+pile that each go one rank below the card under them. It is kept up to date by every push, pop and flip, and worked
+out again only after a change that could have lengthened the run downwards, such as popping the whole run.
+"""
+import random
+from array import array
+
+from card import CODE_RANK
+
+STOCK = 0
+DISCARD = 1
+SPADES = 2
+HEARTS = 3
+DIAMONDS = 4
+CLUBS = 5
+PILE1 = 6
+PILE7 = 12
+
+NUM_PILES = 13
+PILE_CAPACITY = 52
+
+# Pile names, in the order the piles are saved and displayed
+PILE_NAMES = ('Stock', 'Discard', 'Spades', 'Hearts', 'Diamonds', 'Clubs',
+              'PILE-1', 'PILE-2', 'PILE-3', 'PILE-4', 'PILE-5', 'PILE-6', 'PILE-7')
+
+FOUNDATIONS = (SPADES, HEARTS, DIAMONDS, CLUBS)
+TABLEAU = tuple(range(PILE1, PILE7 + 1))
+
+FACE_UP = 0x40
+CODE_MASK = 0x3F
+
+# Every value a slot holding a card can have, face up or not
+SLOT_VALUES = bytes(range(52)) + bytes(range(FACE_UP, FACE_UP + 52))
+
+# Offset of the first slot of each pile in the buffer
+PILE_BASE = tuple(NUM_PILES + pile * PILE_CAPACITY for pile in range(NUM_PILES))
+BUFFER_SIZE = NUM_PILES + NUM_PILES * PILE_CAPACITY
+
+# Zobrist key of slot value v at buffer index i is ZOBRIST_KEYS[i << 7 | v]. The keys are seeded, so hashes are the
+# same in every process and run.
+ZOBRIST_KEYS = array('Q')
+ZOBRIST_KEYS.frombytes(random.Random(20211119).randbytes(8 * BUFFER_SIZE * 128))
+
+# Run start of a pile that has to be worked out again
+UNKNOWN_RUN = 0xFF
+
+
+class Board:
+    __slots__ = ('__cells', '__zobrist', '__runs')
+
+    def __init__(self, cells=None, zobrist=None):
+        if cells is None:
+            self.__cells = bytearray(BUFFER_SIZE)
+            self.__zobrist = 0
+            # Runs of empty piles start at height 0
+            self.__runs = bytearray(NUM_PILES)
+        else:
+            assert len(cells) == BUFFER_SIZE, 'Board buffer has the wrong size!'
+            self.__cells = bytearray(cells)
+            if zobrist is None:
+                zobrist = computeZobrist(self.__cells)
+            self.__zobrist = zobrist
+            self.__runs = bytearray([UNKNOWN_RUN]) * NUM_PILES
+
+    def __eq__(self, other):
+        return type(other) == Board and self.__cells == other.cells()
+
+    def __hash__(self):
+        return self.__zobrist
+
+    def cells(self):
+        """
+
+        Returns the buffer holding the board. Pile lengths are at cells[pile], and the slots of a pile start at
+        cells[PILE_BASE[pile]]. Callers that write to it directly must keep slots above the top of each pile zero, and
+        call rehash when they are done.
+
+        :param:
+            None
+
+        :return:
+            self.__cells (bytearray): Buffer of the board
+
+        """
+        return self.__cells
+
+    def copy(self):
+        """
+
+        Returns a copy of the board.
+
+        :param:
+            None
+
+        :return:
+            board (Board): Copy of board
+
+        """
+        # Built without __init__, so the buffer and runs are copied once and the hash is not checked
+        board = Board.__new__(Board)
+        board.__cells = bytearray(self.__cells)
+        board.__zobrist = self.__zobrist
+        board.__runs = bytearray(self.__runs)
+        return board
+
+    def assign(self, other):
+        """
+
+        Makes the board hold the same position as another board, in place.
+
+        :param:
+            other (Board): Board to copy
+
+        :return:
+            None
+
+        """
+        self.__cells[:] = other.__cells
+        self.__zobrist = other.__zobrist
+        self.__runs[:] = other.__runs
+
+    def zobrist(self):
+        """
+
+        Returns the 64-bit Zobrist hash of the position.
+
+        :param:
+            None
+
+        :return:
+            self.__zobrist (int): Hash of position
+
+        """
+        return self.__zobrist
+
+    def rehash(self):
+        """
+
+        Recomputes the Zobrist hash from the buffer, after the buffer was written to directly. Run starts are worked
+        out again when next asked for.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__zobrist = computeZobrist(self.__cells)
+        self.__runs[:] = bytes([UNKNOWN_RUN]) * NUM_PILES
+
+    def isHashValid(self):
+        """
+
+        Returns if the Zobrist hash kept up to date matches one computed from scratch.
+
+        :param:
+            None
+
+        :return:
+            valid (bool): If the hash is in sync
+
+        """
+        return self.__zobrist == computeZobrist(self.__cells)
+
+    def pileSize(self, pile):
+        """
+
+        Returns number of cards in pile.
+
+        :param:
+            pile (int): Index of pile
+
+        :return:
+            size (int): Number of cards in pile
+
+        """
+        return self.__cells[pile]
+
+    def pileSlots(self, pile):
+        """
+
+        Returns slots of pile from bottom to top.
+
+        :param:
+            pile (int): Index of pile
+
+        :return:
+            slots (bytes): Slots of pile
+
+        """
+        base = PILE_BASE[pile]
+        return bytes(self.__cells[base:base + self.__cells[pile]])
+
+    def runStart(self, pile):
+        """
+
+        Returns the height where the run on top of a pile starts: the lowest of the visible cards on top that each go
+        one rank below the card under them. It is the size of the pile if the top card is hidden or the pile is empty.
+
+        :param:
+            pile (int): Index of pile
+
+        :return:
+            start (int): Height of the lowest card of the run
+
+        """
+        start = self.__runs[pile]
+        if start == UNKNOWN_RUN:
+            cells = self.__cells
+            base = PILE_BASE[pile]
+            index = base + cells[pile]
+            if index > base and cells[index - 1] & FACE_UP:
+                index -= 1
+                while index > base and cells[index - 1] & FACE_UP and \
+                        CODE_RANK[cells[index - 1] & CODE_MASK] == CODE_RANK[cells[index] & CODE_MASK] + 1:
+                    index -= 1
+            start = self.__runs[pile] = index - base
+        return start
+
+    def __popRun(self, pile, size):
+        """
+
+        Updates the run start of a pile after cards were popped from it, leaving size cards.
+
+        :param:
+            pile (int): Index of pile
+            size (int): Number of cards left in pile
+
+        :return:
+            None
+
+        """
+        # A run that still has cards keeps its start. Otherwise the cards under it may be a run of their own.
+        if self.__runs[pile] >= size:
+            if size == 0 or not self.__cells[PILE_BASE[pile] + size - 1] & FACE_UP:
+                self.__runs[pile] = size
+            else:
+                self.__runs[pile] = UNKNOWN_RUN
+
+    def push(self, pile, slot):
+        """
+
+        Pushes slot to top of pile.
+
+        :param:
+            pile (int): Index of pile
+            slot (int): Card code, with FACE_UP set if the card is visible
+
+        :return:
+            None
+
+        """
+        cells = self.__cells
+        size = cells[pile]
+        assert size < PILE_CAPACITY, 'Pile is full!'
+
+        index = PILE_BASE[pile] + size
+        cells[index] = slot
+        cells[pile] = size + 1
+        self.__zobrist ^= ZOBRIST_KEYS[index << 7 | slot]
+
+        if not slot & FACE_UP:
+            self.__runs[pile] = size + 1
+        elif not size or not cells[index - 1] & FACE_UP or \
+                CODE_RANK[cells[index - 1] & CODE_MASK] != CODE_RANK[slot & CODE_MASK] + 1:
+            # The card does not go on the card under it, so it starts a run of its own
+            self.__runs[pile] = size
+
+    def pushMany(self, pile, slots):
+        """
+
+        Pushes slots to top of pile, the first one lowest.
+
+        :param:
+            pile (int): Index of pile
+            slots (bytes): Slots to push, from bottom to top
+
+        :return:
+            None
+
+        """
+        cells = self.__cells
+        size = cells[pile]
+        count = len(slots)
+        assert size + count <= PILE_CAPACITY, 'Pile is full!'
+        if count == 0:
+            return
+
+        base = PILE_BASE[pile]
+        index = base + size
+        cells[index:index + count] = slots
+        cells[pile] = size + count
+
+        zobrist = self.__zobrist
+        for slot in slots:
+            zobrist ^= ZOBRIST_KEYS[index << 7 | slot]
+            index += 1
+        self.__zobrist = zobrist
+
+        # Find where the run on top starts, going down the pushed slots and onto the run that was under them
+        runs = self.__runs
+        height = size + count - 1
+        slot = slots[-1]
+        if not slot & FACE_UP:
+            runs[pile] = height + 1
+            return
+        while height > size:
+            below = slots[height - size - 1]
+            if not below & FACE_UP or CODE_RANK[below & CODE_MASK] != CODE_RANK[slot & CODE_MASK] + 1:
+                runs[pile] = height
+                return
+            slot = below
+            height -= 1
+        if not size or not cells[base + size - 1] & FACE_UP or \
+                CODE_RANK[cells[base + size - 1] & CODE_MASK] != CODE_RANK[slot & CODE_MASK] + 1:
+            runs[pile] = size
+
+    def pop(self, pile):
+        """
+
+        Removes slot from top of pile and returns it.
+
+        :param:
+            pile (int): Index of pile
+
+        :return:
+            slot (int): Slot from top of pile, None if the pile is empty
+
+        """
+        cells = self.__cells
+        size = cells[pile]
+        if size == 0:
+            return None
+
+        index = PILE_BASE[pile] + size - 1
+        slot = cells[index]
+        cells[index] = 0
+        cells[pile] = size - 1
+        self.__zobrist ^= ZOBRIST_KEYS[index << 7 | slot]
+        if self.__runs[pile] >= size - 1:
+            self.__popRun(pile, size - 1)
+        return slot
+
+    def popMany(self, pile, count):
+        """
+
+        Removes slots from top of pile in one slice and returns them.
+
+        :param:
+            pile (int): Index of pile
+            count (int): Number of slots to remove, at most the size of the pile
+
+        :return:
+            slots (bytes): Slots removed, from bottom to top
+
+        """
+        cells = self.__cells
+        size = cells[pile]
+        assert 0 <= count <= size, 'Pile does not have that many cards!'
+
+        end = PILE_BASE[pile] + size
+        index = end - count
+        slots = bytes(cells[index:end])
+        cells[index:end] = bytes(count)
+        cells[pile] = size - count
+
+        zobrist = self.__zobrist
+        for slot in slots:
+            zobrist ^= ZOBRIST_KEYS[index << 7 | slot]
+            index += 1
+        self.__zobrist = zobrist
+        self.__popRun(pile, size - count)
+        return slots
+
+    def peek(self, pile):
+        """
+
+        Returns slot from top of pile. Does not make changes to pile.
+
+        :param:
+            pile (int): Index of pile
+
+        :return:
+            slot (int): Slot from top of pile, None if the pile is empty
+
+        """
+        size = self.__cells[pile]
+        if size == 0:
+            return None
+        return self.__cells[PILE_BASE[pile] + size - 1]
+
+    def isTopVisible(self, pile):
+        """
+
+        Returns the visibility of the card on top of pile. True = is visible, False = not visible or pile is empty
+
+        :param:
+            pile (int): Index of pile
+
+        :return:
+            visibility (bool): Visibility of top card
+
+        """
+        size = self.__cells[pile]
+        return size > 0 and self.__cells[PILE_BASE[pile] + size - 1] & FACE_UP != 0
+
+    def setTopVisibility(self, pile, visibility):
+        """
+
+        Sets the visibility of the card on top of pile. Does nothing if the pile is empty.
+
+        :param:
+            pile (int): Index of pile
+            visibility (bool): Visibility of card
+
+        :return:
+            None
+
+        """
+        size = self.__cells[pile]
+        if size > 0:
+            index = PILE_BASE[pile] + size - 1
+            old = self.__cells[index]
+            if visibility:
+                new = old | FACE_UP
+            else:
+                new = old & CODE_MASK
+            if new == old:
+                return
+            self.__cells[index] = new
+            self.__zobrist ^= ZOBRIST_KEYS[index << 7 | old] ^ ZOBRIST_KEYS[index << 7 | new]
+
+            if not visibility:
+                self.__runs[pile] = size
+            elif size == 1 or not self.__cells[index - 1] & FACE_UP or \
+                    CODE_RANK[self.__cells[index - 1] & CODE_MASK] != CODE_RANK[old] + 1:
+                self.__runs[pile] = size - 1
+            else:
+                self.__runs[pile] = UNKNOWN_RUN
+
+
+def dealBoard(codes):
+    """
+
+    Returns a board dealt from a deck, laid out like Game1-start.txt: PILE-n gets n cards with only the top one
+    visible, and the other 24 cards go to the stock with only the top one visible.
+
+    :param:
+        codes (list): The 52 card codes in deal order. The first card dealt is the bottom of PILE-1, the next two make
+            up PILE-2 from the bottom, and so on. The last card dealt is the top of the stock.
+
+    :return:
+        board (Board): Dealt board
+
+    """
+    assert len(codes) == 52, 'A deal needs 52 cards!'
+
+    board = Board()
+    i = 0
+    for pileNumber in range(7):
+        for height in range(pileNumber + 1):
+            if height == pileNumber:
+                board.push(PILE1 + pileNumber, codes[i] | FACE_UP)
+            else:
+                board.push(PILE1 + pileNumber, codes[i])
+            i += 1
+    for code in codes[i:]:
+        board.push(STOCK, code)
+    board.setTopVisibility(STOCK, True)
+    return board
+
+
+def computeZobrist(cells):
+    """
+
+    Computes the Zobrist hash of a board buffer from scratch.
+
+    :param:
+        cells (bytearray): Buffer of board
+
+    :return:
+        zobrist (int): Hash of position
+
+    """
+    zobrist = 0
+    for pile in range(NUM_PILES):
+        base = PILE_BASE[pile]
+        for index in range(base, base + cells[pile]):
+            zobrist ^= ZOBRIST_KEYS[index << 7 | cells[index]]
+    return zobrist
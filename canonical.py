@@ -0,0 +1,249 @@
+"""
+Canonical form of positions.
+
+Many positions play out exactly alike. The seven tableau piles can be put in any order, since no rule looks at which
+pile is which, and the suits can be named any other way, swapping the foundations with them: no rule looks at the
+suit of a card but to pick its foundation, and stacking ignores colour (see rules.py), so any two suits can be swapped,
+not only suits of one colour. A solution of one position plays the other with the tableau piles numbered to match;
+suits never need renaming in a script, since foundation moves go to 'suit'.
+
+canonicalize picks one position of each such group: the suits are named in order of where their cards lie, and the
+tableau piles are sorted by their slots. Its canonical form holds the whole position, so positions with the same form
+always play out alike; a few positions whose suits lie exactly alike can still get different forms, which only means
+they are not merged. The solver keys its transposition table and the dedup index keys its games on the form.
+
+Measure what it saves on a fixed set of deals with:
+    python canonical.py --deals 0:100 --nodes 200000
+"""
+import argparse
+import itertools
+import random
+import sys
+
+from board import NUM_PILES, PILE_BASE, STOCK, DISCARD, SPADES, FOUNDATIONS, TABLEAU, PILE1, SLOT_VALUES, FACE_UP, \
+    CODE_MASK
+from deals import dealNumber
+from engine import PILE_COMMANDS
+
+# Symmetries the solver can key its transposition table on: none, order of the tableau piles, and that and suit names
+SYMMETRIES = ('none', 'tableau', 'full')
+
+# Ends pile slices in a canonical form. No slot holds it.
+SEPARATOR = b'\xff'
+
+# Tableau piles with the offset of their slots, and the end of the slots of the other piles
+_TABLEAU_BASES = tuple((pile, PILE_BASE[pile]) for pile in TABLEAU)
+_FIXED_END = PILE_BASE[PILE1]
+
+# Kind of each pile, in the top two bits of the place of a card: stock, discard, foundation or tableau
+_AREA = tuple(0x00 if pile == STOCK else 0x40 if pile == DISCARD else 0x80 if pile in FOUNDATIONS else 0xC0
+              for pile in range(NUM_PILES))
+
+
+def _renameTable(order):
+    """
+
+    Returns the slot translation that names the suits in a new order.
+
+    :param:
+        order (tuple): Suits in their new order. A card of suit order[i] becomes the card of suit i of the same rank.
+
+    :return:
+        table (bytes): Translation for bytes.translate, keeping whether each card is face up
+    """
+    table = bytearray(range(256))
+    for slot in SLOT_VALUES:
+        code = slot & CODE_MASK
+        table[slot] = (slot & FACE_UP) | order.index(code // 13) * 13 + code % 13
+    return bytes(table)
+
+
+# Slot translation of every naming of the suits, by the suits in their new order
+_RENAME = {order: _renameTable(order) for order in itertools.permutations(range(4))}
+
+
+def suitOrder(board):
+    """
+
+    Returns the suits in the order they are named in the canonical form. Suits are ordered by where their cards lie,
+    ace first: the kind of pile holding each card and its height there, which moving tableau piles does not change.
+    Suits whose cards lie exactly alike keep their own order.
+
+    :param:
+        board (Board): Board of position
+
+    :return:
+        order (tuple): Suits (0 - 3), the one named spades first
+    """
+    cells = board.cells()
+    places = bytearray(52)
+    for pile in range(NUM_PILES):
+        base = PILE_BASE[pile]
+        area = _AREA[pile]
+        for height, slot in enumerate(cells[base:base + cells[pile]]):
+            places[slot & CODE_MASK] = area | height
+    return tuple(sorted(range(4), key=lambda suit: places[13 * suit:13 * suit + 13]))
+
+
+def canonicalize(board, suits=True):
+    """
+
+    Returns the canonical form of a position, and how its tableau piles are numbered in it.
+
+    :param:
+        board (Board): Board of position
+        suits (bool): Rename the suits too, not only sort the tableau piles
+
+    :return:
+        form (bytes): Canonical form, the slots of every pile each followed by SEPARATOR
+        piles (tuple): Pile of the board that is PILE1 + i in the canonical form, for each i
+    """
+    cells = board.cells()
+    slices = [cells[PILE_BASE[pile]:PILE_BASE[pile] + cells[pile]] for pile in range(NUM_PILES)]
+    if suits:
+        order = suitOrder(board)
+        rename = _RENAME[order]
+        slices = [slots.translate(rename) for slots in slices]
+        fixed = [slices[STOCK], slices[DISCARD]] + [slices[SPADES + suit] for suit in order]
+    else:
+        fixed = slices[:PILE1]
+    piles = tuple(sorted(TABLEAU, key=slices.__getitem__))
+    return SEPARATOR.join(fixed + [slices[pile] for pile in piles]) + SEPARATOR, piles
+
+
+def canonicalForm(board, suits=True):
+    """
+
+    Returns the canonical form of a position.
+
+    :param:
+        board (Board): Board of position
+        suits (bool): Rename the suits too, not only sort the tableau piles
+
+    :return:
+        form (bytes): Canonical form
+    """
+    return canonicalize(board, suits)[0]
+
+
+def canonicalHash(board, symmetry='tableau'):
+    """
+
+    Returns a hash of a position that is the same for every position equivalent to it under a symmetry. Like the hash
+    of bytes, it differs from one process to the next unless symmetry is 'none'.
+
+    :param:
+        board (Board): Board of position
+        symmetry (str): One of SYMMETRIES. 'none' is the Zobrist hash of the board.
+
+    :return:
+        hash (int): Hash of position
+    """
+    if symmetry == 'none':
+        return board.zobrist()
+    if symmetry == 'full':
+        return hash(canonicalize(board)[0])
+
+    # The solver asks for this at every node, so the tableau piles are sorted straight from the buffer. Slots of the
+    # other piles are kept in place, with the slots above their tops, which are zero.
+    cells = board.cells()
+    slices = sorted([cells[base:base + cells[pile]] for pile, base in _TABLEAU_BASES])
+    slices.append(cells[:PILE1])
+    slices.append(cells[NUM_PILES:_FIXED_END])
+    return hash(SEPARATOR.join(slices))
+
+
+def renumberCommands(commands, piles, toCanonical=True):
+    """
+
+    Renumbers the tableau piles named by commands between a position and its canonical form.
+
+    :param:
+        commands (list): Commands such as 'move 6 4', as solve returns them
+        piles (tuple): Tableau piles of the position in canonical order, as canonicalize returns them
+        toCanonical (bool): Renumber commands of the position for its canonical form, or else the other way
+
+    :return:
+        commands (list): Renumbered commands
+    """
+    if toCanonical:
+        names = {PILE_COMMANDS[pile]: PILE_COMMANDS[PILE1 + index] for index, pile in enumerate(piles)}
+    else:
+        names = {PILE_COMMANDS[PILE1 + index]: PILE_COMMANDS[pile] for index, pile in enumerate(piles)}
+    renumbered = []
+    for command in commands:
+        words = command.split(' ')
+        if words[0] == 'move':
+            words = [words[0]] + [names.get(word, word) for word in words[1:]]
+        renumbered.append(' '.join(words))
+    return renumbered
+
+
+def tableBytes(positions):
+    """
+
+    Returns the memory a transposition table of so many positions takes: a set of hashes, each a 64-bit int.
+
+    :param:
+        positions (int): Number of positions in the table
+
+    :return:
+        size (int): Bytes of the set and its ints
+    """
+    generator = random.Random(positions)
+    table = {generator.getrandbits(64) for index in range(positions)}
+    return sys.getsizeof(table) + sum(sys.getsizeof(key) for key in table)
+
+
+def measure(boards, nodeLimit, symmetry):
+    """
+
+    Solves positions keying the transposition table on one symmetry.
+
+    :param:
+        boards (list): Boards of positions
+        nodeLimit (int): Most moves to try per position
+        symmetry (str): One of SYMMETRIES
+
+    :return:
+        stats (dict): Positions won and finished, moves tried, seconds, and the positions kept in the largest
+            transposition table and in all of them
+    """
+    # solver keys its transposition table with this module, so it is imported here and not at the top
+    from solver import solve
+
+    stats = {'won': 0, 'complete': 0, 'nodes': 0, 'seconds': 0.0, 'largestTable': 0, 'positions': 0}
+    for board in boards:
+        result = solve(board, nodeLimit, symmetry=symmetry)
+        stats['won'] += result.solved
+        stats['complete'] += result.solved or result.complete
+        stats['nodes'] += result.nodes
+        stats['seconds'] += result.seconds
+        stats['largestTable'] = max(stats['largestTable'], result.positions)
+        stats['positions'] += result.positions
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the moves and memory the symmetries of positions save the '
+                                                 'solver on a fixed set of deals.')
+    parser.add_argument('--deals', default='0:100', help='range of deal numbers, such as 0:100')
+    parser.add_argument('--nodes', type=int, default=200000, help='most moves to try per deal')
+    parser.add_argument('--symmetry', nargs='+', choices=SYMMETRIES, default=list(SYMMETRIES),
+                        help='symmetries to measure')
+    args = parser.parse_args()
+
+    first, last = args.deals.split(':')
+    boards = [dealNumber(number) for number in range(int(first), int(last))]
+    print('%d deals, at most %d moves each' % (len(boards), args.nodes))
+    print('%-8s %5s %9s %11s %9s %11s %13s %14s' % ('symmetry', 'won', 'finished', 'moves', 'seconds', 'positions',
+                                                   'largest table', 'largest MB'))
+    for symmetry in args.symmetry:
+        stats = measure(boards, args.nodes, symmetry)
+        print('%-8s %5d %9d %11d %9.2f %11d %13d %14.1f' % (
+            symmetry, stats['won'], stats['complete'], stats['nodes'], stats['seconds'], stats['positions'],
+            stats['largestTable'], tableBytes(stats['largestTable']) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,46 @@
+"""
+Cards are encoded as small integers: code = suit * 13 + (rank - 1), so the 52 cards of a deck are the codes 0 - 51.
+Only one Card object exists per code, and it is immutable. Whether a card is face up is a property of where it lies,
+so it is kept by the pile holding the card and not by the card itself.
+"""
+
+RANKS = 'A23456789TJQK'
+SUITS = 'shdc'
+SUIT_NAMES = ('Spades', 'Hearts', 'Diamonds', 'Clubs')
+
+# Colour of each suit. 0 = black, 1 = red
+SUIT_COLOURS = (0, 1, 1, 0)
+
+# Lookup tables indexed by card code
+CODE_RANK = tuple(code % 13 + 1 for code in range(52))
+CODE_SUIT = tuple(code // 13 for code in range(52))
+CODE_COLOUR = tuple(SUIT_COLOURS[code // 13] for code in range(52))
+CODE_NAME = tuple(RANKS[code % 13] + SUITS[code // 13] for code in range(52))
+
+
 class Card:
-    def __init__(self, rank, suit):
+    __slots__ = ('__code',)
+
+    def __new__(cls, rank, suit):
         assert type(suit) == str, 'Suit must be a string!'
         assert type(rank) == str or type(rank) == int, 'Rank must be a string or int!'
 
-        self.__shortSuit = suit
-        self.__rank = rank
-        self.__isVisible = False
-        self.__rankVal = 0
-
-        self.__suit = ''
-
-        # Set full name of suit
-        if self.__shortSuit == 's':
-            self.__suit = 'Spades'
-        elif self.__shortSuit == 'h':
-            self.__suit = 'Hearts'
-        elif self.__shortSuit == 'd':
-            self.__suit = 'Diamonds'
-        else:
-            self.__suit = 'Clubs'
-
-        # Set rank value
-        if rank.upper() == 'A':
-            self.__rankVal = 1
-        elif rank.upper() == 'T':
-            self.__rankVal = 10
-        elif rank.upper() == 'J':
-            self.__rankVal = 11
-        elif rank.upper() == 'Q':
-            self.__rankVal = 12
-        elif rank.upper() == 'K':
-            self.__rankVal = 13
-        else:
-            self.__rankVal = int(rank)
+        # Cards are only built once, when this module is imported. Every other call returns the interned card.
+        if suit not in SUITS:
+            suit = 'c'
+        rank = str(rank).upper()
+        if rank == '10':
+            rank = 'T'
+        try:
+            return CARD_BY_NAME[rank + suit]
+        except KeyError:
+            raise ValueError('Invalid rank!')
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Cards are immutable!')
+
+    def __reduce__(self):
+        return cardFromCode, (self.__code,)
 
     def __str__(self):
         """
@@ -46,12 +54,7 @@ class Card:
             cardStr (str): String representation of card.
 
         """
-        visibility = ''
-        if self.__isVisible:
-            return str(self.__rank) + self.__shortSuit
-        else:
-            return '??'
-
+        return CODE_NAME[self.__code]
 
     def __repr__(self):
         """
@@ -65,71 +68,90 @@ class Card:
             cardRep (str): String representation of card class
 
         """
+        return CODE_NAME[self.__code]
 
-        visibility = ''
-        if self.__isVisible:
-            visibility = '+'
-        else:
-            visibility = '-'
-        return str(self.__rank) + self.__shortSuit + visibility
-
-    def isVisibleCard(self):
+    def cardCode(self):
         """
 
-        Returns the visibility of the card. True = is visible, False = not visible
+        Returns integer code of card.
 
         :param:
             None
 
         :return:
-            self.__isVisible (bool): Visibility of card
+            self.__code (int): Code of card, from 0 to 51.
 
         """
 
-        return self.__isVisible
+        return self.__code
 
-    def setVisibility(self, visibility):
+    def cardRank(self):
         """
 
-        Sets the visibility of the card. True = is visible, False = not visible
+        Returns name of card rank.
 
         :param:
-            visibility (bool): Visibility of card
+            None
 
         :return:
-            None
+            rankVal (int): Value of card rank.
 
         """
-        assert type(visibility) == bool, 'The param must be a bool!'
 
-        self.__isVisible = visibility
+        return CODE_RANK[self.__code]
 
-    def cardRank(self):
+    def cardSuit(self):
         """
 
-        Returns name of card rank.
+        Returns name of card suit.
 
         :param:
             None
 
         :return:
-            self.__rankVal (int): Value of card rank.
+            suit (str): Name of card suit.
 
         """
 
-        return self.__rankVal
+        return SUIT_NAMES[CODE_SUIT[self.__code]]
 
-    def cardSuit(self):
+    def cardColour(self):
         """
 
-        Returns name of card suit.
+        Returns colour of card. 0 = black, 1 = red
 
         :param:
             None
 
         :return:
-            self.__rank (str): Name of card rank.
+            colour (int): Colour of card.
 
         """
 
-        return self.__suit
+        return CODE_COLOUR[self.__code]
+
+
+def _buildCard(code):
+    card = object.__new__(Card)
+    object.__setattr__(card, '_Card__code', code)
+    return card
+
+
+def cardFromCode(code):
+    """
+
+    Returns the card with the given code.
+
+    :param:
+        code (int): Code of card, from 0 to 51.
+
+    :return:
+        card (Card): Card with that code.
+
+    """
+    return CARDS[code]
+
+
+# The 52 interned cards, indexed by code and by name ('As', 'Th', ...)
+CARDS = tuple(_buildCard(code) for code in range(52))
+CARD_BY_NAME = {CODE_NAME[code]: CARDS[code] for code in range(52)}
@@ -0,0 +1,109 @@
+"""
+Numbered deals.
+
+Deal number N is made straight from N, like the numbered deals of FreeCell: N is hashed with BLAKE2b into 256 random
+bits, and those bits are read as a mixed radix number that drives a Fisher-Yates shuffle of the 52 cards. No deal
+depends on the deals before it, so any deal can be made on its own, in any order, in any process.
+
+Play a numbered deal with the command 'deal 42'.
+
+Examples:
+    python deals.py 42 --save deal42.txt
+    python deals.py 0 --count 100000 --bench
+"""
+import argparse
+import hashlib
+import time
+
+from board import dealBoard
+
+# Largest deal number, since numbers are hashed as 8 bytes
+MAX_DEAL = 2 ** 64 - 1
+
+_PERSON = b'klondike-deal'
+
+
+def dealCodes(number):
+    """
+
+    Returns the card order of a numbered deal.
+
+    :param:
+        number (int): Number of deal, from 0 to MAX_DEAL
+
+    :return:
+        codes (list): The 52 card codes in deal order, as dealBoard takes them
+
+    """
+    assert 0 <= number <= MAX_DEAL, 'Deal number is out of range!'
+
+    digest = hashlib.blake2b(number.to_bytes(8, 'little'), digest_size=32, person=_PERSON).digest()
+    value = int.from_bytes(digest, 'little')
+
+    # 256 bits cover the 226 bits of 52! with room to spare, so the shuffle is as good as uniform
+    codes = list(range(52))
+    for i in range(51, 0, -1):
+        value, j = divmod(value, i + 1)
+        codes[i], codes[j] = codes[j], codes[i]
+    return codes
+
+
+def dealNumber(number):
+    """
+
+    Returns the board of a numbered deal, laid out like Game1-start.txt.
+
+    :param:
+        number (int): Number of deal
+
+    :return:
+        board (Board): Dealt board
+
+    """
+    return dealBoard(dealCodes(number))
+
+
+def dealRange(first, count):
+    """
+
+    Returns the card orders of a run of numbered deals, packed 52 bytes per deal.
+
+    :param:
+        first (int): Number of first deal
+        count (int): Number of deals
+
+    :return:
+        codes (bytearray): Card codes of deal first + i at codes[52 * i:52 * i + 52]
+
+    """
+    codes = bytearray()
+    for number in range(first, first + count):
+        codes += bytes(dealCodes(number))
+    return codes
+
+
+def main():
+    # The engine deals with this module, so it is only needed here
+    from engine import saveText
+
+    parser = argparse.ArgumentParser(description='Make numbered Klondike deals.')
+    parser.add_argument('number', type=int, help='number of deal')
+    parser.add_argument('--save', help='save file to write the deal to')
+    parser.add_argument('--count', type=int, default=1, help='number of deals to make, starting at number')
+    parser.add_argument('--bench', action='store_true', help='time making the deals')
+    args = parser.parse_args()
+
+    if args.bench:
+        start = time.perf_counter()
+        dealRange(args.number, args.count)
+        seconds = time.perf_counter() - start
+        print('%d deals in %.3f s, %.0f deals/min' % (args.count, seconds, args.count / seconds * 60))
+    elif args.save:
+        with open(args.save, 'w') as newGame:
+            newGame.write(saveText(dealNumber(args.number)))
+    else:
+        print(saveText(dealNumber(args.number)), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,22 @@
-from card import Card
+from board import Board, CODE_MASK, FACE_UP
+from card import Card, CARDS, CODE_NAME
 
 
 class Deck:
-    def __init__(self, name):
+    def __init__(self, name, board=None, pile=0):
         assert type(name) == str, 'Name of deck must be a string!'
 
+        # A deck is a view of one pile of a board. A deck made on its own gets a board of its own.
+        if board is None:
+            board = Board()
+
         self.__name = name
-        self.__deck = []
+        self.__board = board
+        self.__pile = pile
+
+        # Last text rendered without and with hidden cards shown, with the slots it was rendered from. A deck is only
+        # rendered again once its slots differ, so unchanged decks cost one compare.
+        self.__rendered = [(None, ''), (None, '')]
 
     def __str__(self):
         """
@@ -21,14 +31,7 @@ class Deck:
 
         """
 
-        temp = self.__deck.copy()
-        temp.reverse()
-
-        result = self.__name + ' [ '
-        for card in temp:
-            result += str(card) + ' '
-        result += ']'
-        return result
+        return self.renderDeck(False)
 
     def __repr__(self):
         """
@@ -43,14 +46,26 @@ class Deck:
 
         """
 
-        temp = self.__deck.copy()
-        temp.reverse()
+        return self.renderDeck(True)
+
+    def renderDeck(self, reveal):
+        """
+
+        Returns string representation of deck, reusing the last one if no card was pushed, popped or flipped since.
+
+        :param:
+            reveal (bool): Show cards that are not visible, as repr does
+
+        :return:
+            deckStr (str): String representation of deck.
 
-        result = self.__name + ' [ '
-        for card in temp:
-            result += repr(card) + ' '
-        result += ']'
-        return result
+        """
+        slots = self.__board.pileSlots(self.__pile)
+        rendered = self.__rendered[reveal]
+        if rendered[0] != slots:
+            rendered = (slots, deckText(self.__name, slots, reveal))
+            self.__rendered[reveal] = rendered
+        return rendered[1]
 
     def deckName(self):
         """
@@ -66,6 +81,20 @@ class Deck:
         """
         return self.__name
 
+    def deckPile(self):
+        """
+
+        Returns index of the board pile the deck shows
+
+        :param:
+            None
+
+        :return:
+            self.__pile (int): Index of pile
+
+        """
+        return self.__pile
+
     def deckSize(self):
         """
 
@@ -75,11 +104,11 @@ class Deck:
             None
 
         :return:
-            self.__size (int): Size of deck
+            size (int): Size of deck
 
         """
 
-        return len(self.__deck)
+        return self.__board.pileSize(self.__pile)
 
     def isDeckEmpty(self):
         """
@@ -90,26 +119,30 @@ class Deck:
             None
 
         :return:
-            self.__size <= 0 (bool): If deck is empty
+            isEmpty (bool): If deck is empty
 
         """
 
-        return len(self.__deck) <= 0
+        return self.__board.pileSize(self.__pile) <= 0
 
-    def pushDeck(self, card):
+    def pushDeck(self, card, visibility=False):
         """
 
         Pushes card to top of deck.
 
         :param:
             card (Card): Card to push to deck
+            visibility (bool): Visibility of card. True = is visible, False = not visible
         :return:
             None
 
         """
         assert type(card) == Card, 'You must push a card from the Card class!'
 
-        self.__deck.append(card)
+        if visibility:
+            self.__board.push(self.__pile, card.cardCode() | FACE_UP)
+        else:
+            self.__board.push(self.__pile, card.cardCode())
 
     def popDeck(self):
         """
@@ -122,10 +155,39 @@ class Deck:
         :return:
             card (Card): Card from top of deck
         """
-        if len(self.__deck) <= 0:
+        slot = self.__board.pop(self.__pile)
+        if slot is None:
             return None
         else:
-            return self.__deck.pop(-1)
+            return CARDS[slot & CODE_MASK]
+
+    def pushDeckMany(self, slots):
+        """
+
+        Pushes slots to top of deck in one slice, the first one lowest.
+
+        :param:
+            slots (bytes): Card codes with FACE_UP set for visible cards, from bottom to top, as popDeckMany returns
+
+        :return:
+            None
+
+        """
+        self.__board.pushMany(self.__pile, slots)
+
+    def popDeckMany(self, count):
+        """
+
+        Removes cards from top of deck in one slice and returns their slots, to be pushed onto another deck with
+        pushDeckMany.
+
+        :Param:
+            count (int): Number of cards to remove, at most the size of the deck
+
+        :return:
+            slots (bytes): Card codes with FACE_UP set for visible cards, from bottom to top
+        """
+        return self.__board.popMany(self.__pile, count)
 
     def peekDeck(self):
         """
@@ -139,7 +201,90 @@ class Deck:
             card (Card): Card from top of deck
         """
 
-        if len(self.__deck) > 0:
-            return self.__deck[-1]
-        else:
+        slot = self.__board.peek(self.__pile)
+        if slot is None:
             return None
+        else:
+            return CARDS[slot & CODE_MASK]
+
+    def isTopVisible(self):
+        """
+
+        Returns the visibility of the card on top of deck. True = is visible, False = not visible or deck is empty
+
+        :Param:
+            None
+
+        :return:
+            visibility (bool): Visibility of top card
+        """
+
+        return self.__board.isTopVisible(self.__pile)
+
+    def setTopVisibility(self, visibility):
+        """
+
+        Sets the visibility of the card on top of deck. Does nothing if the deck is empty.
+
+        :param:
+            visibility (bool): Visibility of card
+
+        :return:
+            None
+
+        """
+        assert type(visibility) == bool, 'The param must be a bool!'
+
+        self.__board.setTopVisibility(self.__pile, visibility)
+
+
+def deckText(name, slots, reveal):
+    """
+
+    Returns string representation of a deck, with the top card first. Cards that are not visible are shown as ?? unless
+    reveal is set, in which case every card is shown followed by + if visible and - if not, as in save files.
+
+    :param:
+        name (str): Name of deck
+        slots (bytes): Slots of deck from bottom to top
+        reveal (bool): Show cards that are not visible
+
+    :return:
+        deckStr (str): String representation of deck.
+
+    """
+    if reveal:
+        tokens = _REVEALED_TOKENS
+    else:
+        tokens = _SHOWN_TOKENS
+    return name + ' [ ' + ''.join([tokens[slot] for slot in reversed(slots)]) + ']'
+
+
+def _slotToken(slot, reveal):
+    """
+
+    Returns the text of one slot in a deck, as deckText shows it.
+
+    :param:
+        slot (int): Card code, with FACE_UP set if the card is visible
+        reveal (bool): Show cards that are not visible
+
+    :return:
+        token (str): Text of slot, empty if the slot is not a card
+
+    """
+    code = slot & CODE_MASK
+    if code >= 52:
+        return ''
+    if reveal:
+        if slot & FACE_UP:
+            return CODE_NAME[code] + '+ '
+        return CODE_NAME[code] + '- '
+    if slot & FACE_UP:
+        return CODE_NAME[code] + ' '
+    return '?? '
+
+
+# Text of every slot value in a deck, as shown in play and as written to save files
+_SHOWN_TOKENS = tuple(_slotToken(slot, False) for slot in range(128))
+_REVEALED_TOKENS = tuple(_slotToken(slot, True) for slot in range(128))
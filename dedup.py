@@ -0,0 +1,625 @@
+"""
+Deduplication index of saved games.
+
+Every game is known by the fingerprint of its position: the BLAKE2b hash of its canonical form (see canonical.py),
+which is the same for every save of the position however the game got there and whatever format it was saved in, and
+for positions that only differ in the order of the tableau piles or the names of the suits. A DedupIndex keeps the
+fingerprints in one file that is a hash table on disk, mapped with mmap, so looking up a position reads one or two
+buckets and the index is never loaded into memory as a whole. Each bucket counts the games seen with the position and
+points at the name of the first one, kept in a names file beside the index.
+
+Examples:
+    python dedup.py add corpus.kld saves/ Game1-start.txt games.kla
+    python dedup.py check corpus.kld save1.txt
+    python dedup.py report corpus.kld
+    python dedup.py bench --entries 1000000
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import random
+import resource
+import struct
+import tempfile
+import time
+
+from archive import ARCHIVE_EXTENSION, Archive, saveFiles
+from board import Board
+from canonical import canonicalForm
+from engine import readSave
+
+INDEX_MAGIC = b'KLD'
+INDEX_VERSION = 2
+NAMES_EXTENSION = '.names'
+
+# Header: magic, version, 1 if the index was closed cleanly, number of buckets, number of positions and number of games
+# added. Each bucket is the fingerprint of a position, the number of games seen with it and the offset of the name of
+# the first of them in the names file. A fingerprint of all zeros marks an empty bucket.
+INDEX_HEADER = struct.Struct('<3sBIQQQ')
+BUCKET = struct.Struct('<16sIQ')
+KEY_SIZE = 16
+BUCKET_SIZE = BUCKET.size
+EMPTY = bytes(KEY_SIZE)
+COUNT = struct.Struct('<I')
+
+# Name offset of games added without a name
+NO_NAME = 2 ** 64 - 1
+
+# The table doubles once more than LOAD_LIMIT of its buckets are in use, which keeps probe sequences short
+LOAD_LIMIT = 0.7
+
+# Names are written to the names file once this many bytes of them are waiting
+NAMES_BUFFER = 1 << 20
+
+
+class DedupIndex:
+    def __init__(self, fileName, capacity=1 << 16):
+        """
+
+        Opens an index, creating it if it does not exist. An index that was not closed cleanly is counted again, and
+        the names it had not written yet are forgotten.
+
+        :param:
+            fileName (str): Name of index
+            capacity (int): Number of buckets of a new index, rounded up to a power of two
+
+        """
+        if not os.path.exists(fileName):
+            createIndex(fileName, 1 << max(capacity - 1, 1).bit_length())
+
+        self.__fileName = fileName
+        self.__open()
+
+        # Names wait in a buffer before they are appended to the names file
+        self.__names = open(fileName + NAMES_EXTENSION, 'a+b')
+        self.__namesEnd = self.__names.seek(0, os.SEEK_END)
+        self.__pending = bytearray()
+
+        if not self.__clean:
+            self.__recount()
+        self.__clean = False
+        self.__writeHeader()
+
+    def __open(self):
+        """
+
+        Maps the index file and reads its header.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__file = open(self.__fileName, 'r+b')
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+        magic, version, clean, self.__capacity, self.__entries, self.__games = INDEX_HEADER.unpack_from(self.__map)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or \
+                len(self.__map) != INDEX_HEADER.size + self.__capacity * BUCKET_SIZE:
+            self.__map.close()
+            self.__file.close()
+            raise ValueError('Not a dedup index!')
+        self.__clean = clean == 1
+        self.__mask = self.__capacity - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.__entries
+
+    def __contains__(self, key):
+        return self.__find(key)[1]
+
+    def close(self):
+        """
+
+        Writes out the names waiting and the header, and closes the index.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__clean = True
+        self.flush()
+        self.__map.close()
+        self.__file.close()
+        self.__names.close()
+
+    def flush(self):
+        """
+
+        Writes the names waiting and the header, and flushes the index to disk.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__writeNames()
+        self.__names.flush()
+        self.__writeHeader()
+        self.__map.flush()
+
+    def __writeNames(self):
+        """
+
+        Appends the names waiting to the names file.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        if self.__pending:
+            self.__names.seek(0, os.SEEK_END)
+            self.__names.write(self.__pending)
+            self.__namesEnd = self.__names.tell()
+            self.__pending = bytearray()
+
+    def __writeHeader(self):
+        INDEX_HEADER.pack_into(self.__map, 0, INDEX_MAGIC, INDEX_VERSION, 1 if self.__clean else 0, self.__capacity,
+                               self.__entries, self.__games)
+
+    def __find(self, key):
+        """
+
+        Finds the bucket of a fingerprint, or the bucket it would go in.
+
+        :param:
+            key (bytes): Fingerprint
+
+        :return:
+            offset (int): Offset of the bucket in the index
+            found (bool): True if the bucket holds key
+
+        """
+        view = self.__map
+        mask = self.__mask
+        bucket = int.from_bytes(key[:8], 'little') & mask
+        while True:
+            offset = INDEX_HEADER.size + bucket * BUCKET_SIZE
+            stored = view[offset:offset + KEY_SIZE]
+            if stored == key:
+                return offset, True
+            if stored == EMPTY:
+                return offset, False
+            bucket = (bucket + 1) & mask
+
+    def seen(self, key):
+        """
+
+        Returns the number of games added with a position.
+
+        :param:
+            key (bytes): Fingerprint of position
+
+        :return:
+            count (int): Number of games, 0 if the position was never added
+
+        """
+        offset, found = self.__find(key)
+        if not found:
+            return 0
+        return COUNT.unpack_from(self.__map, offset + KEY_SIZE)[0]
+
+    def add(self, key, name=None):
+        """
+
+        Adds a game with a position.
+
+        :param:
+            key (bytes): Fingerprint of position, as positionKey returns
+            name (str): Name of game, kept if it is the first game with the position
+
+        :return:
+            count (int): Number of games added with the position, 1 if it is new
+
+        """
+        assert len(key) == KEY_SIZE and key != EMPTY, 'Fingerprint must be 16 bytes, not all zeros!'
+        self.__games += 1
+        offset, found = self.__find(key)
+        if found:
+            count = COUNT.unpack_from(self.__map, offset + KEY_SIZE)[0] + 1
+            COUNT.pack_into(self.__map, offset + KEY_SIZE, count)
+            return count
+
+        if (self.__entries + 1) > LOAD_LIMIT * self.__capacity:
+            self.__grow()
+            offset = self.__find(key)[0]
+
+        nameOffset = NO_NAME
+        if name is not None:
+            nameOffset = self.__namesEnd + len(self.__pending)
+            self.__pending += name.encode('utf-8') + b'\n'
+            if len(self.__pending) >= NAMES_BUFFER:
+                self.__writeNames()
+        BUCKET.pack_into(self.__map, offset, key, 1, nameOffset)
+        self.__entries += 1
+        return 1
+
+    def firstName(self, key):
+        """
+
+        Returns the name of the first game added with a position.
+
+        :param:
+            key (bytes): Fingerprint of position
+
+        :return:
+            name (str): Name of game, None if the position was never added or the game had no name
+
+        """
+        offset, found = self.__find(key)
+        if not found:
+            return None
+        return self.__readName(BUCKET.unpack_from(self.__map, offset)[2])
+
+    def __readName(self, nameOffset):
+        """
+
+        Reads a name from the names file.
+
+        :param:
+            nameOffset (int): Offset of name
+
+        :return:
+            name (str): Name, None for NO_NAME
+
+        """
+        if nameOffset == NO_NAME:
+            return None
+        if nameOffset >= self.__namesEnd:
+            start = nameOffset - self.__namesEnd
+            return self.__pending[start:self.__pending.index(b'\n', start)].decode('utf-8')
+        self.__names.seek(nameOffset)
+        return self.__names.readline().rstrip(b'\n').decode('utf-8')
+
+    def duplicates(self):
+        """
+
+        Yields every position added with more than one game, reading the index in order.
+
+        :param:
+            None
+
+        :return:
+            duplicates (generator): (fingerprint, number of games, name of first game) tuples
+
+        """
+        for key, count, nameOffset in self.__buckets():
+            if count > 1:
+                yield key, count, self.__readName(nameOffset)
+
+    def __buckets(self):
+        """
+
+        Yields every bucket in use, reading the index a block at a time.
+
+        :param:
+            None
+
+        :return:
+            buckets (generator): (fingerprint, number of games, name offset) tuples
+
+        """
+        view = self.__map
+        block = 4096 * BUCKET_SIZE
+        for start in range(INDEX_HEADER.size, len(view), block):
+            for bucket in BUCKET.iter_unpack(view[start:min(start + block, len(view))]):
+                if bucket[0] != EMPTY:
+                    yield bucket
+
+    def stats(self):
+        """
+
+        Returns the counters of the index.
+
+        :param:
+            None
+
+        :return:
+            stats (dict): Positions, games, duplicate games, buckets, load factor and bytes on disk
+
+        """
+        return {'positions': self.__entries, 'games': self.__games, 'duplicates': self.__games - self.__entries,
+                'buckets': self.__capacity, 'load': self.__entries / self.__capacity,
+                'bytes': len(self.__map) + self.__namesEnd + len(self.__pending)}
+
+    def __recount(self):
+        """
+
+        Counts the positions and games again, after the index was not closed cleanly. Names that were still waiting
+        to be written are lost, so buckets pointing past the end of the names file lose their name.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__entries = 0
+        self.__games = 0
+        view = self.__map
+        for offset in range(INDEX_HEADER.size, len(view), BUCKET_SIZE):
+            if view[offset:offset + KEY_SIZE] != EMPTY:
+                key, count, nameOffset = BUCKET.unpack_from(view, offset)
+                self.__entries += 1
+                self.__games += count
+                if nameOffset != NO_NAME and nameOffset >= self.__namesEnd:
+                    BUCKET.pack_into(view, offset, key, count, NO_NAME)
+
+    def __grow(self):
+        """
+
+        Moves every bucket to a new file with twice the buckets.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        newName = self.__fileName + '.new'
+        capacity = 2 * self.__capacity
+        createIndex(newName, capacity)
+        with open(newName, 'r+b') as newFile:
+            view = mmap.mmap(newFile.fileno(), 0)
+            mask = capacity - 1
+            for bucket in self.__buckets():
+                index = int.from_bytes(bucket[0][:8], 'little') & mask
+                offset = INDEX_HEADER.size + index * BUCKET_SIZE
+                while view[offset:offset + KEY_SIZE] != EMPTY:
+                    index = (index + 1) & mask
+                    offset = INDEX_HEADER.size + index * BUCKET_SIZE
+                BUCKET.pack_into(view, offset, *bucket)
+            INDEX_HEADER.pack_into(view, 0, INDEX_MAGIC, INDEX_VERSION, 0, capacity, self.__entries, self.__games)
+            view.flush()
+            view.close()
+
+        self.__map.close()
+        self.__file.close()
+        os.replace(newName, self.__fileName)
+        self.__open()
+
+
+def createIndex(fileName, capacity):
+    """
+
+    Writes an empty index.
+
+    :param:
+        fileName (str): Name of index
+        capacity (int): Number of buckets, a power of two
+
+    :return:
+        None
+    """
+    assert capacity & (capacity - 1) == 0, 'Capacity must be a power of two!'
+    with open(fileName, 'wb') as newIndex:
+        newIndex.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 1, capacity, 0, 0))
+        newIndex.truncate(INDEX_HEADER.size + capacity * BUCKET_SIZE)
+
+
+def positionKey(board):
+    """
+
+    Returns the fingerprint of a position, the same for every position equivalent to it.
+
+    :param:
+        board (Board): Board of position
+
+    :return:
+        key (bytes): 16 byte fingerprint, never all zeros
+    """
+    return formKey(canonicalForm(board))
+
+
+def formKey(form):
+    """
+
+    Returns the fingerprint of a canonical form.
+
+    :param:
+        form (bytes): Canonical form of position, as canonical.canonicalize returns it
+
+    :return:
+        key (bytes): 16 byte fingerprint, never all zeros
+    """
+    key = hashlib.blake2b(form, digest_size=KEY_SIZE, person=b'klondike-dedup' + bytes([INDEX_VERSION])).digest()
+    if key == EMPTY:
+        key = b'\x01' + key[1:]
+    return key
+
+
+def pathGames(paths):
+    """
+
+    Yields the games named by paths: save files, text or binary, directories of save files and game archives.
+
+    :param:
+        paths (list): Names of save files, directories and archives
+
+    :return:
+        games (generator): (name, board) pairs, games of an archive named archive:index. The board is None for files
+            that can not be read as a save.
+    """
+    for path in paths:
+        if path.endswith(ARCHIVE_EXTENSION):
+            with Archive(path, create=False) as archive:
+                for index in range(len(archive)):
+                    yield '%s:%d' % (path, index), archive.board(index)
+            continue
+        for fileName in saveFiles(path):
+            board = Board()
+            try:
+                for pile, slots in readSave(fileName):
+                    board.pushMany(pile, slots)
+            except (OSError, ValueError, AssertionError):
+                board = None
+            yield fileName, board
+
+
+def addGames(index, paths):
+    """
+
+    Adds the games named by paths to an index.
+
+    :param:
+        index (DedupIndex): Index to add to
+        paths (list): Names of save files, directories and archives
+
+    :return:
+        duplicates (list): (name, name of first game with the same position) pairs of games seen before
+        unreadable (list): Names of files that could not be read as a save
+    """
+    duplicates = []
+    unreadable = []
+    for name, board in pathGames(paths):
+        if board is None:
+            unreadable.append(name)
+            continue
+        key = positionKey(board)
+        if index.add(key, name) > 1:
+            duplicates.append((name, index.firstName(key)))
+    return duplicates, unreadable
+
+
+def bench(entries=1000000, lookups=100000, seed=1):
+    """
+
+    Fills a new index with random fingerprints and times adding and looking them up.
+
+    :param:
+        entries (int): Number of fingerprints added
+        lookups (int): Number of lookups of fingerprints added and of fingerprints never added
+        seed (int): Seed of fingerprints
+
+    :return:
+        stats (dict): Adds per second, microseconds per lookup that hits and that misses, stats of the index, the most
+            memory the process had resident, mapped pages included, and its heap at the end, in bytes
+    """
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        with DedupIndex(os.path.join(directory, 'bench.kld')) as index:
+            start = time.perf_counter()
+            for i in range(entries):
+                index.add(rnd.randbytes(KEY_SIZE))
+            addRate = entries / (time.perf_counter() - start)
+
+            # Fingerprints added come back from the same seed
+            again = random.Random(seed)
+            present = [again.randbytes(KEY_SIZE) for i in range(min(lookups, entries))]
+            absent = [rnd.randbytes(KEY_SIZE) for i in range(lookups)]
+            start = time.perf_counter()
+            for key in present:
+                index.seen(key)
+            hit = 1e6 * (time.perf_counter() - start) / len(present)
+            start = time.perf_counter()
+            for key in absent:
+                index.seen(key)
+            miss = 1e6 * (time.perf_counter() - start) / len(absent)
+            stats = index.stats()
+
+    stats.update({'addsPerSecond': addRate, 'hitMicros': hit, 'missMicros': miss,
+                  'maxRSS': 1024 * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'heap': heapBytes()})
+    return stats
+
+
+def heapBytes():
+    """
+
+    Returns the memory of the process that is not mapped from files, which leaves out the pages of an index: those
+    are page cache, that the system drops when it needs the memory.
+
+    :param:
+        None
+
+    :return:
+        bytes (int): Resident anonymous memory, None where /proc is not available
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('RssAnon:'):
+                    return 1024 * int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find duplicate positions in collections of saved games.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='add games to an index and list the ones seen before')
+    add.add_argument('index', help='index to add to, created if needed')
+    add.add_argument('paths', nargs='+', help='save files, directories of save files and game archives')
+    add.add_argument('--quiet', action='store_true', help='only show the counts')
+    check = commands.add_parser('check', help='tell if the positions of games were seen, without adding them')
+    check.add_argument('index', help='index to look in')
+    check.add_argument('paths', nargs='+', help='save files, directories of save files and game archives')
+    report = commands.add_parser('report', help='list every position seen in more than one game')
+    report.add_argument('index', help='index to read')
+    load = commands.add_parser('bench', help='time a new index of random fingerprints')
+    load.add_argument('--entries', type=int, default=1000000, help='number of fingerprints added')
+    load.add_argument('--lookups', type=int, default=100000, help='number of lookups that hit and that miss')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        stats = bench(args.entries, args.lookups)
+        print('%d positions added at %.0f/s, lookup %.2f us hit, %.2f us miss' % (
+            stats['positions'], stats['addsPerSecond'], stats['hitMicros'], stats['missMicros']))
+        print('%d buckets, load %.2f, %.1f MB on disk, %.1f MB most resident with mapped pages' % (
+            stats['buckets'], stats['load'], stats['bytes'] / 1e6, stats['maxRSS'] / 1e6))
+        if stats['heap'] is not None:
+            print('%.1f MB heap, lookup keys included' % (stats['heap'] / 1e6))
+        return
+
+    if args.command != 'add' and not os.path.exists(args.index):
+        parser.error('%s does not exist' % args.index)
+    with DedupIndex(args.index) as index:
+        if args.command == 'add':
+            duplicates, unreadable = addGames(index, args.paths)
+            for name in unreadable:
+                print('%s: not a save file' % name)
+            if not args.quiet:
+                for name, first in duplicates:
+                    print('%s: same position as %s' % (name, first))
+            stats = index.stats()
+            print('%d duplicates added, %d positions in %d games' % (len(duplicates), stats['positions'],
+                                                                    stats['games']))
+        elif args.command == 'check':
+            for name, board in pathGames(args.paths):
+                if board is None:
+                    print('%s: not a save file' % name)
+                    continue
+                key = positionKey(board)
+                count = index.seen(key)
+                if count:
+                    print('%s: seen in %d games, first %s' % (name, count, index.firstName(key)))
+                else:
+                    print('%s: new' % name)
+        else:
+            for key, count, first in index.duplicates():
+                print('%s %d games, first %s' % (key.hex(), count, first))
+            stats = index.stats()
+            print('%d positions in %d games, %d duplicates' % (stats['positions'], stats['games'],
+                                                               stats['duplicates']))
+
+
+if __name__ == '__main__':
+    main()
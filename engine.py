@@ -0,0 +1,854 @@
+"""
+Headless Klondike engine.
+
+Engine runs the command language of klondike.py (move, discard, reset, deal, load, save, board, cheat, hint,
+comment) on a Board without printing anything. Every command returns a Result saying whether it worked, the error code
+if it did not, and the piles it changed. Solitaire in klondike.py is the interactive front end of an Engine.
+
+Run a batch of command scripts with: python engine.py samplegame.txt --repeat 1000
+"""
+import argparse
+import struct
+import time
+from collections import deque, namedtuple
+
+from board import Board, STOCK, DISCARD, SPADES, PILE1, NUM_PILES, PILE_NAMES, PILE_BASE, FACE_UP, CODE_MASK, \
+    SLOT_VALUES, PILE_CAPACITY
+from card import CARD_BY_NAME, Card
+from deals import MAX_DEAL, dealNumber
+from deck import deckText
+from rules import SLOT_RANK, FOUNDATION, FOUNDATION_NEXT
+
+# Error codes
+OK = 0
+NO_CARD = 1
+INVALID_MOVE = 2
+STOCK_EMPTY = 3
+STOCK_NOT_EMPTY = 4
+BAD_ARGUMENTS = 5
+NO_SUCH_DECK = 6
+FROM_SUIT = 7
+BAD_COMMAND = 8
+FILE_NOT_FOUND = 9
+BAD_SAVE_FORMAT = 10
+BAD_FILE_NAME = 11
+NOTHING_TO_UNDO = 12
+NOTHING_TO_REDO = 13
+NO_SUCH_DEAL = 14
+TOO_MANY_CARDS = 15
+PILE_FULL = 16
+FILE_NOT_WRITTEN = 17
+
+ERROR_MESSAGES = {NO_CARD: 'No card in from deck!',
+                  INVALID_MOVE: 'Not a valid move!',
+                  STOCK_EMPTY: 'Cannot discard, stock is empty!',
+                  STOCK_NOT_EMPTY: 'Stock must be empty!',
+                  BAD_ARGUMENTS: 'Invalid number of arguments for "%s"',
+                  NO_SUCH_DECK: 'Deck(s) do not exist!',
+                  FROM_SUIT: 'Cannot move a card out of a suit deck!',
+                  BAD_COMMAND: 'Not a valid command. Try again!',
+                  FILE_NOT_FOUND: '%s cannot be opened: file was not found!',
+                  BAD_SAVE_FORMAT: 'File in incorrect save format!',
+                  BAD_FILE_NAME: 'Invalid file name. File must end with .txt or .klb',
+                  NOTHING_TO_UNDO: 'Nothing to undo!',
+                  NOTHING_TO_REDO: 'Nothing to redo!',
+                  NO_SUCH_DEAL: 'There is no deal number %s!',
+                  TOO_MANY_CARDS: 'Binary saves can not hold more than 52 cards!',
+                  PILE_FULL: 'File can not be loaded: a pile would hold more than 52 cards!',
+                  FILE_NOT_WRITTEN: '%s cannot be written!'}
+
+# Binary save files: magic, version, number of cards, the length of each pile and the slots of every pile from bottom to
+# top, pile after pile, padded with zeros to 52. The FACE_UP bit of each slot is the face up mask. 69 bytes in all.
+BINARY_EXTENSION = '.klb'
+BINARY_MAGIC = b'KL'
+BINARY_VERSION = 1
+BINARY_FORMAT = struct.Struct('<2sBB13s52s')
+
+# Destination of a move to the foundation of the moved card's suit
+SUIT = NUM_PILES
+
+# Moves are (op, fromPile, toPile) tuples. Discard and reset moves always go from STOCK to DISCARD and back.
+OP_PILE = 0
+OP_SUIT = 1
+OP_DISCARD = 2
+OP_RESET = 3
+
+# Ops of the other commands, as parseCommand gives them. a is the deal number or file name for deal, load and save, and
+# the error code for OP_FAIL. board, cheat, hint and comment only produce output, so they are OP_NOTHING.
+OP_DEAL = 4
+OP_LOAD = 5
+OP_SAVE = 6
+OP_UNDO = 7
+OP_REDO = 8
+OP_NOTHING = 9
+OP_FAIL = 10
+
+# Undo records are ints: op in bits 0 - 1, from pile in bits 2 - 5, to pile in bits 6 - 9, number of cards moved in
+# bits 10 - 15, bit 16 set if the move turned the new top card of the from pile face up, and for discards the
+# visibility the discarded cards had before in bits 17 - 19.
+
+# Deck names used by the move command
+COMMAND_PILES = {'1': PILE1, '2': PILE1 + 1, '3': PILE1 + 2, '4': PILE1 + 3, '5': PILE1 + 4, '6': PILE1 + 5,
+                 '7': PILE1 + 6, 'stock': STOCK, 'suit': SUIT}
+
+# Number of arguments each command takes, None if any number is accepted
+COMMAND_ARGUMENTS = {'move': 2, 'discard': 0, 'reset': 0, 'board': 0, 'cheat': 0, 'hint': 0, 'comment': None,
+                     'deal': 1, 'load': 1, 'save': 1, 'undo': 0, 'redo': 0}
+
+PILE_COMMANDS = {pile: name for name, pile in COMMAND_PILES.items()}
+
+PILE_INDEX = {name: pile for pile, name in enumerate(PILE_NAMES)}
+
+Result = namedtuple('Result', ['success', 'error', 'changed'])
+
+# Results without changes are shared instead of being built for every command
+DONE = Result(True, OK, ())
+FAILED = {error: Result(False, error, ()) for error in ERROR_MESSAGES}
+
+
+class Engine:
+    def __init__(self, board=None, loadCache=None, historyLimit=None, validateHash=False, journal=None):
+        if board is None:
+            board = Board()
+
+        self.board = board
+
+        # Parsed save files by file name. Batch runs share one cache so each save file is read once.
+        self.__loadCache = loadCache
+
+        # Undo records of the moves made, and of the moves undone that can be redone. With a history limit only the
+        # newest moves are kept, so long sessions use bounded memory.
+        self.__history = deque(maxlen=historyLimit)
+        self.__future = []
+
+        # Check the position hash against a full recompute after every move. Slow, for testing only.
+        self.__validateHash = validateHash
+
+        # Journal every move and change of position is written to (see journal.py), starting with this one
+        self.__journal = journal
+        if journal is not None:
+            journal.jump(board)
+
+    # Commands
+    def apply(self, command):
+        """
+
+        Runs one command of the command language. Nothing is printed.
+
+        :param:
+            command (str): Command, such as 'move 6 4'
+
+        :return:
+            result (Result): Whether the command worked, its error code and the piles it changed
+
+        """
+        op, a, b = parseCommand(command)
+        if op == OP_PILE:
+            return self.toPile(a, b)
+        elif op == OP_SUIT:
+            return self.toSuit(a)
+        elif op == OP_DISCARD:
+            return self.discard()
+        elif op == OP_RESET:
+            return self.reset()
+        elif op == OP_DEAL:
+            return self.deal(a)
+        elif op == OP_LOAD:
+            return self.load(a)
+        elif op == OP_SAVE:
+            return self.save(a)
+        elif op == OP_UNDO:
+            return self.undo()
+        elif op == OP_REDO:
+            return self.redo()
+        elif op == OP_FAIL:
+            return FAILED[a]
+        return DONE
+
+    def applyMove(self, move):
+        """
+
+        Runs a move made by the move generator.
+
+        :param:
+            move (tuple): Move as (op, fromPile, toPile)
+
+        :return:
+            result (Result): Result of move
+
+        """
+        op = move[0]
+        if op == OP_PILE:
+            return self.toPile(move[1], move[2])
+        elif op == OP_SUIT:
+            return self.toSuit(move[1])
+        elif op == OP_DISCARD:
+            return self.discard()
+        return self.reset()
+
+    def toSuit(self, pile):
+        """
+
+        Moves the top card of a pile to the foundation of its suit.
+
+        :param:
+            pile (int): Index of pile to move card from
+
+        :return:
+            result (Result): Result of move
+
+        """
+        board = self.board
+        slot = board.peek(pile)
+        if slot is None:
+            return FAILED[NO_CARD]
+
+        # An empty foundation takes an ace, and any other the rank above its top card. Only the rank is checked, since
+        # loaded saves can put any card on a foundation.
+        suitPile = FOUNDATION[slot]
+        suitSlot = board.peek(suitPile)
+        if SLOT_RANK[slot] != (1 if suitSlot is None else FOUNDATION_NEXT[suitSlot]):
+            return FAILED[INVALID_MOVE]
+
+        board.push(suitPile, board.pop(pile))
+        flipped = board.pileSize(pile) > 0 and not board.isTopVisible(pile)
+        board.setTopVisibility(pile, True)
+        self.__record(OP_SUIT | pile << 2 | suitPile << 6 | 1 << 10 | flipped << 16)
+        return Result(True, OK, (pile, suitPile))
+
+    def toPile(self, fromPile, toPile):
+        """
+
+        Moves the visible cards of a pile that can go on another pile. The run moved starts at the card one rank below
+        the top card of the other pile, or at a king if the other pile is empty.
+
+        :param:
+            fromPile (int): Index of pile to move cards from
+            toPile (int): Index of pile to move cards to
+
+        :return:
+            result (Result): Result of move
+
+        """
+        board = self.board
+        cells = board.cells()
+        size = cells[fromPile]
+        if size == 0:
+            return FAILED[NO_CARD]
+        if fromPile == toPile:
+            return FAILED[INVALID_MOVE]
+
+        base = PILE_BASE[fromPile]
+        runStart = base + board.runStart(fromPile)
+        if runStart == base + size:
+            return FAILED[INVALID_MOVE]
+
+        toSize = cells[toPile]
+        if toSize == 0:
+            # Only a run starting with a king can go on an empty pile
+            if SLOT_RANK[cells[runStart]] != 13:
+                return FAILED[INVALID_MOVE]
+            count = base + size - runStart
+        else:
+            # Ranks go down one card at a time along the run, so the card one rank below the top card of the to pile
+            # is the only one that can start the run moved
+            count = SLOT_RANK[cells[PILE_BASE[toPile] + toSize - 1]] - SLOT_RANK[cells[base + size - 1]]
+            if count <= 0 or count > base + size - runStart:
+                return FAILED[INVALID_MOVE]
+
+        board.pushMany(toPile, board.popMany(fromPile, count))
+        flipped = board.pileSize(fromPile) > 0 and not board.isTopVisible(fromPile)
+        board.setTopVisibility(fromPile, True)
+        self.__record(OP_PILE | fromPile << 2 | toPile << 6 | count << 10 | flipped << 16)
+        return Result(True, OK, (fromPile, toPile))
+
+    def discard(self):
+        """
+
+        Takes cards from stock and puts them into discard. It will discard 3 cards if there is enough in the deck.
+        Otherwise, it will discard the remaining amount in the stock.
+
+        :param:
+            None
+
+        :return:
+            result (Result): Result of discard
+
+        """
+        board = self.board
+        size = board.pileSize(STOCK)
+        if size == 0:
+            return FAILED[STOCK_EMPTY]
+
+        # Remember which cards were visible, since discarding hides them
+        count = min(size, 3)
+        visible = 0
+        for i in range(count):
+            if board.isTopVisible(STOCK):
+                visible |= 1 << i
+            # Two cards keep their visibility
+            if size == 2:
+                board.push(DISCARD, board.pop(STOCK))
+            else:
+                board.push(DISCARD, board.pop(STOCK) & CODE_MASK)
+
+        # Set new top of stock deck visible if the stock deck isn't empty already
+        flipped = board.pileSize(STOCK) > 0 and not board.isTopVisible(STOCK)
+        board.setTopVisibility(STOCK, True)
+        self.__record(OP_DISCARD | STOCK << 2 | DISCARD << 6 | count << 10 | flipped << 16 | visible << 17)
+        return Result(True, OK, (STOCK, DISCARD))
+
+    def reset(self):
+        """
+
+        Puts all the cards from discard back into stock if the stock deck is empty.
+
+        :param:
+            None
+
+        :return:
+            result (Result): Result of reset
+
+        """
+        board = self.board
+        if board.pileSize(STOCK) != 0:
+            return FAILED[STOCK_NOT_EMPTY]
+
+        # The stock gets the cards in the same order they have in the discard
+        slots = board.pileSlots(DISCARD)
+        for i in range(len(slots)):
+            board.pop(DISCARD)
+        for slot in slots:
+            board.push(STOCK, slot)
+
+        flipped = board.pileSize(STOCK) > 0 and not board.isTopVisible(STOCK)
+        board.setTopVisibility(STOCK, True)
+        self.__record(OP_RESET | DISCARD << 2 | STOCK << 6 | len(slots) << 10 | flipped << 16)
+        return Result(True, OK, (STOCK, DISCARD))
+
+    # Undo
+    def __record(self, record):
+        """
+
+        Adds the undo record of a move to the history. A new move means the moves undone can no longer be redone.
+
+        :param:
+            record (int): Undo record of move
+
+        :return:
+            None
+
+        """
+        self.__history.append(record)
+        if self.__future:
+            self.__future.clear()
+        if self.__journal is not None:
+            self.__journal.move(record, self.board)
+
+        if self.__validateHash:
+            assert self.board.isHashValid(), 'Position hash is out of sync!'
+
+    def historySize(self):
+        """
+
+        Returns number of moves that can be undone.
+
+        :param:
+            None
+
+        :return:
+            size (int): Number of undo records
+
+        """
+        return len(self.__history)
+
+    def unmake(self):
+        """
+
+        Takes back the last move, restoring the board exactly as it was before it. The cost is the number of cards the
+        move moved. The move can not be redone.
+
+        :param:
+            None
+
+        :return:
+            record (int): Undo record of the move taken back, None if there was no move
+
+        """
+        if not self.__history:
+            return None
+        record = self.__history.pop()
+
+        board = self.board
+        op = record & 3
+        fromPile = record >> 2 & 15
+        toPile = record >> 6 & 15
+        count = record >> 10 & 63
+
+        # Turn the card the move turned face up back down. A reset turns up the top of the stock it moved cards to,
+        # every other move the top of the pile it moved cards from.
+        if record >> 16 & 1:
+            board.setTopVisibility(toPile if op == OP_RESET else fromPile, False)
+
+        if op == OP_DISCARD:
+            visible = record >> 17
+            for i in reversed(range(count)):
+                slot = board.pop(DISCARD) & CODE_MASK
+                if visible >> i & 1:
+                    slot |= FACE_UP
+                board.push(STOCK, slot)
+        else:
+            # The other moves keep the order and visibility of the cards they move
+            board.pushMany(fromPile, board.popMany(toPile, count))
+
+        if self.__validateHash:
+            assert board.isHashValid(), 'Position hash is out of sync!'
+        if self.__journal is not None:
+            self.__journal.jump(board)
+        return record
+
+    def undo(self):
+        """
+
+        Takes back the last move, so that it can be redone.
+
+        :param:
+            None
+
+        :return:
+            result (Result): Result of undo
+
+        """
+        record = self.unmake()
+        if record is None:
+            return FAILED[NOTHING_TO_UNDO]
+
+        self.__future.append(record)
+        return Result(True, OK, (record >> 2 & 15, record >> 6 & 15))
+
+    def redo(self):
+        """
+
+        Makes the last move that was undone again.
+
+        :param:
+            None
+
+        :return:
+            result (Result): Result of redo
+
+        """
+        if not self.__future:
+            return FAILED[NOTHING_TO_REDO]
+
+        # Making the move clears the moves to redo, so keep them aside while it is made
+        future = self.__future
+        record = future.pop()
+        self.__future = []
+        result = self.applyMove(recordMove(record))
+        self.__future = future
+        return result
+
+    # Files
+    def deal(self, number):
+        """
+
+        Replaces the board with a numbered deal (see deals.py), laid out as a save file of a new game would be.
+
+        :param:
+            number (int): Number of deal
+
+        :return:
+            result (Result): Result of deal
+
+        """
+        self.board.assign(dealNumber(number))
+
+        # Moves of the old game can not be undone on the new one
+        self.__history.clear()
+        self.__future.clear()
+        if self.__journal is not None:
+            self.__journal.jump(self.board)
+        return Result(True, OK, tuple(range(NUM_PILES)))
+
+    def load(self, fileName):
+        """
+
+        Loads a save file, adding its cards to the piles of the board.
+
+        :param:
+            fileName (str): Name of save file
+
+        :return:
+            result (Result): Result of load
+
+        """
+        piles = None
+        if self.__loadCache is not None:
+            piles = self.__loadCache.get(fileName)
+
+        if piles is None:
+            try:
+                piles = readSave(fileName)
+            except OSError:
+                return FAILED[FILE_NOT_FOUND]
+            except ValueError:
+                return FAILED[BAD_SAVE_FORMAT]
+
+            if self.__loadCache is not None:
+                self.__loadCache[fileName] = piles
+
+        # A load adds to the piles, so check every pile has room before the board is changed
+        board = self.board
+        sizes = [board.pileSize(pile) for pile in range(NUM_PILES)]
+        for pile, slots in piles:
+            sizes[pile] += len(slots)
+            if sizes[pile] > PILE_CAPACITY:
+                return FAILED[PILE_FULL]
+
+        # Moves made before the load can not be undone on the loaded game
+        self.__history.clear()
+        self.__future.clear()
+
+        changed = []
+        for pile, slots in piles:
+            board.pushMany(pile, slots)
+            changed.append(pile)
+        if self.__journal is not None:
+            self.__journal.jump(board)
+        return Result(True, OK, tuple(changed))
+
+    def save(self, fileName):
+        """
+
+        Writes the board to a save file, overwriting it if it already exists. Files ending with .klb are written in the
+        binary format.
+
+        :param:
+            fileName (str): Name of save file, must end with .txt or .klb
+
+        :return:
+            result (Result): Result of save
+
+        """
+        if fileName.endswith(BINARY_EXTENSION):
+            # Loading a save on top of a game can leave more cards than the binary format holds
+            if sum(self.board.cells()[:NUM_PILES]) > 52:
+                return FAILED[TOO_MANY_CARDS]
+            mode, data = 'wb', saveBinary(self.board)
+        elif fileName.endswith('.txt'):
+            mode, data = 'w', saveText(self.board)
+        else:
+            return FAILED[BAD_FILE_NAME]
+        try:
+            with open(fileName, mode) as newGame:
+                newGame.write(data)
+        except OSError:
+            return FAILED[FILE_NOT_WRITTEN]
+        return DONE
+
+    def isWon(self):
+        """
+
+        Returns if every card is on a foundation.
+
+        :param:
+            None
+
+        :return:
+            won (bool): If the game is won
+
+        """
+        cells = self.board.cells()
+        return cells[SPADES] + cells[SPADES + 1] + cells[SPADES + 2] + cells[SPADES + 3] == 52
+
+
+def parseSave(lines):
+    """
+
+    Parses the lines of a save file.
+
+    :param:
+        lines (iterable): Lines of save file
+
+    :return:
+        piles (list): List of (pile, slots) pairs, slots from bottom to top
+
+    """
+    piles = []
+    for line in lines:
+        # Get name of deck from line
+        deckName = line[:line.index(' [')]
+        if deckName not in PILE_INDEX:
+            raise ValueError('Deck does not exist!')
+
+        # Get list of cards in string form
+        cardLine = line[line.index('[ '):line.index(' ]')].strip('[ ')
+
+        # Convert string list into real list
+        cardList = cardLine.split(' ')
+        cardList.reverse()
+
+        slots = bytearray()
+        for card in cardList:
+            if card != '':
+                # Cards are interned, so look the card up instead of building it
+                insertCard = CARD_BY_NAME.get(card[:2])
+                if insertCard is None:
+                    insertCard = Card(card[0:1], card[1:2])
+                if card[2:] == '+':
+                    slots.append(insertCard.cardCode() | FACE_UP)
+                else:
+                    slots.append(insertCard.cardCode())
+        piles.append((PILE_INDEX[deckName], bytes(slots)))
+    return piles
+
+
+def saveText(board):
+    """
+
+    Returns the save file text of a board.
+
+    :param:
+        board (Board): Board to save
+
+    :return:
+        text (str): One line per pile, as written by saveGame
+
+    """
+    lines = []
+    for pile in range(NUM_PILES):
+        lines.append(deckText(PILE_NAMES[pile], board.pileSlots(pile), True) + '\n')
+    return ''.join(lines)
+
+
+def saveBinary(board):
+    """
+
+    Returns the binary save file of a board.
+
+    :param:
+        board (Board): Board to save
+
+    :return:
+        data (bytes): BINARY_FORMAT.size bytes, ValueError if the board has more than 52 cards
+
+    """
+    cells = board.cells()
+    slots = b''.join([board.pileSlots(pile) for pile in range(NUM_PILES)])
+    if len(slots) > 52:
+        raise ValueError('Binary saves can not hold more than 52 cards!')
+    return BINARY_FORMAT.pack(BINARY_MAGIC, BINARY_VERSION, len(slots), bytes(cells[:NUM_PILES]), slots)
+
+
+def parseBinary(data):
+    """
+
+    Parses a binary save file.
+
+    :param:
+        data (bytes): Contents of save file
+
+    :return:
+        piles (list): List of (pile, slots) pairs, slots from bottom to top, as parseSave returns them
+
+    """
+    if len(data) != BINARY_FORMAT.size:
+        raise ValueError('Binary save has the wrong size!')
+    magic, version, count, lengths, slots = BINARY_FORMAT.unpack(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION or count > 52 or sum(lengths) != count:
+        raise ValueError('Not a binary save!')
+    if slots[:count].translate(None, SLOT_VALUES):
+        raise ValueError('Binary save has a bad card!')
+
+    piles = []
+    start = 0
+    for pile in range(NUM_PILES):
+        end = start + lengths[pile]
+        piles.append((pile, slots[start:end]))
+        start = end
+    return piles
+
+
+def readSave(fileName):
+    """
+
+    Reads and parses a save file, binary if its name ends with .klb and text otherwise.
+
+    :param:
+        fileName (str): Name of save file
+
+    :return:
+        piles (list): List of (pile, slots) pairs, slots from bottom to top
+
+    """
+    if fileName.endswith(BINARY_EXTENSION):
+        with open(fileName, 'rb') as loadedGame:
+            return parseBinary(loadedGame.read())
+    with open(fileName, 'r') as loadedGame:
+        return parseSave(loadedGame)
+
+
+def recordMove(record):
+    """
+
+    Returns the move an undo record was made by.
+
+    :param:
+        record (int): Undo record
+
+    :return:
+        move (tuple): Move as (op, fromPile, toPile)
+
+    """
+    op = record & 3
+    if op == OP_SUIT:
+        return (op, record >> 2 & 15, SUIT)
+    return (op, record >> 2 & 15, record >> 6 & 15)
+
+
+def moveText(move):
+    """
+
+    Returns the command for a move, such as 'move 6 4', 'move stock suit' or 'discard'.
+
+    :param:
+        move (tuple): Move as (op, fromPile, toPile)
+
+    :return:
+        command (str): Command of move
+
+    """
+    op = move[0]
+    if op == OP_DISCARD:
+        return 'discard'
+    if op == OP_RESET:
+        return 'reset'
+    return 'move %s %s' % (PILE_COMMANDS[move[1]], PILE_COMMANDS[move[2]])
+
+
+def parseCommand(command):
+    """
+
+    Parses one command of the command language and checks its arguments. Commands that can only fail, such as
+    'move 8 1', are parsed to the error they give.
+
+    :param:
+        command (str): Command, such as 'move 6 4'
+
+    :return:
+        parsed (tuple): (op, a, b). a and b are the piles of a move, the deal number or file name of deal, load and
+            save, or the error code of OP_FAIL, and 0 when unused.
+
+    """
+    words = command.split(' ')
+    name = words[0]
+
+    if name not in COMMAND_ARGUMENTS:
+        return OP_FAIL, BAD_COMMAND, 0
+    if COMMAND_ARGUMENTS[name] is not None and len(words) != COMMAND_ARGUMENTS[name] + 1:
+        return OP_FAIL, BAD_ARGUMENTS, 0
+
+    if name == 'move':
+        if words[1] not in COMMAND_PILES or words[2] not in COMMAND_PILES:
+            return OP_FAIL, NO_SUCH_DECK, 0
+        if words[1] == 'suit':
+            return OP_FAIL, FROM_SUIT, 0
+        if words[2] == 'suit':
+            return OP_SUIT, COMMAND_PILES[words[1]], 0
+        return OP_PILE, COMMAND_PILES[words[1]], COMMAND_PILES[words[2]]
+    elif name == 'discard':
+        return OP_DISCARD, 0, 0
+    elif name == 'reset':
+        return OP_RESET, 0, 0
+    elif name == 'deal':
+        if not words[1].isdecimal() or int(words[1]) > MAX_DEAL:
+            return OP_FAIL, NO_SUCH_DEAL, 0
+        return OP_DEAL, int(words[1]), 0
+    elif name == 'load':
+        return OP_LOAD, words[1], 0
+    elif name == 'save':
+        return OP_SAVE, words[1], 0
+    elif name == 'undo':
+        return OP_UNDO, 0, 0
+    elif name == 'redo':
+        return OP_REDO, 0, 0
+    return OP_NOTHING, 0, 0
+
+
+def runScript(lines, loadCache=None):
+    """
+
+    Runs a command script on a new engine, stopping at a 'done' command.
+
+    :param:
+        lines (iterable): Commands of script
+        loadCache (dict): Parsed save files shared between scripts
+
+    :return:
+        engine (Engine): Engine the script ran on
+        commands (int): Number of commands run
+        failed (int): Number of commands that failed
+
+    """
+    engine = Engine(loadCache=loadCache)
+    commands = 0
+    failed = 0
+    for line in lines:
+        command = line.strip('\n')
+        if command == 'done':
+            break
+        commands += 1
+        if not engine.apply(command).success:
+            failed += 1
+    return engine, commands, failed
+
+
+def runBatch(fileNames, repeat=1):
+    """
+
+    Runs command scripts repeatedly and measures throughput. Scripts are read once, before timing starts.
+
+    :param:
+        fileNames (list): Names of command scripts
+        repeat (int): Number of times each script is run
+
+    :return:
+        stats (dict): Number of scripts and commands run, failed commands, seconds, scripts and commands per second
+
+    """
+    scripts = []
+    for fileName in fileNames:
+        with open(fileName, 'r') as script:
+            scripts.append(script.readlines())
+
+    loadCache = {}
+    commands = 0
+    failed = 0
+    start = time.perf_counter()
+    for i in range(repeat):
+        for lines in scripts:
+            engine, scriptCommands, scriptFailed = runScript(lines, loadCache)
+            commands += scriptCommands
+            failed += scriptFailed
+    seconds = time.perf_counter() - start
+
+    runs = repeat * len(scripts)
+    return {'scripts': runs, 'commands': commands, 'failed': failed, 'seconds': seconds,
+            'scriptsPerSecond': runs / seconds, 'commandsPerSecond': commands / seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Klondike command scripts without output.')
+    parser.add_argument('scripts', nargs='+', help='command scripts, such as samplegame.txt')
+    parser.add_argument('--repeat', type=int, default=1000, help='number of times each script is run')
+    args = parser.parse_args()
+
+    stats = runBatch(args.scripts, args.repeat)
+    print('%d scripts, %d commands (%d failed) in %.3f s' % (stats['scripts'], stats['commands'], stats['failed'],
+                                                            stats['seconds']))
+    print('%.0f scripts/sec, %.0f commands/sec' % (stats['scriptsPerSecond'], stats['commandsPerSecond']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Instrumentation of games.
+
+An Instruments object attached to a Solitaire times every command given to runGame, every engine function it reaches
+(toPile, toSuit, discard, reset, deal, load, save, undo, redo) and the board, cheat and hint views. For each it keeps
+the number of calls, total, smallest and largest time and a histogram of latencies, apart for calls that worked and
+calls that did not. cProfile or tracemalloc can be run for a window of the next N commands.
+
+Attaching wraps the methods of that one game and engine, and detaching removes the wrappers again, so games that are
+not instrumented run exactly the code they always have.
+
+Examples:
+    python klondike.py samplegame.txt --quiet --instrument stats.json
+    python klondike.py samplegame.txt --quiet --instrument stats.json --profile 50
+"""
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+# Latency histograms have a bucket for under 1 us, then one for each power of two up to 2 ** (HISTOGRAM_BUCKETS - 2) us,
+# and a last bucket for everything slower
+HISTOGRAM_BUCKETS = 24
+
+# Engine functions timed. toPile, toSuit, discardFunction, reset, loadGame and saveGame of Solitaire each call one.
+ENGINE_FUNCTIONS = ('toPile', 'toSuit', 'discard', 'reset', 'deal', 'load', 'save', 'undo', 'redo')
+VIEW_FUNCTIONS = ('displayBoard', 'debug', 'hint')
+
+# Lines of a profile or of a tracemalloc capture kept in the export
+PROFILE_LINES = 30
+
+
+class Instruments:
+    def __init__(self):
+        # Timings by name, then by outcome: [calls, total seconds, least seconds, most seconds, histogram]
+        self.__timings = {}
+        self.__profiles = []
+
+        # Game attached to, and the methods wrapped on it and its engine
+        self.__game = None
+        self.__wrapped = []
+
+        # Profiler running for a window of commands, its kind, the commands left in the window, and when the window
+        # started, with how many commands, and the tracemalloc snapshot it started from
+        self.__profiler = None
+        self.__profileKind = None
+        self.__windowLeft = 0
+        self.__windowStart = 0.0
+        self.__windowCommands = 0
+        self.__snapshot = None
+
+    def add(self, name, outcome, seconds):
+        """
+
+        Adds a timing.
+
+        :param:
+            name (str): What was timed, such as 'command move' or 'engine toPile'
+            outcome (str): 'valid' or 'invalid' for commands and moves, 'ok' for the rest
+            seconds (float): Time taken
+
+        :return:
+            None
+
+        """
+        outcomes = self.__timings.setdefault(name, {})
+        timing = outcomes.get(outcome)
+        if timing is None:
+            timing = outcomes[outcome] = [0, 0.0, seconds, seconds, [0] * HISTOGRAM_BUCKETS]
+        timing[0] += 1
+        timing[1] += seconds
+        if seconds < timing[2]:
+            timing[2] = seconds
+        if seconds > timing[3]:
+            timing[3] = seconds
+        timing[4][min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    # Attaching
+    def attach(self, game):
+        """
+
+        Starts timing a game.
+
+        :param:
+            game (Solitaire): Game to time
+
+        :return:
+            None
+
+        """
+        assert self.__game is None, 'Instruments are already attached to a game!'
+        self.__game = game
+        engine = game.engine
+
+        # The result of the last engine command, for the outcome of the command runGame gave it
+        lastResult = []
+
+        def wrapResult(owner, name, label):
+            function = getattr(owner, name)
+
+            def timed(*args):
+                start = time.perf_counter()
+                result = function(*args)
+                self.add(label, 'valid' if result.success else 'invalid', time.perf_counter() - start)
+                return result
+
+            self.__wrap(owner, name, timed)
+
+        for name in ENGINE_FUNCTIONS:
+            wrapResult(engine, name, 'engine ' + name)
+
+        apply = engine.apply
+
+        def timedApply(command):
+            result = apply(command)
+            lastResult.append(result)
+            return result
+
+        self.__wrap(engine, 'apply', timedApply)
+
+        for name in VIEW_FUNCTIONS:
+            function = getattr(game, name)
+
+            def timedView(function=function, label='view ' + name):
+                start = time.perf_counter()
+                function()
+                self.add(label, 'ok', time.perf_counter() - start)
+
+            self.__wrap(game, name, timedView)
+
+        runGame = game.runGame
+
+        def timedRunGame(move):
+            if self.__windowLeft > 0:
+                self.__startWindow()
+            del lastResult[:]
+            start = time.perf_counter()
+            done = runGame(move)
+            seconds = time.perf_counter() - start
+            if lastResult:
+                outcome = 'valid' if lastResult[-1].success else 'invalid'
+            else:
+                # done and menu do not reach the engine
+                outcome = 'ok'
+            self.add('command ' + move.split(' ')[0], outcome, seconds)
+            if self.__windowLeft > 0:
+                self.__windowLeft -= 1
+                if self.__windowLeft == 0:
+                    self.__stopWindow()
+            return done
+
+        self.__wrap(game, 'runGame', timedRunGame)
+
+    def detach(self):
+        """
+
+        Stops timing the game attached to, stopping any profile window, and puts back the methods it had.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        if self.__profiler is not None:
+            self.__stopWindow()
+        self.__windowLeft = 0
+        for owner, name in reversed(self.__wrapped):
+            delattr(owner, name)
+        self.__wrapped = []
+        self.__game = None
+
+    def __wrap(self, owner, name, function):
+        """
+
+        Puts a wrapper on one object in place of a method of its class.
+
+        :param:
+            owner (object): Game or engine
+            name (str): Name of method
+            function (function): Wrapper
+
+        :return:
+            None
+
+        """
+        setattr(owner, name, function)
+        self.__wrapped.append((owner, name))
+
+    # Profiling
+    def profileNext(self, commands, kind='cprofile'):
+        """
+
+        Runs a profiler over the next commands given to runGame of the game attached to.
+
+        :param:
+            commands (int): Number of commands to profile
+            kind (str): 'cprofile' for where time goes, 'tracemalloc' for where memory is allocated
+
+        :return:
+            None
+
+        """
+        assert self.__game is not None, 'Instruments must be attached to a game to profile it!'
+        assert kind in ('cprofile', 'tracemalloc'), 'Profiler must be cprofile or tracemalloc!'
+        assert self.__profiler is None, 'A profile window is already running!'
+        self.__profileKind = kind
+        self.__windowLeft = commands
+
+    def __startWindow(self):
+        """
+
+        Starts the profiler of a window, before its first command.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        if self.__profiler is not None:
+            return
+        self.__windowStart = time.perf_counter()
+        self.__windowCommands = self.__windowLeft
+        if self.__profileKind == 'cprofile':
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+        else:
+            self.__profiler = not tracemalloc.is_tracing()
+            if self.__profiler:
+                tracemalloc.start()
+            self.__snapshot = tracemalloc.take_snapshot()
+
+    def __stopWindow(self):
+        """
+
+        Stops the profiler of a window and keeps a summary of it.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        profile = {'kind': self.__profileKind, 'commands': self.__windowCommands - self.__windowLeft,
+                   'seconds': time.perf_counter() - self.__windowStart}
+        if self.__profileKind == 'cprofile':
+            self.__profiler.disable()
+            stats = pstats.Stats(self.__profiler, stream=io.StringIO())
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_LINES]
+            profile['functions'] = [{'function': '%s:%d(%s)' % where, 'calls': calls, 'ownSeconds': own,
+                                     'cumulativeSeconds': cumulative}
+                                    for where, (primitive, calls, own, cumulative, callers) in rows]
+        else:
+            # Allocations since the window started, grouped by line, leaving out the timings kept here
+            ownFile = [tracemalloc.Filter(False, __file__)]
+            differences = tracemalloc.take_snapshot().filter_traces(ownFile).compare_to(
+                self.__snapshot.filter_traces(ownFile), 'lineno')[:PROFILE_LINES]
+            profile['allocations'] = [{'line': str(difference.traceback), 'bytes': difference.size_diff,
+                                       'blocks': difference.count_diff} for difference in differences]
+            if self.__profiler:
+                tracemalloc.stop()
+            self.__snapshot = None
+        self.__profiles.append(profile)
+        self.__profiler = None
+        self.__windowCommands = 0
+
+    # Export
+    def export(self):
+        """
+
+        Returns the timings and profiles as a dict that can be written as JSON. Times are in microseconds.
+
+        :param:
+            None
+
+        :return:
+            data (dict): 'timings' by name and outcome, 'histogramEdges' and 'profiles'
+
+        """
+        timings = {}
+        for name, outcomes in sorted(self.__timings.items()):
+            timings[name] = {}
+            for outcome, (calls, total, least, most, histogram) in sorted(outcomes.items()):
+                timings[name][outcome] = {'calls': calls, 'totalMicros': 1e6 * total, 'meanMicros': 1e6 * total / calls,
+                                          'minMicros': 1e6 * least, 'maxMicros': 1e6 * most,
+                                          'p50Micros': histogramPercentile(histogram, 0.5),
+                                          'p99Micros': histogramPercentile(histogram, 0.99), 'histogram': histogram}
+        return {'timings': timings, 'histogramEdges': histogramEdges(), 'profiles': self.__profiles}
+
+    def writeJSON(self, fileName):
+        """
+
+        Writes the export to a JSON file.
+
+        :param:
+            fileName (str): Name of file
+
+        :return:
+            None
+
+        """
+        with open(fileName, 'w') as output:
+            json.dump(self.export(), output, indent=2)
+            output.write('\n')
+
+
+def histogramEdges():
+    """
+
+    Returns the upper edge of every histogram bucket but the last, which has none.
+
+    :param:
+        None
+
+    :return:
+        edges (list): Upper edges in microseconds
+    """
+    return [2 ** bucket for bucket in range(HISTOGRAM_BUCKETS - 1)]
+
+
+def histogramPercentile(histogram, fraction):
+    """
+
+    Returns the upper edge of the bucket a percentile of a histogram falls in.
+
+    :param:
+        histogram (list): Calls in each bucket
+        fraction (float): Percentile as a fraction, such as 0.99
+
+    :return:
+        micros (int): Upper edge in microseconds, None if it falls in the last bucket
+    """
+    target = fraction * sum(histogram)
+    seen = 0
+    for bucket, calls in enumerate(histogram):
+        seen += calls
+        if seen >= target and calls:
+            return 2 ** bucket if bucket < HISTOGRAM_BUCKETS - 1 else None
+    return None
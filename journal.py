@@ -0,0 +1,389 @@
+"""
+Append-only journal of a session.
+
+Every move an Engine makes is written as a 3 byte entry: b'M' and the op and piles of the move in the layout of an undo
+record. Every K moves a snapshot of the whole position is written as well, the length of every pile followed by its
+slots, so the position after any step is at most K moves from a snapshot. Changes that are not moves (undo, load, deal) are
+written as a jump: a snapshot that starts a new step.
+
+Step 0 is the position the journal was started from, and step n the position after the nth move or jump. An entry cut
+short by a crash is removed when the journal is opened again.
+
+Examples:
+    python journal.py record samplegame.txt session.klj --every 100
+    python journal.py show session.klj 250
+"""
+import argparse
+import os
+import random
+import struct
+import time
+from bisect import bisect_right
+
+from board import Board, NUM_PILES, PILE_CAPACITY, SLOT_VALUES
+from engine import Engine, recordMove, saveText
+
+JOURNAL_EXTENSION = '.klj'
+JOURNAL_MAGIC = b'KLJ'
+JOURNAL_VERSION = 1
+HEADER_FORMAT = struct.Struct('<3sB')
+
+# Entries: a move, a snapshot of the position at a step, and a jump to a new position at the next step
+MOVE = ord('M')
+SNAPSHOT = ord('S')
+JUMP = ord('J')
+
+# A move is its tag and the op and piles of its undo record. A snapshot or jump is its tag, its step and its number of
+# cards, followed by the length of each pile and the slots of every pile from bottom to top.
+MOVE_FORMAT = struct.Struct('<BH')
+SNAPSHOT_FORMAT = struct.Struct('<BIH')
+LARGEST_SNAPSHOT = SNAPSHOT_FORMAT.size + NUM_PILES + NUM_PILES * PILE_CAPACITY
+
+# Bits of an undo record that hold the op and piles of the move
+MOVE_MASK = 0x3FF
+
+
+class Journal:
+    def __init__(self, fileName, snapshotEvery=1000):
+        """
+
+        Opens a journal, creating it if it does not exist. Entries cut short at the end of the file are removed.
+
+        :param:
+            fileName (str): Name of journal
+            snapshotEvery (int): Most moves written between two snapshots
+
+        """
+        assert snapshotEvery > 0, 'Snapshots must be at least one move apart!'
+        self.__snapshotEvery = snapshotEvery
+
+        if not os.path.exists(fileName):
+            with open(fileName, 'wb') as newJournal:
+                newJournal.write(HEADER_FORMAT.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+
+        with open(fileName, 'rb') as journal:
+            data = journal.read()
+        if HEADER_FORMAT.unpack_from(data) != (JOURNAL_MAGIC, JOURNAL_VERSION):
+            raise ValueError('Not a journal!')
+
+        # Step and file offset of every snapshot and jump, in file order
+        self.__snapshotSteps = []
+        self.__snapshotOffsets = []
+        end = self.__scan(data)
+        if end != len(data):
+            with open(fileName, 'r+b') as journal:
+                journal.truncate(end)
+
+        self.__writer = open(fileName, 'ab')
+        self.__reader = open(fileName, 'rb')
+        self.__end = end
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.__steps
+
+    def __scan(self, data):
+        """
+
+        Reads the index of snapshots from the contents of a journal.
+
+        :param:
+            data (bytes): Contents of journal
+
+        :return:
+            end (int): Offset just after the last whole entry
+
+        """
+        position = HEADER_FORMAT.size
+        step = -1
+        sinceSnapshot = 0
+        while position < len(data):
+            tag = data[position]
+            if tag == MOVE:
+                # Runs of moves are found a block at a time, by the tag of every entry in the block
+                whole = (len(data) - position) // MOVE_FORMAT.size
+                tags = data[position:position + min(whole, 4096) * MOVE_FORMAT.size:MOVE_FORMAT.size]
+                run = len(tags) - len(tags.lstrip(b'M'))
+                if run == 0 or step < 0:
+                    break
+                position += run * MOVE_FORMAT.size
+                step += run
+                sinceSnapshot += run
+                continue
+
+            if tag not in (SNAPSHOT, JUMP) or position + SNAPSHOT_FORMAT.size > len(data):
+                break
+            tag, snapshotStep, count = SNAPSHOT_FORMAT.unpack_from(data, position)
+            size = SNAPSHOT_FORMAT.size + NUM_PILES + count
+            if position + size > len(data) or snapshotStep != (step if tag == SNAPSHOT else step + 1):
+                break
+            lengths = data[position + SNAPSHOT_FORMAT.size:position + SNAPSHOT_FORMAT.size + NUM_PILES]
+            if sum(lengths) != count or max(lengths) > PILE_CAPACITY or \
+                    data[position + size - count:position + size].translate(None, SLOT_VALUES):
+                break
+
+            step = snapshotStep
+            sinceSnapshot = 0
+            self.__snapshotSteps.append(step)
+            self.__snapshotOffsets.append(position)
+            position += size
+
+        self.__steps = step + 1
+        self.__sinceSnapshot = sinceSnapshot
+        return position
+
+    def close(self):
+        """
+
+        Writes out what is buffered and closes the journal.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__writer.close()
+        self.__reader.close()
+
+    def flush(self):
+        """
+
+        Writes out what is buffered, so it survives a crash of the process.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__writer.flush()
+
+    # Writing
+    def move(self, record, board):
+        """
+
+        Adds a move made on the position of the last step.
+
+        :param:
+            record (int): Undo record of move
+            board (Board): Board after the move
+
+        :return:
+            None
+
+        """
+        assert self.__steps > 0, 'Journal has no position to make a move on!'
+        self.__writer.write(MOVE_FORMAT.pack(MOVE, record & MOVE_MASK))
+        self.__end += MOVE_FORMAT.size
+        self.__steps += 1
+        self.__sinceSnapshot += 1
+        if self.__sinceSnapshot >= self.__snapshotEvery:
+            self.__snapshot(SNAPSHOT, self.__steps - 1, board)
+
+    def jump(self, board):
+        """
+
+        Adds a new position that was not reached by a move, such as a loaded game. The first position of a journal is
+        its step 0.
+
+        :param:
+            board (Board): Board of the new position
+
+        :return:
+            None
+
+        """
+        self.__steps += 1
+        self.__snapshot(JUMP, self.__steps - 1, board)
+
+    def __snapshot(self, tag, step, board):
+        """
+
+        Writes a snapshot or jump, and flushes it.
+
+        :param:
+            tag (int): SNAPSHOT or JUMP
+            step (int): Step of the position
+            board (Board): Board of the position
+
+        :return:
+            None
+
+        """
+        cells = board.cells()
+        slots = b''.join([board.pileSlots(pile) for pile in range(NUM_PILES)])
+        entry = SNAPSHOT_FORMAT.pack(tag, step, len(slots)) + bytes(cells[:NUM_PILES]) + slots
+
+        self.__snapshotSteps.append(step)
+        self.__snapshotOffsets.append(self.__end)
+        self.__writer.write(entry)
+        self.__writer.flush()
+        self.__end += len(entry)
+        self.__sinceSnapshot = 0
+
+    # Reading
+    def boardAt(self, step):
+        """
+
+        Returns the board after a step, replaying at most snapshotEvery moves from the nearest snapshot before it.
+
+        :param:
+            step (int): Step, from 0
+
+        :return:
+            board (Board): Board after step
+
+        """
+        if step < 0:
+            step += self.__steps
+        if not 0 <= step < self.__steps:
+            raise IndexError('There is no step %d in the journal!' % step)
+
+        for board in self.replay(step, step + 1):
+            return board
+
+    def replay(self, first=0, last=None):
+        """
+
+        Yields the board after each step of a range. One board is changed in place from each step to the next, so
+        copy it to keep it.
+
+        :param:
+            first (int): First step
+            last (int): Step after the last one, None for the end of the journal
+
+        :return:
+            boards (generator): Board after each step
+        """
+        if last is None or last > self.__steps:
+            last = self.__steps
+        if first >= last:
+            return
+
+        # Start from the last snapshot at or before the first step
+        index = bisect_right(self.__snapshotSteps, first) - 1
+        step = self.__snapshotSteps[index]
+        offset = self.__snapshotOffsets[index]
+        engine = Engine(historyLimit=0)
+        loaded = False
+        self.__writer.flush()
+
+        while step < last - 1 or not loaded:
+            data = self.__read(offset, min(last - step, self.__snapshotEvery) * MOVE_FORMAT.size + LARGEST_SNAPSHOT)
+            position = 0
+            while position < len(data) and (step < last - 1 or not loaded):
+                tag = data[position]
+                if tag == MOVE:
+                    if position + MOVE_FORMAT.size > len(data):
+                        break
+                    engine.applyMove(recordMove(MOVE_FORMAT.unpack_from(data, position)[1]))
+                    position += MOVE_FORMAT.size
+                    step += 1
+                else:
+                    if position + SNAPSHOT_FORMAT.size > len(data):
+                        # Read the rest of the snapshot with the next block
+                        break
+                    tag, snapshotStep, count = SNAPSHOT_FORMAT.unpack_from(data, position)
+                    start = position + SNAPSHOT_FORMAT.size + NUM_PILES
+                    if start + count > len(data):
+                        break
+                    position = start + count
+                    if tag == SNAPSHOT and loaded:
+                        # The board is already at this position
+                        continue
+
+                    board = engine.board
+                    board.assign(Board())
+                    lengths = data[start - NUM_PILES:start]
+                    for pile in range(NUM_PILES):
+                        board.pushMany(pile, data[start:start + lengths[pile]])
+                        start += lengths[pile]
+                    step = snapshotStep
+                    loaded = True
+
+                if step >= first:
+                    yield engine.board
+            offset += position
+
+    def __read(self, offset, size):
+        """
+
+        Reads bytes of the journal.
+
+        :param:
+            offset (int): Offset to read from
+            size (int): Most bytes to read
+
+        :return:
+            data (bytes): Bytes read
+        """
+        self.__reader.seek(offset)
+        return self.__reader.read(min(size, self.__end - offset))
+
+
+def recordScript(scriptName, journalName, snapshotEvery=1000):
+    """
+
+    Runs a command script through an Engine, writing a journal of the session.
+
+    :param:
+        scriptName (str): Name of command script
+        journalName (str): Name of journal to write, added to if it exists
+        snapshotEvery (int): Most moves written between two snapshots
+
+    :return:
+        steps (int): Number of steps in the journal
+    """
+    with Journal(journalName, snapshotEvery) as journal, open(scriptName, 'r') as script:
+        engine = Engine(journal=journal)
+        for line in script:
+            command = line.strip('\n')
+            if command == 'done':
+                break
+            engine.apply(command)
+        return len(journal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write or read the journal of a session.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='run a command script, writing its journal')
+    record.add_argument('script', help='command script, such as samplegame.txt')
+    record.add_argument('journal', help='journal to write')
+    record.add_argument('--every', type=int, default=1000, help='most moves between snapshots')
+    show = commands.add_parser('show', help='print the position after a step as a text save')
+    show.add_argument('journal', help='journal to read')
+    show.add_argument('step', type=int, help='step, from 0')
+    seek = commands.add_parser('seek', help='time jumps to random steps')
+    seek.add_argument('journal', help='journal to read')
+    seek.add_argument('--count', type=int, default=1000, help='number of jumps')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        print('%d steps written to %s' % (recordScript(args.script, args.journal, args.every), args.journal))
+    elif args.command == 'show':
+        with Journal(args.journal) as journal:
+            print(saveText(journal.boardAt(args.step)), end='')
+    else:
+        with Journal(args.journal) as journal:
+            rnd = random.Random(1)
+            times = []
+            for i in range(args.count):
+                start = time.perf_counter()
+                journal.boardAt(rnd.randrange(len(journal)))
+                times.append(time.perf_counter() - start)
+            times.sort()
+            print('%d steps: %.0f us median, %.0f us worst' % (len(journal), 1e6 * times[len(times) // 2],
+                                                               1e6 * times[-1]))
+
+
+if __name__ == '__main__':
+    main()
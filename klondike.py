@@ -6,426 +6,178 @@
 ;==========================================
 """
 
+from board import Board, STOCK, DISCARD, SPADES, HEARTS, DIAMONDS, CLUBS, PILE1
+from deck import Deck
+from engine import Engine, ERROR_MESSAGES, BAD_ARGUMENTS, BAD_COMMAND, FILE_NOT_FOUND, FILE_NOT_WRITTEN, NO_SUCH_DEAL, \
+    moveText
+from sinks import BufferedSink, ConsoleSink, EventSink, NullSink
+from solver import hintMove
 
-class Card:
-    def __init__(self, rank, suit):
-        assert type(suit) == str, 'Suit must be a string!'
-        assert type(rank) == str or type(rank) == int, 'Rank must be a string or int!'
-
-        self.__shortSuit = suit
-        self.__rank = rank
-        self.__isVisible = False
-        self.__rankVal = 0
-
-        self.__suit = ''
-
-        # Set full name of suit
-        if self.__shortSuit == 's':
-            self.__suit = 'Spades'
-        elif self.__shortSuit == 'h':
-            self.__suit = 'Hearts'
-        elif self.__shortSuit == 'd':
-            self.__suit = 'Diamonds'
-        else:
-            self.__suit = 'Clubs'
-
-        # Set rank value
-        if rank.upper() == 'A':
-            self.__rankVal = 1
-        elif rank.upper() == 'T':
-            self.__rankVal = 10
-        elif rank.upper() == 'J':
-            self.__rankVal = 11
-        elif rank.upper() == 'Q':
-            self.__rankVal = 12
-        elif rank.upper() == 'K':
-            self.__rankVal = 13
-        else:
-            self.__rankVal = int(rank)
-
-    def __str__(self):
-        """
-
-        Returns string representation of card
-
-        :param:
-            None
-
-        :return:
-            cardStr (str): String representation of card.
-
-        """
-        if self.__isVisible:
-            return str(self.__rank) + self.__shortSuit
-        else:
-            return '??'
-
-    def __repr__(self):
-        """
-
-        Returns string representation of card class
 
-        :param:
-            None
-
-        :return:
-            cardRep (str): String representation of card class
+class Solitaire:
+    def __init__(self, historyLimit=None, journal=None, sink=None, solveCache=None):
+        # All decks are views of one packed board
+        self.board = Board()
 
-        """
+        # Stock decks
+        self.stock = Deck('Stock', self.board, STOCK)
+        self.discard = Deck('Discard', self.board, DISCARD)
 
-        visibility = ''
-        if self.__isVisible:
-            visibility = '+'
-        else:
-            visibility = '-'
-        return str(self.__rank) + self.__shortSuit + visibility
+        # Suit decks
+        self.spades = Deck('Spades', self.board, SPADES)
+        self.hearts = Deck('Hearts', self.board, HEARTS)
+        self.diamonds = Deck('Diamonds', self.board, DIAMONDS)
+        self.clubs = Deck('Clubs', self.board, CLUBS)
 
-    def isVisibleCard(self):
-        """
+        # Pile decks
+        self.pile1 = Deck('PILE-1', self.board, PILE1)
+        self.pile2 = Deck('PILE-2', self.board, PILE1 + 1)
+        self.pile3 = Deck('PILE-3', self.board, PILE1 + 2)
+        self.pile4 = Deck('PILE-4', self.board, PILE1 + 3)
+        self.pile5 = Deck('PILE-5', self.board, PILE1 + 4)
+        self.pile6 = Deck('PILE-6', self.board, PILE1 + 5)
+        self.pile7 = Deck('PILE-7', self.board, PILE1 + 6)
 
-        Returns the visibility of the card. True = is visible, False = not visible
+        self.__dictOfDecks = {self.stock.deckName(): self.stock, self.discard.deckName(): self.discard,
+                              self.spades.deckName(): self.spades, self.hearts.deckName(): self.hearts,
+                              self.diamonds.deckName(): self.diamonds, self.clubs.deckName(): self.clubs,
+                              self.pile1.deckName(): self.pile1, self.pile2.deckName(): self.pile2,
+                              self.pile3.deckName(): self.pile3, self.pile4.deckName(): self.pile4,
+                              self.pile5.deckName(): self.pile5, self.pile6.deckName(): self.pile6,
+                              self.pile7.deckName(): self.pile7}
 
-        :param:
-            None
+        # Rules of the game are run by a headless engine working on the same board. The history limit bounds how many
+        # moves can be undone, and a journal (see journal.py) records the session.
+        self.engine = Engine(self.board, historyLimit=historyLimit, journal=journal)
 
-        :return:
-            self.__isVisible (bool): Visibility of card
+        # Everything the game shows goes to the sink (see sinks.py), the console unless told otherwise
+        if sink is None:
+            sink = ConsoleSink()
+        self.__sink = sink
 
-        """
+        # Hints play the first move of a solution kept in the solve cache (see solvecache.py) when there is one
+        self.__solveCache = solveCache
 
-        return self.__isVisible
+        self.__commands = ['discard', 'reset', 'board', 'cheat', 'hint', 'comment', 'move']
 
-    def setVisibility(self, visibility):
+    # Interface
+    def errorMessage(self, error, move):
         """
 
-        Sets the visibility of the card. True = is visible, False = not visible
+        Returns the message shown for an error code of the engine.
 
         :param:
-            visibility (bool): Visibility of card
+            error (int): Error code
+            move (list): Command that failed, split into words
 
         :return:
-            None
+            message (str): Message for user
 
         """
-        assert type(visibility) == bool, 'The param must be a bool!'
-
-        self.__isVisible = visibility
+        if error == BAD_ARGUMENTS:
+            return ERROR_MESSAGES[error] % move[0]
+        if error == FILE_NOT_FOUND or error == FILE_NOT_WRITTEN or error == NO_SUCH_DEAL:
+            return ERROR_MESSAGES[error] % move[1]
+        return ERROR_MESSAGES[error]
 
-    def cardRank(self):
+    def saveGame(self, fileName):
         """
 
-        Returns name of card rank.
+        Creates new save file based on the current state of the game
 
         :param:
-            None
+            gameName (str): Name of file user wishes to create
 
         :return:
-            self.__rankVal (int): Value of card rank.
-
-        """
-
-        return self.__rankVal
-
-    def cardSuit(self):
-        """
-
-        Returns name of card suit.
-
-        :param:
             None
 
-        :return:
-            self.__rank (str): Name of card rank.
-
         """
+        result = self.engine.save(fileName)
+        if not result.success:
+            self.__sink.write(self.errorMessage(result.error, ['save', fileName]) + '\n')
 
-        return self.__suit
-
-
-class Deck:
-    def __init__(self, name):
-        assert type(name) == str, 'Name of deck must be a string!'
-
-        self.__name = name
-        self.__deck = []
-
-    def __str__(self):
+    def loadGame(self, fileName):
         """
 
-        Returns string representation of deck
+        Loads game file.
 
         :param:
-            None
+            gameName (str): Name of file user wishes to load
 
         :return:
-            deckStr (str): String representation of deck.
-
-        """
-
-        temp = self.__deck.copy()
-        temp.reverse()
-
-        result = self.__name + ' [ '
-        for card in temp:
-            result += str(card) + ' '
-        result += ']'
-        return result
-
-    def __repr__(self):
-        """
-
-        Returns string representation of deck class
-
-        :param:
             None
 
-        :return:
-            deckRep (str): String representation of deck class
-
         """
+        result = self.engine.load(fileName)
+        if not result.success:
+            self.__sink.write(self.errorMessage(result.error, ['load', fileName]) + '\n')
 
-        temp = self.__deck.copy()
-        temp.reverse()
-
-        result = self.__name + ' [ '
-        for card in temp:
-            result += repr(card) + ' '
-        result += ']'
-        return result
-
-    def deckName(self):
+    def dealGame(self, number):
         """
 
-        Returns name of deck
+        Starts a new game from a numbered deal. The same number always gives the same deal.
 
         :param:
-            None
+            number (int): Number of deal
 
         :return:
-            self.__name (str): Name of deck
-
-        """
-        return self.__name
-
-    def deckSize(self):
-        """
-
-        Returns size of deck
-
-        :Param:
             None
 
-        :return:
-            self.__size (int): Size of deck
-
-        """
-
-        return len(self.__deck)
-
-    def isDeckEmpty(self):
-        """
-
-        Returns if deck is empty. Empty = True, not empty = False
-
-        :Param:
-            None
-
-        :return:
-            self.__size <= 0 (bool): If deck is empty
-
         """
+        self.engine.deal(number)
 
-        return len(self.__deck) <= 0
-
-    def pushDeck(self, card):
+    def positionHash(self):
         """
 
-        Pushes card to top of deck.
+        Returns the 64-bit hash of the position, kept up to date by every move.
 
         :param:
-            card (Card): Card to push to deck
-        :return:
-            None
-
-        """
-        assert type(card) == Card, 'You must push a card from the Card class!'
-
-        self.__deck.append(card)
-
-    def popDeck(self):
-        """
-
-        Removes card from top of deck and returns it.
-
-        :Param:
             None
 
         :return:
-            card (Card): Card from top of deck
-        """
-        if len(self.__deck) <= 0:
-            return None
-        else:
-            return self.__deck.pop(-1)
-
-    def peekDeck(self):
-        """
-
-        Returns card from top of deck. Does not makes changes to deck.
-
-        :Param:
-            None
+            hash (int): Hash of position
 
-        :return:
-            card (Card): Card from top of deck
         """
+        return self.board.zobrist()
 
-        if len(self.__deck) > 0:
-            return self.__deck[-1]
-        else:
-            return None
-
-
-class Solitaire:
-    def __init__(self):
-        # Stock decks
-        self.stock = Deck('Stock')
-        self.discard = Deck('Discard')
-
-        # Suit decks
-        self.spades = Deck('Spades')
-        self.hearts = Deck('Hearts')
-        self.diamonds = Deck('Diamonds')
-        self.clubs = Deck('Clubs')
-
-        # Pile decks
-        self.pile1 = Deck('PILE-1')
-        self.pile2 = Deck('PILE-2')
-        self.pile3 = Deck('PILE-3')
-        self.pile4 = Deck('PILE-4')
-        self.pile5 = Deck('PILE-5')
-        self.pile6 = Deck('PILE-6')
-        self.pile7 = Deck('PILE-7')
-
-        self.__pileShortHand = {'1': self.pile1.deckName(), '2': self.pile2.deckName(), '3': self.pile3.deckName(),
-                                '4': self.pile4.deckName(), '5': self.pile5.deckName(), '6': self.pile6.deckName(),
-                                '7': self.pile7.deckName(), 'stock': self.stock.deckName()}
-
-        self.__validMoves = ['1', '2', '3', '4', '5', '6', '7', 'stock', 'suit']
-
-        self.__dictOfDecks = {self.stock.deckName(): self.stock, self.discard.deckName(): self.discard,
-                              self.spades.deckName(): self.spades, self.hearts.deckName(): self.hearts,
-                              self.diamonds.deckName(): self.diamonds, self.clubs.deckName(): self.clubs,
-                              self.pile1.deckName(): self.pile1, self.pile2.deckName(): self.pile2,
-                              self.pile3.deckName(): self.pile3, self.pile4.deckName(): self.pile4,
-                              self.pile5.deckName(): self.pile5, self.pile6.deckName(): self.pile6,
-                              self.pile7.deckName(): self.pile7}
-
-        self.__commands = ['discard', 'reset', 'board', 'cheat', 'comment', 'move']
-
-    # Interface
-    def saveGame(self, fileName):
+    def displayBoard(self):
         """
 
-        Creates new save file based on the current state of the game
+        Prints representation of game. Only decks that changed since the last time are rendered again, and the board is
+        written out at once.
 
         :param:
-            gameName (str): Name of file user wishes to create
-
-        :return:
             None
 
-        """
-        try:
-            assert fileName.endswith('.txt'), 'File must end with .txt!'
-            newGame = open(fileName, 'x')
-        except AssertionError:
-            print('Invalid file name. File must end with .txt')
-        # Overwrite file if file already exists
-        except FileExistsError:
-            newGame = open(fileName, 'w')
-            # Go through all the decks in the game
-            for deck in self.__dictOfDecks:
-                newGame.write(repr(self.__dictOfDecks[deck]) + '\n')
-            newGame.close()
-
-        # Create new game file
-        else:
-            newGame = open(fileName, 'x')
-            # Go through all the decks in the game
-            for deck in self.__dictOfDecks:
-                newGame.write(repr(self.__dictOfDecks[deck]) + '\n')
-            newGame.close()
-
-    def loadGame(self, fileName):
-        """
-
-        Loads game file.
-
-        :param:
-            gameName (str): Name of file user wishes to load
-
         :return:
             None
 
         """
-        try:
-            loadedGame = open(fileName, 'r')
-
-            for line in loadedGame:
-                # Get name of deck from line
-                deckName = line[:line.index(' [')]
-
-                # Get list of cards in string form
-                cardLine = line[line.index('[ '):line.index(' ]')].strip('[ ')
-                # print(cardLine)
-
-                # Convert string list into real list
-                cardList = cardLine.split(' ')
-                cardList.reverse()
-
-                for card in cardList:
-                    rank = card[0:1]
-                    suit = card[1:2]
-                    visibility = card[2:]
-
-                    # Create card to insert into deck
-                    if card != '':
-                        insertCard = Card(rank, suit)
-                        # Set visibility of card
-                        if visibility == '+':
-                            insertCard.setVisibility(True)
-                        else:
-                            insertCard.setVisibility(False)
-                        self.__dictOfDecks[deckName].pushDeck(insertCard)
-        except OSError:
-            print('%s cannot be opened: file was not found!' % fileName)
-            return Exception
-        except ValueError:
-            print('File in incorrect save format!')
-        loadedGame.close()
+        if not self.__sink.showsText:
+            return
+        lines = [deck.renderDeck(False) for deck in self.__dictOfDecks.values()]
+        self.__sink.write('\n# Board #\n---------\n' + '\n'.join(lines) + '\n\n')
 
-    def displayBoard(self):
+    def debug(self):
         """
 
-        Prints representation of game
+        Prints board with all cards visible
 
         :param:
             None
-
         :return:
             None
 
         """
-        print('\n# Board #\n---------')
-        for deck in self.__dictOfDecks:
-            print(str(self.__dictOfDecks[deck]))
-        print()
+        if not self.__sink.showsText:
+            return
+        lines = [deck.renderDeck(True) for deck in self.__dictOfDecks.values()]
+        self.__sink.write('\n*** DEBUG ***\n\n' + '\n'.join(lines) + '\n')
 
-    def debug(self):
+    def hint(self):
         """
 
-        Prints board with all cards visible
+        Prints the first move of the cached solution of the position, or else the move the solver would try first.
 
         :param:
             None
@@ -433,9 +185,18 @@ class Solitaire:
             None
 
         """
-        print('\n*** DEBUG ***\n')
-        for deck in self.__dictOfDecks:
-            print(repr(self.__dictOfDecks[deck]))
+        if not self.__sink.showsText:
+            return
+        if self.__solveCache is not None:
+            result = self.__solveCache.get(self.board)
+            if result is not None and result.moves:
+                self.__sink.write('Hint: ' + result.moves[0] + '\n')
+                return
+        move = hintMove(self.board)
+        if move is None:
+            self.__sink.write('No moves left!\n')
+        else:
+            self.__sink.write('Hint: ' + moveText(move) + '\n')
 
     # Game mechanic functions
     def runGame(self, move):
@@ -453,135 +214,85 @@ class Solitaire:
         if move == 'done':
             return True
 
+        # Menu is the only command the engine does not know, since it asks the user for input
+        if move.split(' ')[0] == 'menu':
+            self.menu(move.split(' '))
+            return
+
+        result = self.engine.apply(move)
+        command = move
+        sink = self.__sink
+
         # Create list from elements in list
         move = move.split(' ')
 
-        # Run correct function based on input
-        if move[0] == 'cheat':
-            try:
-                assert len(move) == 1
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
+        message = None
+        if result.error == BAD_COMMAND:
+            message = 'Not a valid command. Try again!'
+            sink.write(message + '\n')
+        elif result.error == BAD_ARGUMENTS and move[0] != 'move':
+            message = 'Invalid number of arguments for ' + move[0]
+            sink.write(message + '\n')
+        else:
+            sink.write('Executing: ' + str(move) + '\n')
+            if not result.success:
+                message = self.errorMessage(result.error, move)
+                sink.write(message + '\n')
+            elif move[0] == 'cheat':
                 # Print all cards facing up
                 self.debug()
-        elif move[0] == 'comment':
-            print('Executing:', move)
-            move.remove(move[0])
-            # Print comment
-            print(' '.join(move))
-        elif move[0] == 'move':
-            print('Executing:', move)
-
-            # Assert that the correct params are being entered for the command
-            try:
-                assert len(move) == 3, 'Invalid number of arguments for "move"'
-                assert move[1] in self.__validMoves, "Deck(s) do not exist!"
-                assert move[2] in self.__validMoves, "Deck(s) do not exist!"
-                assert move[1] != 'suit', 'Cannot move a card out of a suit deck!'
-            except AssertionError as e:
-                print(e)
-            else:
-                # Separate command into two functions, to suit and to pile
-                if move[2] == 'suit':
-                    self.toSuit(self.__pileShortHand[move[1]])
-                else:
-                    self.toPile(self.__pileShortHand[move[1]], self.__pileShortHand[move[2]])
-        elif move[0] == 'board':
-            try:
-                assert len(move) == 1
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
+            elif move[0] == 'comment':
+                # Print comment
+                sink.write(' '.join(move[1:]) + '\n')
+            elif move[0] == 'board':
                 self.displayBoard()
-        elif move[0] == 'discard':
-            try:
-                assert len(move) == 1
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
-                self.discardFunction()
-        elif move[0] == 'reset':
-            try:
-                assert len(move) == 1
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
-                self.reset()
-        elif move[0] == 'load':
-            try:
-                assert len(move) == 2
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
-                self.loadGame(move[1])
-        elif move[0] == 'save':
-            try:
-                assert len(move) == 2
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
-                self.saveGame(move[1])
-        elif move[0] == 'menu':
-            try:
-                assert len(move) == 1
-            except AssertionError:
-                print('Invalid number of arguments for', move[0])
-            else:
-                print('Executing:', move)
-                inp = input('\nYour game will not auto save if you exit to menu. Do you still wish to exit to menu? (y/n): ')
-                while inp != 'y' and inp != 'n':
-                    inp = input('Invalid input. Please type "y" or "n": ')
-                if inp == 'y':
-                    print()
-                    main()
-                else:
-                    print('menu was not executed')
-        else:
-            print('Not a valid command. Try again!')
+            elif move[0] == 'hint':
+                self.hint()
+        sink.event(command, result, message)
 
-    def toSuit(self, fromDeckName):
+    def menu(self, move):
         """
 
-        Moves card from a deck to a suit. This function automatically recognizes what cards are valid to be moved.
+        Asks the user to confirm, then goes back to the main menu.
 
         :param:
-            fromDeckName (str): Name of deck user wishes to move card from.
+            move (list): Menu command, split into words
 
         :return:
             None
 
         """
         try:
-            # Assert that the from deck is not empty
-            assert self.__dictOfDecks[fromDeckName].peekDeck() != None
+            assert len(move) == 1
         except AssertionError:
-            print('No card in from deck!')
+            self.__sink.write('Invalid number of arguments for ' + move[0] + '\n')
         else:
-            # Get from deck
-            fromDeck = self.__dictOfDecks[fromDeckName]
-            card = fromDeck.peekDeck()
-            suitDeckVal = 0
-
-            # If suit deck is not empty, set suitDeckValue to the value of the card on the top
-            # The value will be 0 if the deck is empty
-            if self.__dictOfDecks[card.cardSuit()].deckSize() != 0:
-                suitDeckVal = self.__dictOfDecks[card.cardSuit()].peekDeck().cardRank()
-
-            # Check to see if the card user wants to move is one value larger than the card on the suit deck
-            if suitDeckVal + 1 == card.cardRank():
-                self.__dictOfDecks[card.cardSuit()].pushDeck(fromDeck.popDeck())
-                if fromDeck.peekDeck() != None:
-                    fromDeck.peekDeck().setVisibility(True)
-            # Print error if the move is not valid
+            self.__sink.write('Executing: ' + str(move) + '\n')
+            self.__sink.flush()
+            inp = input('\nYour game will not auto save if you exit to menu. Do you still wish to exit to menu? (y/n): ')
+            while inp != 'y' and inp != 'n':
+                inp = input('Invalid input. Please type "y" or "n": ')
+            if inp == 'y':
+                self.__sink.write('\n')
+                main()
             else:
-                print('Not a valid move!')
+                self.__sink.write('menu was not executed\n')
+
+    def toSuit(self, fromDeckName):
+        """
+
+        Moves card from a deck to a suit. This function automatically recognizes what cards are valid to be moved.
+
+        :param:
+            fromDeckName (str): Name of deck user wishes to move card from.
+
+        :return:
+            None
+
+        """
+        result = self.engine.toSuit(self.__dictOfDecks[fromDeckName].deckPile())
+        if not result.success:
+            self.__sink.write(ERROR_MESSAGES[result.error] + '\n')
 
     def toPile(self, fromDeckName, toDeckName):
         """
@@ -596,54 +307,10 @@ class Solitaire:
             None
 
         """
-        try:
-            assert self.__dictOfDecks[fromDeckName].peekDeck() != None, 'No card in from deck!'
-        except AssertionError as e:
-            print(e)
-        else:
-            # Get from deck and to deck
-            fromDeck = self.__dictOfDecks[fromDeckName]
-            toDeck = self.__dictOfDecks[toDeckName]
-
-            toDeckRank = 0
-            # If suit deck is not empty, set toDeckVal to the value of the card on the top
-            # The value will be 0 if the deck is empty
-            if toDeck.peekDeck() is not None:
-                toDeckRank = toDeck.peekDeck().cardRank()
-
-            # Get cards that are visible
-            cards = []
-            if fromDeck.deckSize() > 0:
-                temp = fromDeck.peekDeck()
-                while temp != None and temp.isVisibleCard() == True:
-                    cards.append(fromDeck.popDeck())
-                    temp = fromDeck.peekDeck()
-
-            # Reverse cards list so when you run it through a for loop it pushes in the correct order
-            cards.reverse()
-
-            newCards = []
-            for card in cards:
-                if card.cardRank() < toDeckRank or (cards[0].cardRank() == 13 and toDeck.deckSize() == 0):
-                    newCards.append(card)
-                else:
-                    fromDeck.pushDeck(card)
-
-            # Check if the largest value in the cards list is one less than the card on the top of the toDeck or
-            # If the toDeck is empty and the largest value in cards is equivalent to a king
-            if toDeckRank - 1 == newCards[0].cardRank() or (newCards[0].cardRank() == 13 and toDeck.deckSize() == 0):
-                # Push cards to toDeck
-                for card in newCards:
-                    toDeck.pushDeck(card)
-
-                # Set top card visible on toDeck
-                if fromDeck.peekDeck() != None:
-                    fromDeck.peekDeck().setVisibility(True)
-            else:
-                print('Not a valid move!')
-                # Put cards back into the toDeck if the move is invalid
-                for card in cards:
-                    fromDeck.pushDeck(card)
+        result = self.engine.toPile(self.__dictOfDecks[fromDeckName].deckPile(),
+                                    self.__dictOfDecks[toDeckName].deckPile())
+        if not result.success:
+            self.__sink.write(ERROR_MESSAGES[result.error] + '\n')
 
     def discardFunction(self):
         """
@@ -658,29 +325,9 @@ class Solitaire:
             None
 
         """
-        try:
-            # Assert stock is not empty
-            assert self.stock.deckSize() > 0
-        except AssertionError:
-            print('Cannot discard, stock is empty!')
-        else:
-            # Discard 3 if stock has more than 3 cards
-            if self.stock.deckSize() >= 3:
-                for i in range(3):
-                    self.discard.pushDeck(self.stock.popDeck())
-                    self.discard.peekDeck().setVisibility(False)
-            # Discard 2 if stock has 2 cards
-            elif self.stock.deckSize() == 2:
-                for i in range(2):
-                    self.discard.pushDeck(self.stock.popDeck())
-            # Discard 1 if stock has 1 card
-            else:
-                self.discard.pushDeck(self.stock.popDeck())
-                self.discard.peekDeck().setVisibility(False)
-
-            # Set new top of stock deck visible if the stock deck isn't empty already
-            if self.stock.peekDeck() != None:
-                self.stock.peekDeck().setVisibility(True)
+        result = self.engine.discard()
+        if not result.success:
+            self.__sink.write(ERROR_MESSAGES[result.error] + '\n')
 
     def reset(self):
         """
@@ -694,26 +341,9 @@ class Solitaire:
             None
 
         """
-        try:
-            # Assert that the stock deck is empty
-            assert self.stock.deckSize() == 0
-        except AssertionError:
-            print('Stock must be empty!')
-        else:
-            # Put all the cards from discard into a temp list
-            temp = []
-            for i in range(self.discard.deckSize()):
-                temp.append(self.discard.popDeck())
-
-            temp.reverse()
-
-            # Push all cards back into the stock
-            for card in temp:
-                self.stock.pushDeck(card)
-
-        # Set top of stock deck visible
-        if self.stock.peekDeck() != None:
-            self.stock.peekDeck().setVisibility(True)
+        result = self.engine.reset()
+        if not result.success:
+            self.__sink.write(ERROR_MESSAGES[result.error] + '\n')
 
 
 def inputGame():
@@ -730,25 +360,44 @@ def inputGame():
     print('Thank you for playing!')
 
 
-def testGame():
-    print('Welcome to Klondike!')
-    file = open('samplegame.txt', 'r')
+def testGame(fileName='samplegame.txt', sink=None):
+    if sink is None:
+        sink = ConsoleSink()
+    sink.write('Welcome to Klondike!\n')
 
-    game = Solitaire()
-
-    stop = False
-    while not stop:
-        for line in file:
-            move = line.strip('\n')
-
-            if game.runGame(move) == True:
-                stop = True
+    game = replayGame(fileName, sink)
     game.saveGame('hello.txt')
-    print('Thank you for playing!')
+    sink.write('Thank you for playing!\n')
+    sink.flush()
 
     main()
 
 
+def replayGame(fileName, sink=None, solveCache=None, game=None):
+    """
+
+    Runs every command of a command script in a new game, as testGame does, without going back to the menu.
+
+    :param:
+        fileName (str): Name of command script
+        sink (Sink): Sink to send the output to, the console if None
+        solveCache (SolveCache): Cache of solver results hints are taken from, None for none
+        game (Solitaire): Game to run the script in instead of a new one, such as one with instruments attached. sink
+            and solveCache are not used with it.
+
+    :return:
+        game (Solitaire): Game after the script
+
+    """
+    if game is None:
+        game = Solitaire(sink=sink, solveCache=solveCache)
+    with open(fileName, 'r') as file:
+        # Like testGame always has, commands after done are run too
+        for line in file:
+            game.runGame(line.strip('\n'))
+    return game
+
+
 def main():
     print('# Main Menu #')
     print('1. Input Game')
@@ -771,4 +420,52 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play Klondike, or replay a command script without the menu.')
+    parser.add_argument('script', nargs='?', help='command script to replay, such as samplegame.txt')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--quiet', action='store_true', help='show nothing')
+    output.add_argument('--output', help='write the text of the replay to a file')
+    output.add_argument('--events', help='write a JSON line for every command to a file')
+    parser.add_argument('--instrument', metavar='FILE', help='time every command and write the timings as JSON')
+    window = parser.add_mutually_exclusive_group()
+    window.add_argument('--profile', type=int, metavar='N', help='with --instrument, run cProfile for N commands')
+    window.add_argument('--trace', type=int, metavar='N', help='with --instrument, run tracemalloc for N commands')
+    parser.add_argument('--cache', metavar='FILE', help='SQLite cache of solver results to take hints from')
+    args = parser.parse_args()
+
+    if args.script is None:
+        main()
+    else:
+        if args.quiet:
+            replaySink = NullSink()
+        elif args.output:
+            replaySink = BufferedSink(args.output)
+        elif args.events:
+            replaySink = EventSink(args.events)
+        else:
+            replaySink = ConsoleSink()
+        solveCache = None
+        if args.cache:
+            from solvecache import SolveCache
+
+            solveCache = SolveCache(args.cache)
+        with replaySink:
+            game = Solitaire(sink=replaySink, solveCache=solveCache)
+            instruments = None
+            if args.instrument:
+                from instrument import Instruments
+
+                instruments = Instruments()
+                instruments.attach(game)
+                if args.profile:
+                    instruments.profileNext(args.profile, 'cprofile')
+                elif args.trace:
+                    instruments.profileNext(args.trace, 'tracemalloc')
+            replayGame(args.script, game=game)
+            if instruments is not None:
+                instruments.detach()
+                instruments.writeJSON(args.instrument)
+        if solveCache is not None:
+            solveCache.close()
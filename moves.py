@@ -0,0 +1,93 @@
+"""
+Legal move generator.
+
+legalMoves lists every move the engine would accept on a board, without changing the board. Moves are
+(op, fromPile, toPile) tuples that Engine.applyMove runs and engine.moveText turns into commands.
+"""
+from board import STOCK, DISCARD, SPADES, TABLEAU, PILE_BASE, FACE_UP
+from engine import SUIT, OP_PILE, OP_SUIT, OP_DISCARD, OP_RESET
+from rules import SLOT_RANK, SLOT_SUIT, STACKS_ON, FOUNDATION_NEXT
+
+# Piles cards can be moved from
+_SOURCES = (STOCK,) + TABLEAU
+
+# Shared moves that do not depend on the board
+_DISCARD_MOVE = (OP_DISCARD, STOCK, DISCARD)
+_RESET_MOVE = (OP_RESET, DISCARD, STOCK)
+
+
+def legalMoves(board):
+    """
+
+    Returns every move that is valid on a board: pile or stock to pile, pile or stock to suit, discard and reset.
+    Moves onto the stock, which the move command accepts but which never help, and resets of an empty discard, which
+    do nothing, are left out. Foundation moves come first.
+
+    :param:
+        board (Board): Board to find moves on
+
+    :return:
+        moves (list): Moves as (op, fromPile, toPile) tuples
+
+    """
+    cells = board.cells()
+    moves = []
+
+    # Rank each foundation needs next
+    needs = []
+    for suitPile in range(SPADES, SPADES + 4):
+        size = cells[suitPile]
+        if size:
+            needs.append(FOUNDATION_NEXT[cells[PILE_BASE[suitPile] + size - 1]])
+        else:
+            needs.append(1)
+
+    # Tableau piles by the rank of their top card. Empty piles are under rank 0.
+    byRank = [[] for rank in range(15)]
+    for pile in TABLEAU:
+        size = cells[pile]
+        if size:
+            slot = cells[PILE_BASE[pile] + size - 1]
+            byRank[SLOT_RANK[slot]].append(pile)
+        else:
+            byRank[0].append(pile)
+
+    pileMoves = []
+    for fromPile in _SOURCES:
+        size = cells[fromPile]
+        if not size:
+            continue
+        base = PILE_BASE[fromPile]
+        top = base + size - 1
+        slot = cells[top]
+
+        if SLOT_RANK[slot] == needs[SLOT_SUIT[slot]]:
+            moves.append((OP_SUIT, fromPile, SUIT))
+
+        if not slot & FACE_UP:
+            continue
+
+        # Walk down the run of visible cards that stack on each other
+        runStart = top
+        below = cells[runStart - 1]
+        while runStart > base and below & FACE_UP and STACKS_ON[cells[runStart] << 7 | below]:
+            runStart -= 1
+            below = cells[runStart - 1]
+
+        # The run can go on a top card one rank above any card of the run, or on an empty pile if it starts with a king
+        highRank = SLOT_RANK[cells[runStart]]
+        for rank in range(SLOT_RANK[slot] + 1, highRank + 2):
+            for toPile in byRank[rank]:
+                if toPile != fromPile:
+                    pileMoves.append((OP_PILE, fromPile, toPile))
+        if highRank == 13:
+            for toPile in byRank[0]:
+                pileMoves.append((OP_PILE, fromPile, toPile))
+
+    moves.extend(pileMoves)
+    if cells[STOCK]:
+        moves.append(_DISCARD_MOVE)
+    elif cells[DISCARD]:
+        moves.append(_RESET_MOVE)
+    return moves
+
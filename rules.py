@@ -0,0 +1,69 @@
+"""
+Rule tables.
+
+The rules of Klondike compiled once into lookup tables indexed by slot value: a card code (0 - 51, see card.py) with
+FACE_UP set if the card is visible (see board.py). Any slot read from a board can index them as it is, face up or not,
+so checking a move takes one table access and no rank arithmetic or suit names. The engine, the move generator, the
+solver, the simulators and the hint command all check moves with them.
+
+A card can be stacked on a card one rank above it, of any suit, as Engine.toPile has always allowed.
+"""
+from board import SPADES, CODE_MASK
+from card import CODE_RANK, CODE_SUIT
+
+# Slot values that can index the tables. Values that hold no card have rank 0.
+SLOT_COUNT = 128
+
+# Successor of a king, which no card follows
+NO_SUCCESSOR = 0xFF
+
+# Rank (1 - 13) and suit (0 - 3) of every slot value
+SLOT_RANK = bytes(CODE_RANK[slot & CODE_MASK] if slot & CODE_MASK < 52 else 0 for slot in range(SLOT_COUNT))
+SLOT_SUIT = bytes(CODE_SUIT[slot & CODE_MASK] if slot & CODE_MASK < 52 else 0 for slot in range(SLOT_COUNT))
+
+# STACKS_ON[upper << 7 | lower] is 1 if the upper slot may lie on the lower slot in a pile
+STACKS_ON = bytes(1 if SLOT_RANK[upper] and SLOT_RANK[upper] + 1 == SLOT_RANK[lower] else 0
+                  for upper in range(SLOT_COUNT) for lower in range(SLOT_COUNT))
+
+# Foundation pile of every slot value
+FOUNDATION = bytes(SPADES + SLOT_SUIT[slot] for slot in range(SLOT_COUNT))
+
+# Card code that goes on a foundation after the slot on top of it, NO_SUCCESSOR after a king
+SUCCESSOR = bytes((slot & CODE_MASK) + 1 if 0 < SLOT_RANK[slot] < 13 else NO_SUCCESSOR for slot in range(SLOT_COUNT))
+
+# Rank a foundation needs next, by the slot on top of it
+FOUNDATION_NEXT = bytes(SLOT_RANK[slot] + 1 for slot in range(SLOT_COUNT))
+
+
+def canStack(upper, lower):
+    """
+
+    Returns if a card may lie on another card in a pile.
+
+    :param:
+        upper (int): Slot of card put on top
+        lower (int): Slot of card under it
+
+    :return:
+        valid (bool): If the upper card stacks on the lower card
+
+    """
+    return STACKS_ON[upper << 7 | lower] == 1
+
+
+def canFound(slot, foundationTop):
+    """
+
+    Returns if a card may go on the foundation of its suit.
+
+    :param:
+        slot (int): Slot of card
+        foundationTop (int): Slot on top of the foundation of its suit, None if it is empty
+
+    :return:
+        valid (bool): If the card goes on the foundation
+
+    """
+    if foundationTop is None:
+        return SLOT_RANK[slot] == 1
+    return SUCCESSOR[foundationTop] == slot & CODE_MASK
@@ -0,0 +1,258 @@
+"""
+Compiled command scripts.
+
+A command script is parsed and checked once into a flat array of (op, a, b) triples, so replaying it runs no string
+handling at all: each triple is dispatched through a table straight to the Engine. Commands that can only fail, such as
+'move 8 1', are compiled to the failure they give. Names of save files and deal numbers are kept in a list of values
+that the triples index.
+
+Compiled scripts are cached on disk under the BLAKE2b hash of the script, so a script that has not changed is never
+parsed again.
+
+Examples:
+    python script.py samplegame.txt --repeat 1000
+    python script.py samplegame.txt --cache .klcache
+"""
+import argparse
+import hashlib
+import io
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from engine import Engine, FAILED, DONE, OP_PILE, OP_SUIT, OP_DISCARD, OP_RESET, OP_DEAL, OP_LOAD, OP_SAVE, OP_UNDO, \
+    OP_REDO, OP_NOTHING, OP_FAIL, parseCommand, runScript
+
+# Ops of compiled commands, those of engine.parseCommand. a and b are piles for moves, an index into the values for
+# deal, load and save, and the error code for FAIL.
+PILE = OP_PILE
+TO_SUIT = OP_SUIT
+DISCARD = OP_DISCARD
+RESET = OP_RESET
+DEAL = OP_DEAL
+LOAD = OP_LOAD
+SAVE = OP_SAVE
+UNDO = OP_UNDO
+REDO = OP_REDO
+NOTHING = OP_NOTHING
+FAIL = OP_FAIL
+
+# Cached scripts: magic, version, number of triples and number of values, then the triples as little endian 32 bit
+# ints and the values as lines of UTF-8 text
+CACHE_EXTENSION = '.klc'
+CACHE_MAGIC = b'KLC'
+CACHE_VERSION = 2
+CACHE_HEADER = struct.Struct('<3sBII')
+
+CompiledScript = namedtuple('CompiledScript', ['code', 'values'])
+
+
+def compileCommand(command, values):
+    """
+
+    Compiles one command, parsed and checked as Engine.apply parses it.
+
+    :param:
+        command (str): Command, such as 'move 6 4'
+        values (list): Values of the script, added to if the command has one
+
+    :return:
+        triple (tuple): Compiled command as (op, a, b)
+
+    """
+    op, a, b = parseCommand(command)
+    if op == DEAL or op == LOAD or op == SAVE:
+        values.append(a)
+        return op, len(values) - 1, 0
+    return op, a, b
+
+
+def compileScript(lines):
+    """
+
+    Compiles a command script, up to its 'done' command as runScript runs it.
+
+    :param:
+        lines (iterable): Commands of script
+
+    :return:
+        script (CompiledScript): Triples of the commands and the values they index
+
+    """
+    code = array('I')
+    values = []
+    for line in lines:
+        command = line.strip('\n')
+        if command == 'done':
+            break
+        code.extend(compileCommand(command, values))
+    return CompiledScript(code, values)
+
+
+def packScript(script):
+    """
+
+    Packs a compiled script into the bytes of a cache file.
+
+    :param:
+        script (CompiledScript): Compiled script
+
+    :return:
+        data (bytes): Cache file
+    """
+    code = array('I', script.code)
+    if sys.byteorder == 'big':
+        code.byteswap()
+    text = '\n'.join([str(value) for value in script.values]).encode('utf-8')
+    return CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(code) // 3, len(script.values)) + code.tobytes() + text
+
+
+def unpackScript(data):
+    """
+
+    Reads a compiled script from the bytes of a cache file.
+
+    :param:
+        data (bytes): Cache file
+
+    :return:
+        script (CompiledScript): Compiled script
+
+    """
+    if len(data) < CACHE_HEADER.size:
+        raise ValueError('Compiled script is too short!')
+    magic, version, triples, count = CACHE_HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        raise ValueError('Not a compiled script!')
+
+    start = CACHE_HEADER.size
+    end = start + 12 * triples
+    code = array('I')
+    code.frombytes(data[start:end])
+    if len(code) != 3 * triples:
+        raise ValueError('Compiled script is too short!')
+    if sys.byteorder == 'big':
+        code.byteswap()
+    if triples and max(code[0::3]) > FAIL:
+        raise ValueError('Compiled script has an unknown op!')
+
+    values = data[end:].decode('utf-8').split('\n') if count else []
+    if len(values) != count:
+        raise ValueError('Compiled script has the wrong number of values!')
+    # Deal numbers are the only values that are not names of files
+    for i in range(0, len(code), 3):
+        if code[i] == DEAL:
+            values[code[i + 1]] = int(values[code[i + 1]])
+    return CompiledScript(code, values)
+
+
+def loadScript(fileName, cacheDirectory=None):
+    """
+
+    Returns a command script compiled, from the cache if it was compiled before.
+
+    :param:
+        fileName (str): Name of command script
+        cacheDirectory (str): Directory of compiled scripts, created if it does not exist. None to always compile.
+
+    :return:
+        script (CompiledScript): Compiled script
+
+    """
+    with open(fileName, 'rb') as script:
+        data = script.read()
+    # Lines are split as a script opened as text splits them
+    if cacheDirectory is None:
+        return compileScript(io.StringIO(data.decode('utf-8'), newline=None))
+
+    # The version is part of the key, so scripts compiled by an older version are never read
+    key = hashlib.blake2b(data, digest_size=16, person=b'klondike-script' + bytes([CACHE_VERSION])).hexdigest()
+    cacheName = os.path.join(cacheDirectory, key + CACHE_EXTENSION)
+    try:
+        with open(cacheName, 'rb') as cached:
+            return unpackScript(cached.read())
+    except (OSError, ValueError):
+        pass
+
+    compiled = compileScript(io.StringIO(data.decode('utf-8'), newline=None))
+    os.makedirs(cacheDirectory, exist_ok=True)
+    # Written beside the cache file and renamed, so other processes never read half of it
+    temporary = '%s.%d' % (cacheName, os.getpid())
+    with open(temporary, 'wb') as cached:
+        cached.write(packScript(compiled))
+    os.replace(temporary, cacheName)
+    return compiled
+
+
+def runCompiled(script, loadCache=None, engine=None):
+    """
+
+    Runs a compiled script, as runScript runs the script it was compiled from.
+
+    :param:
+        script (CompiledScript): Compiled script
+        loadCache (dict): Parsed save files shared between scripts
+        engine (Engine): Engine to run the script on, a new one if None
+
+    :return:
+        engine (Engine): Engine the script ran on
+        commands (int): Number of commands run
+        failed (int): Number of commands that failed
+
+    """
+    if engine is None:
+        engine = Engine(loadCache=loadCache)
+    values = script.values
+
+    table = (engine.toPile,
+             lambda a, b: engine.toSuit(a),
+             lambda a, b: engine.discard(),
+             lambda a, b: engine.reset(),
+             lambda a, b: engine.deal(values[a]),
+             lambda a, b: engine.load(values[a]),
+             lambda a, b: engine.save(values[a]),
+             lambda a, b: engine.undo(),
+             lambda a, b: engine.redo(),
+             lambda a, b: DONE,
+             lambda a, b: FAILED[a])
+
+    code = script.code
+    failed = 0
+    for op, a, b in zip(code[0::3], code[1::3], code[2::3]):
+        if not table[op](a, b).success:
+            failed += 1
+    return engine, len(code) // 3, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile command scripts and time replaying them.')
+    parser.add_argument('scripts', nargs='+', help='command scripts, such as samplegame.txt')
+    parser.add_argument('--repeat', type=int, default=1000, help='number of times each script is run')
+    parser.add_argument('--cache', help='directory of compiled scripts')
+    args = parser.parse_args()
+
+    texts = []
+    for fileName in args.scripts:
+        with open(fileName, 'r') as script:
+            texts.append(script.readlines())
+
+    start = time.perf_counter()
+    compiled = [loadScript(fileName, args.cache) for fileName in args.scripts]
+    print('compiled %d scripts in %.3f ms' % (len(compiled), 1e3 * (time.perf_counter() - start)))
+
+    for label, run, scripts in (('parsed', runScript, texts), ('compiled', runCompiled, compiled)):
+        loadCache = {}
+        commands = 0
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            for script in scripts:
+                commands += run(script, loadCache)[1]
+        seconds = time.perf_counter() - start
+        print('%-8s %d commands in %.3f s, %.0f commands/sec' % (label, commands, seconds, commands / seconds))
+
+
+if __name__ == '__main__':
+    main()
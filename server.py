@@ -0,0 +1,398 @@
+"""
+Klondike game server.
+
+Hosts many games from one process. Every connection gets its own Solitaire and speaks the command language of
+klondike.py, one command per line: the server answers with what the command shows, then the prompt 'Your move: ' as
+inputGame does. 'done' ends the session. 'menu' is not served, since it asks for more input.
+
+save and load only reach files in the directory the server is given, named without any path, and are refused if it
+has none. A command that fails on the server is answered with an error line, and the session goes on.
+
+Sessions idle for longer than the timeout are closed. Output is sent with the backpressure of asyncio: a session stops
+reading commands while its client is not reading answers, and a client that stops reading for longer than the timeout
+is dropped.
+
+The load generator opens many sessions at once, plays random commands in each and reports the latency of commands.
+
+Examples:
+    python server.py serve --port 7777
+    python server.py serve --port 7777 --files saves/
+    python server.py serve --unix /tmp/klondike.sock
+    python server.py bench --sessions 10000 --commands 20
+    python server.py bench --port 7777
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import time
+
+from klondike import Solitaire
+from sinks import Sink
+
+PROMPT = b'Your move: '
+WELCOME = b'Welcome to Klondike!\n'
+GOODBYE = b'Thank you for playing!\n'
+TIMED_OUT = b'\nSession timed out.\n'
+NO_MENU = b'The menu is not available here.\n'
+NO_FILES = b'Files are not available here.\n'
+BAD_NAME = b'File names can not contain a path.\n'
+COMMAND_FAILED = b'Command failed on the server!\n'
+
+# Commands that name a file
+FILE_COMMANDS = ('save', 'load')
+
+# Longest command line accepted
+LINE_LIMIT = 4096
+
+# Connections waiting to be accepted. Sessions connect in bursts, and connections past a short queue can stall.
+BACKLOG = 4096
+
+# Bytes an unread answer may take before a session waits for its client to read
+WRITE_LIMIT = 64 * 1024
+
+
+class SessionSink(Sink):
+    showsText = True
+
+    def __init__(self):
+        """
+
+        Makes a sink that holds the text of one answer until the session sends it.
+
+        :param:
+            None
+
+        """
+        self.__parts = []
+
+    def write(self, text):
+        self.__parts.append(text)
+
+    def take(self):
+        """
+
+        Returns the text written since the last call, and forgets it.
+
+        :param:
+            None
+
+        :return:
+            text (bytes): Text written, encoded
+        """
+        text = ''.join(self.__parts).encode('utf-8')
+        self.__parts = []
+        return text
+
+
+class GameServer:
+    def __init__(self, idleTimeout=300.0, historyLimit=1000, fileDirectory=None):
+        """
+
+        Makes a server. Nothing is opened until serve is called.
+
+        :param:
+            idleTimeout (float): Seconds a session may wait for a command, or for its client to read an answer
+            historyLimit (int): Most moves each session can undo
+            fileDirectory (str): Directory save and load use, None to refuse them
+
+        """
+        self.__idleTimeout = idleTimeout
+        self.__historyLimit = historyLimit
+        self.__fileDirectory = fileDirectory
+        self.sessions = 0
+        self.commands = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    async def serve(self, host='127.0.0.1', port=7777, unixPath=None):
+        """
+
+        Opens the socket and returns the asyncio server, serving in the background.
+
+        :param:
+            host (str): Address to listen on
+            port (int): Port to listen on, 0 for any free port
+            unixPath (str): Path of a Unix socket to listen on instead of TCP
+
+        :return:
+            server (asyncio.Server): Server
+        """
+        if unixPath is not None:
+            return await asyncio.start_unix_server(self.handle, unixPath, limit=LINE_LIMIT, backlog=BACKLOG)
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT, backlog=BACKLOG)
+
+    async def handle(self, reader, writer):
+        """
+
+        Plays one session, until the client sends 'done', disconnects or times out.
+
+        :param:
+            reader (asyncio.StreamReader): Commands from client
+            writer (asyncio.StreamWriter): Answers to client
+
+        :return:
+            None
+        """
+        writer.transport.set_write_buffer_limits(high=WRITE_LIMIT)
+        sink = SessionSink()
+        game = Solitaire(historyLimit=self.__historyLimit, sink=sink)
+        self.sessions += 1
+        try:
+            await self.__send(writer, WELCOME + PROMPT)
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.__idleTimeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    writer.write(TIMED_OUT)
+                    break
+                if not line:
+                    break
+
+                move = line.decode('utf-8', 'replace').rstrip('\r\n')
+                if move == 'done':
+                    await self.__send(writer, GOODBYE)
+                    break
+                self.commands += 1
+                words = move.split(' ')
+                if words[0] == 'menu':
+                    await self.__send(writer, NO_MENU + PROMPT)
+                    continue
+                if words[0] in FILE_COMMANDS and len(words) == 2:
+                    if self.__fileDirectory is None:
+                        await self.__send(writer, NO_FILES + PROMPT)
+                        continue
+                    path = self.filePath(words[1])
+                    if path is None:
+                        await self.__send(writer, BAD_NAME + PROMPT)
+                        continue
+                    move = words[0] + ' ' + path
+                try:
+                    game.runGame(move)
+                except Exception:
+                    # One bad command must not end the session, or the server
+                    self.failures += 1
+                    await self.__send(writer, sink.take() + COMMAND_FAILED + PROMPT)
+                    continue
+                await self.__send(writer, sink.take() + PROMPT)
+        except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            # Slow clients, lines over the limit and dropped connections end the session
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    def filePath(self, name):
+        """
+
+        Returns the path a file name given by a client stands for, in the directory of the server.
+
+        :param:
+            name (str): File name from a save or load command
+
+        :return:
+            path (str): Path of file, None if the name is not a plain file name
+        """
+        if name in ('', '.', '..') or '/' in name or '\\' in name or '\0' in name or \
+                (os.altsep is not None and os.altsep in name):
+            return None
+        return os.path.join(self.__fileDirectory, name)
+
+    async def __send(self, writer, data):
+        """
+
+        Sends an answer, waiting while the client is behind on reading.
+
+        :param:
+            writer (asyncio.StreamWriter): Answers to client
+            data (bytes): Answer
+
+        :return:
+            None
+        """
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), self.__idleTimeout)
+
+
+# Load generator
+BENCH_COMMANDS = ['discard', 'discard', 'reset', 'board', 'move stock suit'] + \
+                 ['move stock %d' % pile for pile in range(1, 8)] + \
+                 ['move %d suit' % pile for pile in range(1, 8)] + \
+                 ['move %d %d' % (first, second) for first in range(1, 8) for second in range(1, 8) if first != second]
+
+
+async def benchSession(host, port, number, commands, latencies, unixPath=None):
+    """
+
+    Plays one session of random commands on a numbered deal, adding the latency of each command.
+
+    :param:
+        host (str): Address of server
+        port (int): Port of server
+        number (int): Number of deal, also the seed of the commands
+        commands (int): Number of commands after the deal
+        latencies (list): Seconds each command took, added to
+        unixPath (str): Path of a Unix socket to connect to instead of TCP
+
+    :return:
+        None
+    """
+    if unixPath is not None:
+        reader, writer = await asyncio.open_unix_connection(unixPath)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    rnd = random.Random(number)
+    await reader.readuntil(PROMPT)
+
+    for i in range(commands + 1):
+        move = 'deal %d' % number if i == 0 else rnd.choice(BENCH_COMMANDS)
+        start = time.perf_counter()
+        writer.write(move.encode() + b'\n')
+        await reader.readuntil(PROMPT)
+        latencies.append(time.perf_counter() - start)
+
+    writer.write(b'done\n')
+    await reader.read()
+    writer.close()
+
+
+def raiseFileLimit():
+    """
+
+    Raises the limit on open files to the most allowed, since every session takes a socket.
+
+    :param:
+        None
+
+    :return:
+        limit (int): Open files allowed
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def startServer(unixPath=None):
+    """
+
+    Starts a server in a child process, so the server and the load generator each have their own limit of open files.
+
+    :param:
+        unixPath (str): Path of a Unix socket to serve on instead of a free TCP port
+
+    :return:
+        process (multiprocessing.Process): Server process, to be terminated when done
+        port (int): Port of server, None for a Unix socket
+    """
+    # The socket is opened here so it is listening before this returns, and the child inherits it
+    if unixPath is not None:
+        if os.path.exists(unixPath):
+            os.unlink(unixPath)
+        listening = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listening.bind(unixPath)
+        port = None
+    else:
+        listening = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listening.bind(('127.0.0.1', 0))
+        port = listening.getsockname()[1]
+    listening.listen(BACKLOG)
+
+    def run():
+        raiseFileLimit()
+
+        async def serveSocket():
+            server = GameServer()
+            if unixPath is not None:
+                listener = await asyncio.start_unix_server(server.handle, sock=listening, limit=LINE_LIMIT,
+                                                      backlog=BACKLOG)
+            else:
+                listener = await asyncio.start_server(server.handle, sock=listening, limit=LINE_LIMIT,
+                                                      backlog=BACKLOG)
+            async with listener:
+                await listener.serve_forever()
+
+        asyncio.run(serveSocket())
+
+    process = multiprocessing.get_context('fork').Process(target=run, daemon=True)
+    process.start()
+    listening.close()
+    return process, port
+
+
+async def bench(sessions=10000, commands=20, host='127.0.0.1', port=7777, unixPath=None):
+    """
+
+    Plays many sessions at once on a server.
+
+    :param:
+        sessions (int): Number of sessions open at the same time
+        commands (int): Number of commands in each session, after the deal
+        host (str): Address of server
+        port (int): Port of server
+        unixPath (str): Path of a Unix socket to connect to instead of TCP
+
+    :return:
+        stats (dict): Sessions, commands, seconds, commands per second, and p50, p99 and worst latency in ms
+    """
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[benchSession(host, port, number, commands, latencies, unixPath)
+                           for number in range(sessions)])
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {'sessions': sessions, 'commands': len(latencies), 'seconds': seconds,
+            'commandsPerSecond': len(latencies) / seconds,
+            'p50': 1e3 * latencies[len(latencies) // 2], 'p99': 1e3 * latencies[len(latencies) * 99 // 100],
+            'worst': 1e3 * latencies[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Klondike games over a socket, or load test the server.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='serve games until stopped')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    serve.add_argument('--port', type=int, default=7777, help='port to listen on')
+    serve.add_argument('--unix', help='path of a Unix socket to listen on instead of TCP')
+    serve.add_argument('--timeout', type=float, default=300.0, help='seconds before an idle session is closed')
+    serve.add_argument('--files', metavar='DIR', help='directory save and load use, refused if not given')
+    load = commands.add_parser('bench', help='play many sessions at once, on a new server unless one is given')
+    load.add_argument('--sessions', type=int, default=10000, help='number of sessions at the same time')
+    load.add_argument('--commands', type=int, default=20, help='number of commands in each session')
+    load.add_argument('--host', default='127.0.0.1', help='address of a running server')
+    load.add_argument('--port', type=int, help='port of a running server')
+    load.add_argument('--unix', help='path of a Unix socket, of a running server if --port is given')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        raiseFileLimit()
+
+        async def serveForever():
+            listener = await GameServer(args.timeout, fileDirectory=args.files).serve(args.host, args.port, args.unix)
+            async with listener:
+                await listener.serve_forever()
+
+        asyncio.run(serveForever())
+    else:
+        raiseFileLimit()
+        process = None
+        port = args.port
+        if port is None:
+            process, port = startServer(args.unix)
+        try:
+            stats = asyncio.run(bench(args.sessions, args.commands, args.host, port, args.unix))
+        finally:
+            if process is not None:
+                process.terminate()
+        print('%d sessions, %d commands in %.2f s, %.0f commands/sec' % (stats['sessions'], stats['commands'],
+                                                                        stats['seconds'], stats['commandsPerSecond']))
+        print('latency p50 %.2f ms, p99 %.2f ms, worst %.2f ms' % (stats['p50'], stats['p99'], stats['worst']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,513 @@
+"""
+Pool of game sessions with bounded memory.
+
+Sessions are Solitaire games known by an id. The most recently used ones are kept in memory, and when the pool holds
+more sessions or more bytes than allowed, the least recently used one is saved to disk and dropped. The next command
+for an evicted session loads it back without the caller noticing. Only the position is kept, so moves made before a
+session was evicted can not be undone after it is loaded.
+
+Evicted games are binary saves (see engine.BINARY_FORMAT) in a SessionStore: one file that is a hash table on disk,
+read and written in place a bucket at a time, so memory does not grow with the number of users and no file is opened
+per eviction. Games of more than 52 cards do not fit a binary save and are written as text saves beside it.
+
+Examples:
+    python sessions.py --users 100000 --size 1000
+"""
+import argparse
+import hashlib
+import os
+import random
+import struct
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from board import NUM_PILES
+from engine import BINARY_FORMAT, parseBinary, saveBinary, saveText
+from klondike import Solitaire
+from sinks import NullSink
+
+# Memory of a session, measured with tracemalloc: about 5 KB for the game and 40 bytes for each move it can undo
+SESSION_BYTES = 5000
+HISTORY_BYTES = 40
+
+STORE_NAME = 'sessions.kls'
+STORE_MAGIC = b'KLS'
+STORE_VERSION = 1
+
+# Header: magic, version, number of buckets and number of buckets in use. Each bucket is the hashed id of a session and
+# the binary save of its game. An id of all zeros marks an empty bucket, all ones a dropped session.
+STORE_HEADER = struct.Struct('<3sBII')
+KEY_SIZE = 16
+BUCKET_SIZE = KEY_SIZE + BINARY_FORMAT.size
+EMPTY = bytes(KEY_SIZE)
+DROPPED = b'\xff' * KEY_SIZE
+
+# Stored in place of the binary save of a game too large for one, which is in a text save named after its key
+TEXT_SAVE = b'TX' + bytes(BINARY_FORMAT.size - 2)
+
+
+class SessionStore:
+    def __init__(self, fileName, capacity=1024):
+        """
+
+        Opens a store, creating it if it does not exist.
+
+        :param:
+            fileName (str): Name of store
+            capacity (int): Number of buckets of a new store, doubled whenever half of them are in use
+
+        """
+        if not os.path.exists(fileName):
+            with open(fileName, 'wb') as newStore:
+                newStore.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, capacity, 0))
+                newStore.truncate(STORE_HEADER.size + capacity * BUCKET_SIZE)
+
+        self.__fileName = fileName
+        self.__fd = os.open(fileName, os.O_RDWR)
+        magic, version, self.__capacity, self.__used = STORE_HEADER.unpack(os.pread(self.__fd, STORE_HEADER.size, 0))
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            os.close(self.__fd)
+            raise ValueError('Not a session store!')
+
+    def close(self):
+        """
+
+        Closes the store.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        os.close(self.__fd)
+
+    def __find(self, key):
+        """
+
+        Finds the bucket of a key, or the bucket it would go in.
+
+        :param:
+            key (bytes): Hashed id of session
+
+        :return:
+            bucket (int): Bucket holding key, or the first free bucket on its probe sequence
+            found (bool): True if the bucket holds key
+            record (bytes): Binary save in the bucket if found, otherwise None
+
+        """
+        bucket = int.from_bytes(key[:8], 'little') % self.__capacity
+        free = None
+        for i in range(self.__capacity):
+            data = os.pread(self.__fd, BUCKET_SIZE, STORE_HEADER.size + bucket * BUCKET_SIZE)
+            stored = data[:KEY_SIZE]
+            if stored == key:
+                return bucket, True, data[KEY_SIZE:]
+            if stored == EMPTY:
+                return (bucket if free is None else free), False, None
+            if stored == DROPPED and free is None:
+                free = bucket
+            bucket = (bucket + 1) % self.__capacity
+        return free, False, None
+
+    def get(self, key):
+        """
+
+        Returns the binary save stored under a key.
+
+        :param:
+            key (bytes): Hashed id of session
+
+        :return:
+            record (bytes): Binary save, None if there is none
+
+        """
+        return self.__find(key)[2]
+
+    def put(self, key, record):
+        """
+
+        Stores a binary save under a key, replacing the one stored before.
+
+        :param:
+            key (bytes): Hashed id of session
+            record (bytes): Binary save
+
+        :return:
+            stored (bytes): Binary save replaced, None if there was none
+
+        """
+        bucket, found, stored = self.__find(key)
+        offset = STORE_HEADER.size + bucket * BUCKET_SIZE
+        # A dropped bucket is still counted as in use, so only filling an empty one adds to the count
+        if not found and os.pread(self.__fd, KEY_SIZE, offset) == EMPTY:
+            if 2 * (self.__used + 1) > self.__capacity:
+                self.__grow()
+                bucket = self.__find(key)[0]
+            self.__used += 1
+            os.pwrite(self.__fd, STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, self.__capacity, self.__used), 0)
+            offset = STORE_HEADER.size + bucket * BUCKET_SIZE
+        os.pwrite(self.__fd, key + record, offset)
+        return stored
+
+    def drop(self, key):
+        """
+
+        Forgets the binary save stored under a key.
+
+        :param:
+            key (bytes): Hashed id of session
+
+        :return:
+            None
+
+        """
+        bucket, found, stored = self.__find(key)
+        if found:
+            # The bucket stays in use, so keys that probed past it are still found
+            os.pwrite(self.__fd, DROPPED + bytes(BINARY_FORMAT.size), STORE_HEADER.size + bucket * BUCKET_SIZE)
+
+    def __grow(self):
+        """
+
+        Moves every stored save to a new file with twice the buckets, leaving out dropped ones.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        newName = self.__fileName + '.new'
+        if os.path.exists(newName):
+            os.remove(newName)
+        bigger = SessionStore(newName, 2 * self.__capacity)
+        for start in range(0, self.__capacity, 4096):
+            count = min(4096, self.__capacity - start)
+            data = os.pread(self.__fd, count * BUCKET_SIZE, STORE_HEADER.size + start * BUCKET_SIZE)
+            for offset in range(0, len(data), BUCKET_SIZE):
+                key = data[offset:offset + KEY_SIZE]
+                if key != EMPTY and key != DROPPED:
+                    bigger.put(key, data[offset + KEY_SIZE:offset + BUCKET_SIZE])
+        bigger.close()
+
+        os.replace(newName, self.__fileName)
+        os.close(self.__fd)
+        self.__fd = os.open(self.__fileName, os.O_RDWR)
+        self.__capacity, self.__used = STORE_HEADER.unpack(os.pread(self.__fd, STORE_HEADER.size, 0))[2:]
+
+
+class SessionPool:
+    def __init__(self, directory, maxSessions=1000, maxBytes=None, historyLimit=1000, makeGame=None):
+        """
+
+        Makes a pool. Sessions evicted by an earlier pool on the same directory are loaded from it too.
+
+        :param:
+            directory (str): Directory evicted sessions are saved to, created if it does not exist
+            maxSessions (int): Most sessions kept in memory
+            maxBytes (int): Most bytes the sessions in memory may take, None for no limit
+            historyLimit (int): Most moves each session can undo
+            makeGame (function): Returns a new Solitaire for a session id, None for a game that shows nothing
+
+        """
+        assert maxSessions > 0, 'Pool must hold at least one session!'
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__store = SessionStore(os.path.join(directory, STORE_NAME))
+        self.__maxSessions = maxSessions
+        self.__maxBytes = maxBytes
+        if makeGame is None:
+            makeGame = lambda sessionId: Solitaire(historyLimit=historyLimit, sink=NullSink())
+        self.__makeGame = makeGame
+
+        # Sessions in memory, least recently used first, with the bytes each was last counted as
+        self.__sessions = OrderedDict()
+        self.__bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.creates = 0
+        self.evictions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return len(self.__sessions)
+
+    def __contains__(self, sessionId):
+        return sessionId in self.__sessions or self.__store.get(sessionKey(sessionId)) is not None
+
+    def memoryBytes(self):
+        """
+
+        Returns the bytes the sessions in memory are counted as.
+
+        :param:
+            None
+
+        :return:
+            bytes (int): Bytes of sessions in memory
+
+        """
+        return self.__bytes
+
+    def stats(self):
+        """
+
+        Returns the counters of the pool.
+
+        :param:
+            None
+
+        :return:
+            stats (dict): Sessions and bytes in memory, hits, misses (sessions loaded from disk), creates and evictions
+
+        """
+        return {'sessions': len(self.__sessions), 'bytes': self.__bytes, 'hits': self.hits, 'misses': self.misses,
+                'creates': self.creates, 'evictions': self.evictions}
+
+    def get(self, sessionId):
+        """
+
+        Returns the game of a session, loading it if it was evicted and starting it if it is new. The game counts as
+        just used, and its size is counted again, so moves made on it since it was last returned are counted.
+
+        :param:
+            sessionId (str): Id of session
+
+        :return:
+            game (Solitaire): Game of session
+
+        """
+        if sessionId in self.__sessions:
+            self.hits += 1
+            game, size = self.__sessions[sessionId]
+            self.__sessions.move_to_end(sessionId)
+            self.__bytes -= size
+        else:
+            game = self.__load(sessionId)
+
+        size = sessionBytes(game)
+        self.__sessions[sessionId] = (game, size)
+        self.__bytes += size
+        self.__evict()
+        return game
+
+    def run(self, sessionId, command):
+        """
+
+        Runs a command of the command language in a session.
+
+        :param:
+            sessionId (str): Id of session
+            command (str): Command, such as 'move 6 4'
+
+        :return:
+            done (bool): True if the command was 'done'
+
+        """
+        return self.get(sessionId).runGame(command) == True
+
+    def drop(self, sessionId):
+        """
+
+        Forgets a session, in memory and on disk.
+
+        :param:
+            sessionId (str): Id of session
+
+        :return:
+            None
+
+        """
+        if sessionId in self.__sessions:
+            self.__bytes -= self.__sessions.pop(sessionId)[1]
+        key = sessionKey(sessionId)
+        if self.__store.get(key) == TEXT_SAVE:
+            os.remove(self.__textName(key))
+        self.__store.drop(key)
+
+    def flush(self):
+        """
+
+        Saves every session in memory to disk and drops them, so a later pool on the directory can load them.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        while self.__sessions:
+            self.__evictOldest()
+
+    def close(self):
+        """
+
+        Saves every session in memory to disk and closes the store.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.flush()
+        self.__store.close()
+
+    def __textName(self, key):
+        """
+
+        Returns the name of the text save of a game too large for a binary save.
+
+        :param:
+            key (bytes): Hashed id of session
+
+        :return:
+            fileName (str): Name of text save
+
+        """
+        return os.path.join(self.__directory, key.hex() + '.txt')
+
+    def __load(self, sessionId):
+        """
+
+        Loads an evicted session, or starts a new one.
+
+        :param:
+            sessionId (str): Id of session
+
+        :return:
+            game (Solitaire): Game of session
+
+        """
+        game = self.__makeGame(sessionId)
+        key = sessionKey(sessionId)
+        record = self.__store.get(key)
+        if record is None:
+            self.creates += 1
+        elif record == TEXT_SAVE:
+            self.misses += 1
+            result = game.engine.load(self.__textName(key))
+            assert result.success, 'Evicted session could not be loaded!'
+        else:
+            self.misses += 1
+            # The save stays in the store until the session is evicted again and written over
+            for pile, slots in parseBinary(record):
+                game.board.pushMany(pile, slots)
+        return game
+
+    def __evict(self):
+        """
+
+        Evicts the least recently used sessions until the pool is within its limits. The session used last is kept.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        while len(self.__sessions) > 1 and (len(self.__sessions) > self.__maxSessions or
+                                            self.__maxBytes is not None and self.__bytes > self.__maxBytes):
+            self.__evictOldest()
+
+    def __evictOldest(self):
+        """
+
+        Saves the least recently used session to disk and drops it from memory.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        sessionId, (game, size) = self.__sessions.popitem(last=False)
+        self.__bytes -= size
+
+        key = sessionKey(sessionId)
+        if sum(game.board.cells()[:NUM_PILES]) <= 52:
+            if self.__store.put(key, saveBinary(game.board)) == TEXT_SAVE:
+                # The game was too large for a binary save when it was evicted before
+                os.remove(self.__textName(key))
+        else:
+            with open(self.__textName(key), 'w') as textSave:
+                textSave.write(saveText(game.board))
+            self.__store.put(key, TEXT_SAVE)
+        self.evictions += 1
+
+
+def sessionKey(sessionId):
+    """
+
+    Returns the key a session is stored under: its id hashed, so ids of any length fit a bucket.
+
+    :param:
+        sessionId (str): Id of session
+
+    :return:
+        key (bytes): KEY_SIZE bytes
+
+    """
+    return hashlib.blake2b(sessionId.encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+
+def sessionBytes(game):
+    """
+
+    Returns about how many bytes of memory a game takes.
+
+    :param:
+        game (Solitaire): Game
+
+    :return:
+        bytes (int): Bytes of game
+
+    """
+    return SESSION_BYTES + HISTORY_BYTES * game.engine.historySize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many users through a session pool and measure its memory.')
+    parser.add_argument('--users', type=int, default=100000, help='number of users')
+    parser.add_argument('--commands', type=int, default=200000, help='number of commands, each from a random user')
+    parser.add_argument('--size', type=int, default=1000, help='most sessions in memory')
+    parser.add_argument('--bytes', type=int, help='most bytes of sessions in memory')
+    parser.add_argument('--directory', default='sessions', help='directory for evicted sessions')
+    args = parser.parse_args()
+
+    commands = ['discard', 'reset', 'move stock suit'] + ['move stock %d' % pile for pile in range(1, 8)] + \
+               ['move %d suit' % pile for pile in range(1, 8)]
+    rnd = random.Random(1)
+    tracemalloc.start()
+    pool = SessionPool(args.directory, args.size, args.bytes)
+    start = time.perf_counter()
+    for i in range(args.commands):
+        user = rnd.randrange(args.users)
+        sessionId = 'user-%d' % user
+        if sessionId not in pool:
+            pool.run(sessionId, 'deal %d' % user)
+        pool.run(sessionId, rnd.choice(commands))
+        if (i + 1) % max(1, args.commands // 4) == 0:
+            print('%7d commands: %6d KB traced, %s' % (i + 1, tracemalloc.get_traced_memory()[0] // 1024,
+                                                       pool.stats()))
+    seconds = time.perf_counter() - start
+    pool.close()
+    print('%.0f commands/sec, %d KB peak' % (args.commands / seconds, tracemalloc.get_traced_memory()[1] // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Output sinks.
+
+Solitaire sends everything it shows to a sink instead of printing it. ConsoleSink prints as the game always has,
+NullSink drops everything, BufferedSink writes the text to a file in large blocks, and EventSink writes one JSON line
+per command with its result and the piles it changed. Sinks that do not show text let Solitaire skip rendering the
+board altogether, so quiet replays run at the speed of the engine.
+"""
+import io
+import json
+import sys
+
+from board import PILE_NAMES
+
+
+class Sink:
+    # If the sink shows text. Solitaire does not render boards for sinks that do not.
+    showsText = False
+
+    def write(self, text):
+        """
+
+        Shows text.
+
+        :param:
+            text (str): Text to show, with its line breaks
+
+        :return:
+            None
+
+        """
+        pass
+
+    def event(self, command, result, message):
+        """
+
+        Records the result of a command.
+
+        :param:
+            command (str): Command as given
+            result (Result): Result of command from the engine
+            message (str): Error message shown for the command, None if it worked
+
+        :return:
+            None
+
+        """
+        pass
+
+    def flush(self):
+        """
+
+        Writes out anything held back.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        pass
+
+    def close(self):
+        """
+
+        Writes out anything held back and closes the file of the sink, if it opened one.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class NullSink(Sink):
+    pass
+
+
+class ConsoleSink(Sink):
+    showsText = True
+
+    def write(self, text):
+        # Looked up every time, so redirecting standard output works as it does for print
+        sys.stdout.write(text)
+
+    def flush(self):
+        sys.stdout.flush()
+
+
+class BufferedSink(Sink):
+    showsText = True
+
+    def __init__(self, target, bufferSize=1 << 20):
+        """
+
+        Makes a sink that writes text to a file, a large block at a time.
+
+        :param:
+            target (str): Name of file to write, or an open text file that is left open on close
+            bufferSize (int): Characters held before they are written
+
+        """
+        if isinstance(target, str):
+            self.__file = open(target, 'w')
+            self.__owned = True
+        else:
+            self.__file = target
+            self.__owned = False
+        self.__bufferSize = bufferSize
+        self.__parts = []
+        self.__size = 0
+
+    def write(self, text):
+        self.__parts.append(text)
+        self.__size += len(text)
+        if self.__size >= self.__bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self.__parts:
+            self.__file.write(''.join(self.__parts))
+            self.__parts = []
+            self.__size = 0
+        self.__file.flush()
+
+    def close(self):
+        self.flush()
+        if self.__owned:
+            self.__file.close()
+
+
+class EventSink(Sink):
+    def __init__(self, target, withText=False):
+        """
+
+        Makes a sink that writes a JSON line for every command: the command, if it worked, its error code and
+        message, and the names of the piles it changed.
+
+        :param:
+            target (str): Name of file to write, or an open text file that is left open on close
+            withText (bool): Also render the text a command shows, such as the board, into an 'output' field
+
+        """
+        if isinstance(target, str):
+            self.__file = open(target, 'w')
+            self.__owned = True
+        else:
+            self.__file = target
+            self.__owned = False
+        self.showsText = withText
+        self.__text = io.StringIO()
+
+    def write(self, text):
+        if self.showsText:
+            self.__text.write(text)
+
+    def event(self, command, result, message):
+        record = {'command': command, 'success': result.success, 'error': result.error, 'message': message,
+                  'changed': [PILE_NAMES[pile] for pile in result.changed]}
+        if self.showsText:
+            record['output'] = self.__text.getvalue()
+            self.__text = io.StringIO()
+        self.__file.write(json.dumps(record) + '\n')
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        self.flush()
+        if self.__owned:
+            self.__file.close()
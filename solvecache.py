@@ -0,0 +1,270 @@
+"""
+Persistent cache of solver results.
+
+Results of solve are kept in a SQLite database, keyed by the fingerprint of the position solved (see
+dedup.positionKey): whether it can be won, the length of the shortest solution found, and that solution as a command
+script in the syntax of samplegame.txt, with the version of the solver that found it. solve looks in the cache before it
+searches, so a position is never solved twice, and the hint command plays the first move of a cached solution.
+
+The fingerprint is taken of the canonical form of the position (see canonical.py), so positions that only differ in
+the order of the tableau piles or the names of the suits share one result. Scripts are kept with the tableau piles
+numbered as in the canonical form, and numbered back for the position looked up.
+
+Only results that settle a position are kept: a solution, or a search that finished without one. A solution replaces
+a cached one of the same solver version only if it is shorter, and a search without one never replaces a solution.
+Results of another solver version count as misses and are replaced.
+
+The cache holds at most a set number of positions. When it is full the least recently used tenth is evicted. The
+database is in WAL mode and every read and write is a transaction of its own, so worker processes can share one cache
+file, each with its own SolveCache. Hits, misses, stores and evictions are counted in the database, for all processes,
+and in each SolveCache, for its own.
+
+Examples:
+    python solver.py Game1-start.txt --cache results.db
+    python batchsolve.py --deals 0:1000 deals.jsonl --cache results.db
+    python solvecache.py results.db
+    python solvecache.py results.db --max-entries 10000
+"""
+import argparse
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from canonical import canonicalize, renumberCommands
+from dedup import formKey
+from solver import SOLVER_VERSION, SolveResult
+
+SCHEMA_VERSION = 2
+
+# Counters kept in the database
+COUNTERS = ('hits', 'misses', 'stores', 'evictions', 'entries')
+
+# Fraction of the cache evicted at once when it is full, so eviction does not run on every store
+EVICT_FRACTION = 0.1
+
+
+class SolveCache:
+    def __init__(self, fileName, maxEntries=1000000, timeout=30.0):
+        """
+
+        Opens a cache, creating it if it does not exist.
+
+        :param:
+            fileName (str): Name of database
+            maxEntries (int): Most positions kept
+            timeout (float): Most seconds to wait for another process holding the database
+
+        """
+        assert maxEntries > 0, 'Cache must hold at least one position!'
+        self.__maxEntries = maxEntries
+        self.__connection = sqlite3.connect(fileName, timeout=timeout, isolation_level=None)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+
+        with self.__transaction() as cursor:
+            cursor.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            cursor.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, solved INTEGER NOT NULL, '
+                           'length INTEGER NOT NULL, script TEXT NOT NULL, version INTEGER NOT NULL, '
+                           'nodes INTEGER NOT NULL, seconds REAL NOT NULL, used REAL NOT NULL)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS resultsUsed ON results (used)')
+            cursor.executemany('INSERT OR IGNORE INTO meta VALUES (?, 0)', [(name,) for name in COUNTERS])
+            cursor.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('schema', SCHEMA_VERSION))
+            schema = cursor.execute('SELECT value FROM meta WHERE name = ?', ('schema',)).fetchone()[0]
+        if schema != SCHEMA_VERSION:
+            self.__connection.close()
+            raise ValueError('Solve cache has another schema!')
+
+        # Counts of this cache only
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        """
+
+        Closes the cache.
+
+        :param:
+            None
+
+        :return:
+            None
+
+        """
+        self.__connection.close()
+
+    @contextmanager
+    def __transaction(self):
+        """
+
+        Runs a block in a transaction, committed if the block ends normally and rolled back if it raises. The write
+        lock is taken at the start, so two processes never both read and then both wait to write.
+
+        :param:
+            None
+
+        :return:
+            cursor (sqlite3.Cursor): Cursor of transaction
+
+        """
+        cursor = self.__connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        else:
+            cursor.execute('COMMIT')
+        finally:
+            cursor.close()
+
+    def get(self, board):
+        """
+
+        Returns the cached result of a position.
+
+        :param:
+            board (Board): Position
+
+        :return:
+            result (SolveResult): Result as solve returns it, with no nodes searched and the seconds of the lookup,
+                None if the position is not cached
+
+        """
+        start = time.perf_counter()
+        form, piles = canonicalize(board)
+        key = formKey(form)
+        with self.__transaction() as cursor:
+            row = cursor.execute('SELECT solved, script, version FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None or row[2] != SOLVER_VERSION:
+                cursor.execute("UPDATE meta SET value = value + 1 WHERE name = 'misses'")
+                self.misses += 1
+                return None
+            cursor.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+            cursor.execute("UPDATE meta SET value = value + 1 WHERE name = 'hits'")
+        self.hits += 1
+        moves = renumberCommands(row[1].split('\n'), piles, False) if row[1] else []
+        return SolveResult(row[0] == 1, moves, 0, time.perf_counter() - start, True)
+
+    def put(self, board, result):
+        """
+
+        Stores the result of a position, if it settles the position and is no worse than the result cached.
+
+        :param:
+            board (Board): Position
+            result (SolveResult): Result of solve
+
+        :return:
+            stored (bool): If the result was stored
+
+        """
+        if not result.solved and not result.complete:
+            return False
+
+        form, piles = canonicalize(board)
+        key = formKey(form)
+        script = '\n'.join(renumberCommands(result.moves, piles))
+        with self.__transaction() as cursor:
+            row = cursor.execute('SELECT solved, length, version FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[2] == SOLVER_VERSION and row[0] == 1 and \
+                    (not result.solved or row[1] <= len(result.moves)):
+                return False
+            new = row is None
+            cursor.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (key, 1 if result.solved else 0, len(result.moves), script,
+                            SOLVER_VERSION, result.nodes, result.seconds, time.time()))
+            cursor.execute("UPDATE meta SET value = value + 1 WHERE name = 'stores'")
+            if new:
+                cursor.execute("UPDATE meta SET value = value + 1 WHERE name = 'entries'")
+                entries = cursor.execute("SELECT value FROM meta WHERE name = 'entries'").fetchone()[0]
+                if entries > self.__maxEntries:
+                    self.__evict(cursor, entries - int(self.__maxEntries * (1 - EVICT_FRACTION)))
+        self.stores += 1
+        return True
+
+    def trim(self, maxEntries):
+        """
+
+        Evicts the least recently used positions until at most maxEntries are left.
+
+        :param:
+            maxEntries (int): Most positions kept
+
+        :return:
+            evicted (int): Number of positions evicted
+
+        """
+        with self.__transaction() as cursor:
+            entries = cursor.execute("SELECT value FROM meta WHERE name = 'entries'").fetchone()[0]
+            if entries <= maxEntries:
+                return 0
+            return self.__evict(cursor, entries - maxEntries)
+
+    def __evict(self, cursor, count):
+        """
+
+        Evicts the least recently used positions, inside a transaction.
+
+        :param:
+            cursor (sqlite3.Cursor): Cursor of transaction
+            count (int): Number of positions to evict
+
+        :return:
+            evicted (int): Number of positions evicted
+
+        """
+        cursor.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)', (count,))
+        evicted = cursor.rowcount
+        cursor.execute("UPDATE meta SET value = value + ? WHERE name = 'evictions'", (evicted,))
+        cursor.execute("UPDATE meta SET value = value - ? WHERE name = 'entries'", (evicted,))
+        self.evictions += evicted
+        return evicted
+
+    def stats(self):
+        """
+
+        Returns the counters of the cache, for every process and for this cache alone.
+
+        :param:
+            None
+
+        :return:
+            stats (dict): 'total' and 'own' counts of hits, misses, stores and evictions with the hit rate, and the
+                number of positions cached
+
+        """
+        with self.__transaction() as cursor:
+            total = dict(cursor.execute('SELECT name, value FROM meta').fetchall())
+        own = {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+        for counts in (total, own):
+            counts['hitRate'] = counts['hits'] / max(counts['hits'] + counts['misses'], 1)
+        return {'entries': total.pop('entries'), 'total': {name: total[name] for name in own}, 'own': own}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the counters of a solve cache, or trim it.')
+    parser.add_argument('cache', help='database of the cache')
+    parser.add_argument('--max-entries', type=int, help='evict the least recently used positions down to this many')
+    args = parser.parse_args()
+
+    with SolveCache(args.cache) as cache:
+        if args.max_entries is not None:
+            print('%d positions evicted' % cache.trim(args.max_entries))
+        stats = cache.stats()
+    total = stats['total']
+    print('%d positions cached' % stats['entries'])
+    print('%d hits, %d misses, hit rate %.1f%%, %d stores, %d evictions' % (
+        total['hits'], total['misses'], 100 * total['hitRate'], total['stores'], total['evictions']))
+
+
+if __name__ == '__main__':
+    main()
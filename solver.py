@@ -0,0 +1,381 @@
+"""
+Klondike solver.
+
+solve searches the moves of the engine depth first, making and unmaking them on one board. Positions already searched
+are kept in a transposition table keyed on a hash of the position with its tableau piles sorted (see canonical.py), so
+no position is searched twice, nor one that only has its tableau piles in another order. Moves are ordered so that the
+ones most likely to help come first, and a foundation move that can never hurt is played without trying anything else.
+Part of a run is only moved when that frees the card under it for the foundations; moving it anywhere else mostly
+shuffles runs between piles, so a search that finishes without a win makes a deal very likely lost but does not prove
+it. The solver sees every card, face down or not.
+
+The line the search wins with is then shortened (see shortenPath), so a solution does not replay the detours the
+search took on the way.
+
+Solve save files with: python solver.py Game1-start.txt save1.txt
+Keep results across runs with: python solver.py Game1-start.txt --cache results.db
+"""
+import argparse
+import time
+from collections import namedtuple
+
+from board import STOCK, SPADES, PILE_BASE, FACE_UP
+from canonical import canonicalHash, SYMMETRIES
+from deals import dealNumber
+from engine import Engine, moveText, readSave, OP_PILE, OP_SUIT, OP_DISCARD
+from moves import legalMoves
+from rules import SLOT_RANK, FOUNDATION, FOUNDATION_NEXT
+
+# positions is the number of positions in the transposition table when the search stopped
+SolveResult = namedtuple('SolveResult', ['solved', 'moves', 'nodes', 'seconds', 'complete', 'positions'], defaults=(0,))
+
+# Version of the search, kept with cached results (see solvecache.py). Raise it when the solutions found change.
+SOLVER_VERSION = 4
+
+# Priority of each kind of move, lowest first
+_FOUNDATION = 0
+_FLIP = 1
+_EMPTY = 2
+_STOCK = 3
+_DISCARD = 4
+_PARTIAL = 5
+_RESET = 6
+
+
+def solve(board, nodeLimit=2000000, timeLimit=None, cache=None, symmetry='tableau'):
+    """
+
+    Finds a sequence of moves that puts every card on the foundations.
+
+    :param:
+        board (Board): Position to solve. It is not changed.
+        nodeLimit (int): Most moves to try before giving up
+        timeLimit (float): Most seconds to search before giving up, None for no limit
+        cache (SolveCache): Cache of results looked in first and stored to, None for no cache
+        symmetry (str): Positions the transposition table treats as one (see canonical.SYMMETRIES)
+
+    :return:
+        result (SolveResult): If a solution was found, its commands ('move 6 4', 'discard', ...), the number of moves
+            tried, the seconds taken, if the search finished (a deal is only called lost when it did), and the positions
+            kept in the transposition table
+
+    """
+    if cache is not None:
+        result = cache.get(board)
+        if result is None:
+            result = solve(board, nodeLimit, timeLimit, symmetry=symmetry)
+            cache.put(board, result)
+        return result
+
+    start = time.perf_counter()
+    engine = Engine(board.copy())
+    if engine.isWon():
+        return SolveResult(True, [], 0, 0.0, True)
+
+    seen = {canonicalHash(engine.board, symmetry)}
+    path = []
+    stack = [orderedMoves(engine.board)]
+    nodes = 0
+
+    while stack:
+        moves = stack[-1]
+        if not moves:
+            # Every move from here was tried, so go back one move
+            stack.pop()
+            if path:
+                engine.unmake()
+                path.pop()
+            continue
+
+        move = moves.pop()
+        engine.applyMove(move)
+        nodes += 1
+
+        key = canonicalHash(engine.board, symmetry)
+        if key in seen:
+            engine.unmake()
+            continue
+        seen.add(key)
+        path.append(move)
+
+        if engine.isWon():
+            moves = [moveText(move) for move in shortenPath(board, path)]
+            return SolveResult(True, moves, nodes, time.perf_counter() - start, True, len(seen))
+
+        if nodes >= nodeLimit or (timeLimit is not None and nodes & 1023 == 0 and
+                                  time.perf_counter() - start >= timeLimit):
+            return SolveResult(False, [], nodes, time.perf_counter() - start, False, len(seen))
+
+        stack.append(orderedMoves(engine.board))
+
+    return SolveResult(False, [], nodes, time.perf_counter() - start, True, len(seen))
+
+
+def shortenPath(board, path):
+    """
+
+    Shortens a line of moves. Where one move goes straight from a position of the line to a later one, the moves in
+    between are left out, and the fewest moves that reach the end this way are kept. Moves that shuffle runs between
+    piles and come back to where the line goes anyway are cut out like this.
+
+    :param:
+        board (Board): Position the line starts at. It is not changed.
+        path (list): Moves of the line as (op, fromPile, toPile) tuples
+
+    :return:
+        path (list): Moves of the shortened line, reaching the same position
+    """
+    engine = Engine(board.copy())
+    index = {bytes(engine.board.cells()): 0}
+    for i, move in enumerate(path):
+        engine.applyMove(move)
+        index[bytes(engine.board.cells())] = i + 1
+
+    # Fewest moves to each position of the line, and the position and move it is reached from. The moves of the line
+    # are among the legal moves tried, and only skips forward are kept, so the fewest moves to a position are known
+    # before any move from it is tried.
+    steps = [0] + [len(path) + 1] * len(path)
+    previous = [None] * (len(path) + 1)
+    engine = Engine(board.copy())
+    for i, move in enumerate(path):
+        for shortcut in legalMoves(engine.board):
+            engine.applyMove(shortcut)
+            j = index.get(bytes(engine.board.cells()))
+            engine.unmake()
+            if j is not None and j > i and steps[i] + 1 < steps[j]:
+                steps[j] = steps[i] + 1
+                previous[j] = (i, shortcut)
+        engine.applyMove(move)
+
+    shortened = []
+    j = len(path)
+    while j:
+        j, move = previous[j]
+        shortened.append(move)
+    shortened.reverse()
+    return shortened
+
+
+def orderedMoves(board):
+    """
+
+    Returns the legal moves of a board worth trying, in reverse order of priority so the best move can be popped off
+    the end. If a safe foundation move exists it is the only move returned. Moving a pile that starts with a king onto
+    an empty pile is left out, since it only gives the same position with the piles swapped.
+
+    :param:
+        board (Board): Board to find moves on
+
+    :return:
+        moves (list): Moves as (op, fromPile, toPile) tuples
+
+    """
+    cells = board.cells()
+
+    # Lowest rank on the foundations. A card one rank above it can not be needed to hold any other card.
+    lowest = 13
+    for suitPile in range(SPADES, SPADES + 4):
+        size = cells[suitPile]
+        rank = 0
+        if size:
+            rank = SLOT_RANK[cells[PILE_BASE[suitPile] + size - 1]]
+        if rank < lowest:
+            lowest = rank
+
+    keyed = []
+    for move in legalMoves(board):
+        op, fromPile, toPile = move
+        if op == OP_SUIT:
+            slot = cells[PILE_BASE[fromPile] + cells[fromPile] - 1]
+            rank = SLOT_RANK[slot]
+            if rank <= 2 or rank <= lowest + 1:
+                return [move]
+            keyed.append((_FOUNDATION, move))
+        elif op == OP_PILE:
+            if fromPile == STOCK:
+                keyed.append((_STOCK, move))
+                continue
+            priority = _pileMovePriority(cells, fromPile, toPile)
+            if priority is not None:
+                keyed.append((priority, move))
+        elif op == OP_DISCARD:
+            keyed.append((_DISCARD, move))
+        else:
+            keyed.append((_RESET, move))
+
+    keyed.sort(key=_priority, reverse=True)
+    return [move for priority, move in keyed]
+
+
+def hintMove(board):
+    """
+
+    Returns the move the solver would try first on a board, for the hint command. Nothing is searched, so it only
+    looks one move ahead.
+
+    :param:
+        board (Board): Board to find a move on
+
+    :return:
+        move (tuple): Move as (op, fromPile, toPile), None if there is no move worth trying
+
+    """
+    moves = orderedMoves(board)
+    if not moves:
+        return None
+    return moves[-1]
+
+
+def _priority(keyedMove):
+    return keyedMove[0]
+
+
+def _pileMovePriority(cells, fromPile, toPile):
+    """
+
+    Returns the priority of a move between tableau piles, or None if the move is not worth trying.
+
+    :param:
+        cells (bytearray): Buffer of board
+        fromPile (int): Index of pile to move cards from
+        toPile (int): Index of pile to move cards to
+
+    :return:
+        priority (int): Priority of move
+    """
+    base = PILE_BASE[fromPile]
+    top = base + cells[fromPile] - 1
+    topRank = SLOT_RANK[cells[top]]
+
+    # Find the card the moved run starts at
+    toSize = cells[toPile]
+    if toSize:
+        toRank = SLOT_RANK[cells[PILE_BASE[toPile] + toSize - 1]]
+        start = top - (toRank - 1 - topRank)
+    else:
+        start = top - (13 - topRank)
+
+    if start == base:
+        if toSize == 0:
+            return None
+        return _EMPTY
+    below = cells[start - 1]
+    if not below & FACE_UP:
+        return _FLIP
+
+    # Part of a run is only worth moving if the card left on top can go to its foundation next
+    suitPile = FOUNDATION[below]
+    suitSize = cells[suitPile]
+    needs = FOUNDATION_NEXT[cells[PILE_BASE[suitPile] + suitSize - 1]] if suitSize else 1
+    if SLOT_RANK[below] != needs:
+        return None
+    return _PARTIAL
+
+
+def solveFile(fileName, nodeLimit=2000000, timeLimit=None, cache=None, symmetry='tableau'):
+    """
+
+    Solves the position in a save file.
+
+    :param:
+        fileName (str): Name of save file
+        nodeLimit (int): Most moves to try before giving up
+        timeLimit (float): Most seconds to search before giving up, None for no limit
+        cache (SolveCache): Cache of results looked in first and stored to, None for no cache
+        symmetry (str): Positions the transposition table treats as one (see canonical.SYMMETRIES)
+
+    :return:
+        result (SolveResult): Result of search
+
+    """
+    engine = Engine()
+    for pile, slots in readSave(fileName):
+        engine.board.pushMany(pile, slots)
+    return solve(engine.board, nodeLimit, timeLimit, cache, symmetry)
+
+
+def timeHistogram(seconds):
+    """
+
+    Returns a text histogram of solve times, in buckets that grow by a factor of ten.
+
+    :param:
+        seconds (list): Solve times in seconds
+
+    :return:
+        histogram (str): One line per bucket
+    """
+    limits = [0.001, 0.01, 0.1, 1.0, 10.0, float('inf')]
+    labels = ['< 1 ms', '< 10 ms', '< 100 ms', '< 1 s', '< 10 s', '>= 10 s']
+    counts = [0] * len(limits)
+    for value in seconds:
+        for i in range(len(limits)):
+            if value < limits[i]:
+                counts[i] += 1
+                break
+
+    most = max(counts + [1])
+    lines = []
+    for i in range(len(limits)):
+        lines.append('%9s %6d %s' % (labels[i], counts[i], '#' * (40 * counts[i] // most)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve Klondike positions.')
+    parser.add_argument('files', nargs='*', help='save files, such as Game1-start.txt')
+    parser.add_argument('--deals', help='range of numbered deals to solve as well, as FIRST:LAST')
+    parser.add_argument('--nodes', type=int, default=2000000, help='most moves to try per position')
+    parser.add_argument('--time', type=float, default=None, help='most seconds to search per position')
+    parser.add_argument('--script', action='store_true', help='print the winning commands of each position')
+    parser.add_argument('--cache', metavar='FILE', help='SQLite cache of results to look in first and store to')
+    parser.add_argument('--symmetry', choices=SYMMETRIES, default='tableau',
+                        help='positions the transposition table treats as one (see canonical.py)')
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache:
+        from solvecache import SolveCache
+
+        cache = SolveCache(args.cache)
+
+    positions = [(fileName, None) for fileName in args.files]
+    if args.deals:
+        first, last = args.deals.split(':')
+        for number in range(int(first), int(last)):
+            positions.append(('deal %d' % number, dealNumber(number)))
+
+    times = []
+    nodes = 0
+    won = 0
+    for name, board in positions:
+        if board is None:
+            result = solveFile(name, args.nodes, args.time, cache, args.symmetry)
+        else:
+            result = solve(board, args.nodes, args.time, cache, args.symmetry)
+
+        times.append(result.seconds)
+        nodes += result.nodes
+        if result.solved:
+            won += 1
+            status = 'won in %d moves' % len(result.moves)
+        elif result.complete:
+            status = 'lost'
+        else:
+            status = 'gave up'
+        print('%s: %s, %d nodes, %.3f s' % (name, status, result.nodes, result.seconds))
+        if args.script and result.solved:
+            print('\n'.join(result.moves))
+
+    if positions:
+        total = sum(times)
+        print('\n%d of %d won, %.0f nodes/sec' % (won, len(positions), nodes / max(total, 1e-9)))
+        print(timeHistogram(times))
+    if cache is not None:
+        own = cache.stats()['own']
+        print('cache: %d hits, %d misses, hit rate %.1f%%' % (own['hits'], own['misses'], 100 * own['hitRate']))
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Tests of the engine and of the board, save files, canonical forms and solver it runs on.
+
+Run with: python -m unittest test_engine
+"""
+import os
+import random
+import tempfile
+import unittest
+
+from board import Board, STOCK, SPADES, TABLEAU, PILE1, NUM_PILES, PILE_BASE, FACE_UP, CODE_MASK
+from canonical import canonicalize, canonicalForm, renumberCommands
+from deals import dealNumber
+from engine import Engine, OP_PILE, PILE_FULL, FILE_NOT_WRITTEN, NO_SUCH_DEAL, INVALID_MOVE, STOCK_NOT_EMPTY, \
+    PILE_COMMANDS
+from moves import legalMoves
+from script import compileScript, runCompiled
+from solver import solve, shortenPath
+
+
+def playRandom(number, moves, seed):
+    """
+
+    Returns an engine that dealt a numbered deal and played random legal moves on it.
+
+    :param:
+        number (int): Number of deal
+        moves (int): Most moves to play
+        seed (int): Seed of the moves chosen
+
+    :return:
+        engine (Engine): Engine after the moves
+    """
+    generator = random.Random(seed)
+    engine = Engine(dealNumber(number))
+    for i in range(moves):
+        legal = legalMoves(engine.board)
+        if not legal:
+            break
+        engine.applyMove(generator.choice(legal))
+    return engine
+
+
+def transformed(board, piles, order):
+    """
+
+    Returns a board with its tableau piles reordered and its suits renamed.
+
+    :param:
+        board (Board): Board to transform
+        piles (list): Pile of board that becomes PILE1 + i, for each i
+        order (tuple): Suits in their new order. A card of suit order[i] becomes the card of suit i of the same rank.
+
+    :return:
+        board (Board): Transformed board
+    """
+    cells = board.cells()
+    new = Board()
+    for pile in range(NUM_PILES):
+        if pile >= PILE1:
+            source = piles[pile - PILE1]
+        elif SPADES <= pile < SPADES + 4:
+            source = SPADES + order[pile - SPADES]
+        else:
+            source = pile
+        slots = cells[PILE_BASE[source]:PILE_BASE[source] + cells[source]]
+        codes = [slot & CODE_MASK for slot in slots]
+        new.pushMany(pile, bytes(slot & FACE_UP | order.index(code // 13) * 13 + code % 13
+                                 for slot, code in zip(slots, codes)))
+    return new
+
+
+class UndoTest(unittest.TestCase):
+    def testUndoRedo(self):
+        engine = Engine(dealNumber(7))
+        generator = random.Random(7)
+        positions = [(bytes(engine.board.cells()), engine.board.zobrist())]
+        for i in range(300):
+            engine.applyMove(generator.choice(legalMoves(engine.board)))
+            positions.append((bytes(engine.board.cells()), engine.board.zobrist()))
+            self.assertTrue(engine.board.isHashValid())
+
+        for position in reversed(positions[:-1]):
+            self.assertTrue(engine.apply('undo').success)
+            self.assertEqual((bytes(engine.board.cells()), engine.board.zobrist()), position)
+        self.assertFalse(engine.apply('undo').success)
+
+        for position in positions[1:]:
+            self.assertTrue(engine.apply('redo').success)
+            self.assertEqual((bytes(engine.board.cells()), engine.board.zobrist()), position)
+        self.assertFalse(engine.apply('redo').success)
+
+    def testZobristOfPosition(self):
+        # The hash depends on the position only, not on the moves that reached it
+        for seed in range(5):
+            board = playRandom(seed, 200, seed).board
+            self.assertEqual(board.zobrist(), Board(board.cells()).zobrist())
+        self.assertNotEqual(dealNumber(1).zobrist(), dealNumber(2).zobrist())
+
+    def testUndoReset(self):
+        engine = Engine()
+        self.assertTrue(engine.apply('deal 5').success)
+        while engine.board.pileSize(STOCK):
+            self.assertTrue(engine.apply('discard').success)
+        before = bytes(engine.board.cells())
+        zobrist = engine.board.zobrist()
+
+        self.assertTrue(engine.apply('reset').success)
+        self.assertTrue(engine.apply('undo').success)
+        self.assertEqual(bytes(engine.board.cells()), before)
+        self.assertEqual(engine.board.zobrist(), zobrist)
+
+
+# Deal 56 after a few moves. Two discards of two cards left the Ks and the 8s visible under it in the stock.
+VISIBLE_STOCK = """Stock [ Ks+ 8s+ 6h- 3s- 9d- Js- 4s- 6c- Ah- Ts- Jh- 2s- 2c- Kc- 8h- 5h- Ac- 2h- Kh- 7c- 4c- 4d- 3d- ]
+Discard [ ]
+Spades [ ]
+Hearts [ ]
+Diamonds [ 2d+ Ad+ ]
+Clubs [ ]
+PILE-1 [ ]
+PILE-2 [ 5s+ 6s+ 7h+ ]
+PILE-3 [ Td+ Jd+ Qc+ Qd- 8d- ]
+PILE-4 [ Qh+ As- Kd- 8c- ]
+PILE-5 [ 9h+ Th+ Qs- ]
+PILE-6 [ 7d+ Jc- 5c- 6d- 3c- ]
+PILE-7 [ 9c+ 5d- 3h- 9s- 7s- 4h- Tc- ]
+"""
+
+
+class MoveTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.fileName = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as file:
+            file.write(VISIBLE_STOCK)
+
+    def tearDown(self):
+        os.remove(self.fileName)
+
+    def loaded(self):
+        engine = Engine()
+        self.assertTrue(engine.apply('load ' + self.fileName).success)
+        return engine
+
+    def testOnlyRunsMove(self):
+        # The 8s goes on the 9h, but the Ks on top of it does not, so nothing may move
+        engine = self.loaded()
+        before = bytes(engine.board.cells())
+        result = engine.apply('move stock 5')
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, INVALID_MOVE)
+        self.assertEqual(bytes(engine.board.cells()), before)
+
+        # The Ks alone can go on the empty pile
+        stock = engine.board.pileSlots(STOCK)
+        self.assertTrue(engine.apply('move stock 1').success)
+        self.assertEqual(engine.board.pileSlots(PILE1), stock[-1:])
+
+    def testLegalMovesMatchEngine(self):
+        engine = self.loaded()
+        listed = {(fromPile, toPile) for op, fromPile, toPile in legalMoves(engine.board) if op == OP_PILE}
+        accepted = set()
+        for fromPile in (STOCK,) + TABLEAU:
+            for toPile in TABLEAU:
+                command = 'move %s %s' % (PILE_COMMANDS[fromPile], PILE_COMMANDS[toPile])
+                if self.loaded().apply(command).success:
+                    accepted.add((fromPile, toPile))
+        self.assertEqual(listed, accepted)
+
+    def testFailedResetChangesNothing(self):
+        engine = self.loaded()
+        before = bytes(engine.board.cells())
+        result = engine.apply('reset')
+        self.assertEqual(result.error, STOCK_NOT_EMPTY)
+        self.assertEqual(bytes(engine.board.cells()), before)
+        self.assertEqual(engine.historySize(), 0)
+
+
+class FileTest(unittest.TestCase):
+    def testLoadOverfillingPile(self):
+        engine = Engine()
+        self.assertTrue(engine.apply('load Game1-start.txt').success)
+        self.assertTrue(engine.apply('load Game1-start.txt').success)
+        before = bytes(engine.board.cells())
+
+        result = engine.apply('load Game1-start.txt')
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, PILE_FULL)
+        self.assertEqual(bytes(engine.board.cells()), before)
+
+    def testRoundTrip(self):
+        board = playRandom(11, 80, 11).board
+        directory = tempfile.mkdtemp()
+        for fileName in ('game.txt', 'game.klb'):
+            path = os.path.join(directory, fileName)
+            engine = Engine(board.copy())
+            self.assertTrue(engine.apply('save ' + path).success)
+            loaded = Engine()
+            self.assertTrue(loaded.apply('load ' + path).success)
+            self.assertEqual(bytes(loaded.board.cells()), bytes(board.cells()))
+            self.assertEqual(loaded.board.zobrist(), board.zobrist())
+            os.remove(path)
+        os.rmdir(directory)
+
+    def testSaveToMissingDirectory(self):
+        engine = Engine()
+        for fileName in ('/nonexistent/game.txt', '/nonexistent/game.klb'):
+            result = engine.apply('save ' + fileName)
+            self.assertFalse(result.success)
+            self.assertEqual(result.error, FILE_NOT_WRITTEN)
+
+
+class CanonicalTest(unittest.TestCase):
+    def testSymmetricPositions(self):
+        generator = random.Random(3)
+        for seed in range(10):
+            board = playRandom(seed, 60, seed).board
+            form = canonicalForm(board)
+            sortedForm = canonicalForm(board, False)
+            for i in range(5):
+                piles = list(TABLEAU)
+                generator.shuffle(piles)
+                order = tuple(generator.sample(range(4), 4))
+                self.assertEqual(canonicalForm(transformed(board, piles, order)), form)
+                self.assertEqual(canonicalForm(transformed(board, piles, (0, 1, 2, 3)), False), sortedForm)
+
+    def testDifferentPositions(self):
+        boards = [playRandom(seed, 40, seed).board for seed in range(20)]
+        self.assertEqual(len({canonicalForm(board) for board in boards}), len(boards))
+
+    def testRenumberCommands(self):
+        board = dealNumber(4)
+        other = transformed(board, [PILE1 + 6 - i for i in range(7)], (2, 0, 3, 1))
+        form, piles = canonicalize(board)
+        otherForm, otherPiles = canonicalize(other)
+        self.assertEqual(form, otherForm)
+
+        commands = ['move 1 2', 'move 7 suit', 'move stock 3', 'discard']
+        canonical = renumberCommands(commands, piles)
+        self.assertEqual(renumberCommands(canonical, piles, False), commands)
+        self.assertEqual(renumberCommands(canonical, otherPiles, False), ['move 7 6', 'move 1 suit', 'move stock 5',
+                                                                          'discard'])
+
+
+class SolverTest(unittest.TestCase):
+    def testSolvesDeal(self):
+        board = dealNumber(14)
+        result = solve(board, 200000)
+        self.assertTrue(result.solved)
+        self.assertLess(len(result.moves), 200)
+
+        engine = Engine(board.copy())
+        for command in result.moves:
+            self.assertTrue(engine.apply(command).success, command)
+        self.assertTrue(engine.isWon())
+        self.assertEqual(bytes(board.cells()), bytes(dealNumber(14).cells()))
+
+    def testShortenPath(self):
+        # Play until some pile move can be undone by the opposite move, and put that detour in the line
+        engine = Engine(dealNumber(0))
+        generator = random.Random(0)
+        line = []
+        detour = None
+        while detour is None:
+            before = bytes(engine.board.cells())
+            for move in legalMoves(engine.board):
+                if move[0] == OP_PILE and move[1] != STOCK and engine.applyMove(move).success:
+                    back = (OP_PILE, move[2], move[1])
+                    if back in legalMoves(engine.board) and engine.applyMove(back).success:
+                        if bytes(engine.board.cells()) == before:
+                            detour = [move, back]
+                        engine.unmake()
+                    engine.unmake()
+                if detour is not None:
+                    break
+            else:
+                move = generator.choice(legalMoves(engine.board))
+                engine.applyMove(move)
+                line.append(move)
+        line += detour
+        for i in range(20):
+            move = generator.choice(legalMoves(engine.board))
+            engine.applyMove(move)
+            line.append(move)
+
+        shortened = shortenPath(dealNumber(0), line)
+        self.assertLessEqual(len(shortened), len(line) - 2)
+        replay = Engine(dealNumber(0))
+        for move in shortened:
+            self.assertTrue(replay.applyMove(move).success)
+        self.assertEqual(bytes(replay.board.cells()), bytes(engine.board.cells()))
+
+
+class DealTest(unittest.TestCase):
+    def testDealNumberNotDecimal(self):
+        result = Engine().apply('deal \u00b2')
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, NO_SUCH_DEAL)
+
+        engine = Engine()
+        runCompiled(compileScript(['deal \u00b2']), engine=engine)
+        self.assertEqual(bytes(engine.board.cells()), bytes(Engine().board.cells()))
+
+
+if __name__ == '__main__':
+    unittest.main()